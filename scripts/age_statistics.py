@@ -1,68 +1,74 @@
-import numpy as np
+import functools
 import os
 
+import numpy as np
+
+from scripts.agent_state import GENDER_CODES, GENDER_LABELS
+
+AGE_DISTRIBUTION_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'data',
+                                     'poland_population_age_distribution.txt')
+
+# Lower bounds of age bands and death rate ratio of every band (see `death_rate_ratio`)
+DEATH_RATE_AGE_BANDS = np.array([0, 5, 18, 30, 40, 50, 65, 75, 85])
+DEATH_RATE_RATIOS = np.array([1, 1, 10, 45, 130, 440, 1300, 3200, 8700]) / 13827
+
+
+@functools.lru_cache(maxsize=None)
+def load_age_distribution(path: str = AGE_DISTRIBUTION_PATH):
+    """
+    Load age distribution table once per process
+
+    Data collected from: https://stat.gov.pl/obszary-tematyczne/ludnosc/ludnosc/ludnosc-piramida/
+
+    :param path: tab separated file with columns: age, total, males, females
+    :return: tuple (ages, probabilities) where probabilities[GENDER_CODES[gender]] is the age distribution of gender
+    """
+    table = np.loadtxt(path, delimiter='\t', skiprows=1, dtype=np.int64, ndmin=2)
+    ages = table[:, 0]
+    probabilities = np.empty((len(GENDER_LABELS), len(ages)))
+    probabilities[GENDER_CODES['F']] = table[:, 3] / table[:, 3].sum()
+    probabilities[GENDER_CODES['M']] = table[:, 2] / table[:, 2].sum()
+    return ages, probabilities
+
 
-def generate_from_age_gender_distribution(samples: int, gender: str):
+def generate_from_age_gender_distribution(samples: int, gender: str, random_state=np.random):
     """
     Data collected from: https://stat.gov.pl/obszary-tematyczne/ludnosc/ludnosc/ludnosc-piramida/
 
     :param gender: Female or Male ('F' or 'M')
     :param samples: Number of agents
+    :param random_state: `np.random` or `np.random.Generator`
+    """
+    ages, probabilities = load_age_distribution()
+    return random_state.choice(ages, size=samples, p=probabilities[GENDER_CODES[gender]])
+
+
+def generate_ages_and_genders(samples: int, random_state=np.random):
+    """
+    Draw gender with 50% probability and age from the age distribution of that gender for all agents at once
+
+    :param samples: Number of agents
+    :param random_state: `np.random` or `np.random.Generator`
+    :return: tuple (ages, gender codes from `GENDER_CODES`)
     """
+    ages, probabilities = load_age_distribution()
+    genders = (random_state.random(samples) >= 0.5).astype(np.uint8)
+    # cumulative distributions of all genders one after another, i.e. in [gender, gender + 1], every distribution
+    # ends exactly at 1 so draws of one gender never fall into the distribution of another gender
+    cumulative = np.cumsum(probabilities, axis=1)
+    cumulative = (cumulative / cumulative[:, -1:] + np.arange(len(GENDER_LABELS))[:, None]).ravel()
+    indices = np.searchsorted(cumulative, random_state.random(samples) + genders, side='right')
+    # `u + gender` can be rounded up to the end of the distribution for `u` close to 1
+    indices = np.clip(indices - genders * len(ages), 0, len(ages) - 1)
+    return ages[indices], genders
+
 
-    pathA = '../../data/poland_population_age_distribution.txt'
-    pathB = '../data/poland_population_age_distribution.txt'
-    if os.path.exists(pathA):
-        return _generate_from_age_gender_distribution(pathA, samples, gender)
-    elif os.path.exists(pathB):
-        return _generate_from_age_gender_distribution(pathB, samples, gender)
-    else:
-        print('Cannot find age distribution file!')
-
-
-def _generate_from_age_gender_distribution(path: str, samples: int, gender: str):
-    total_population = 0
-    probability = []
-    ages = []
-    with open(path) as f:
-        f.readline()  # omit header
-        for line in f:
-            age, total, males, females = [int(x) for x in line.strip().split('\t')]
-            if gender == 'F':
-                probability.append(females)
-                total_population += females
-            elif gender == 'M':
-                probability.append(males)
-                total_population += males
-            ages.append(age)
-
-    return np.random.choice(ages, size=samples, p=np.array(probability) / total_population)
-
-
-def death_rate_ratio(age: int):
+def death_rate_ratio(age):
     """
     Take into account age when calculating death probability. The 18-29 years old are the comparison group
 
     Based on `https://www.cdc.gov/coronavirus/2019-ncov/covid-data/investigations-discovery/hospitalization-death-by-age.html`
 
-    :param age: age of the agent
+    :param age: age of the agent or array of ages
     """
-    total = 13827
-    if 0 <= age < 5:
-        return 1 / total
-    elif 5 <= age < 18:
-        return 1 / total
-    elif 18 <= age < 30:
-        return 10 / total
-    elif 30 <= age < 40:
-        return 45 / total
-    elif 40 <= age < 50:
-        return 130 / total
-    elif 50 <= age < 65:
-        return 440 / total
-    elif 65 <= age < 75:
-        return 1300 / total
-    elif 75 <= age < 85:
-        return 3200 / total
-    elif age >= 85:
-        return 8700 / total
+    return DEATH_RATE_RATIOS[np.searchsorted(DEATH_RATE_AGE_BANDS, age, side='right') - 1]
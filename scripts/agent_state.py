@@ -0,0 +1,286 @@
+import itertools
+from typing import Union
+
+import networkx as nx
+import numpy as np
+
+SUSCEPTIBLE = 0
+INFECTED = 1
+QUARANTINED = 2
+RECOVERED = 3
+DEAD = 4
+
+STATUS_LABELS = ('S', 'I', 'Q', 'R', 'D')
+STATUS_CODES = {label: code for code, label in enumerate(STATUS_LABELS)}
+
+GENDER_LABELS = ('F', 'M')
+GENDER_CODES = {label: code for code, label in enumerate(GENDER_LABELS)}
+
+
+class CSRAdjacency:
+    """Compressed sparse row adjacency of a single layer
+
+    Neighbours of `node` are `indices[indptr[node]:indptr[node + 1]]` in the same order as in the source
+    `nx.Graph` (insertion order). The topology itself is read-only, so it can be shared by many states. Agents
+    in quarantine are switched off in the `active_agents` mask, which switches off all their links (in both
+    directions) without touching the topology.
+    """
+
+    def __init__(self, indptr: np.ndarray, indices: np.ndarray, active_agents: np.ndarray = None):
+        self.indptr = indptr
+        self.indices = indices
+        self.active_agents = active_agents if active_agents is not None else np.ones(len(indptr) - 1, dtype=bool)
+
+    @property
+    def n_nodes(self):
+        return len(self.indptr) - 1
+
+    @staticmethod
+    def from_graph(g: nx.Graph):
+        """
+        Build adjacency from `g`. Nodes have to be labelled 0, 1, ..., N - 1
+
+        :param g: nx.Graph
+        :return: CSRAdjacency
+        """
+        n = g.number_of_nodes()
+        degrees = np.fromiter((len(g.adj[node]) for node in range(n)), dtype=np.int64, count=n)
+        indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(degrees, out=indptr[1:])
+        indices = np.fromiter(itertools.chain.from_iterable(g.adj[node] for node in range(n)),
+                              dtype=np.int64, count=indptr[-1])
+        return CSRAdjacency(indptr, indices)
+
+    def with_edges(self, edges: np.ndarray):
+        """
+        Adjacency with additional `edges`, which are placed after existing neighbours in the order they are given
+        (the same as `nx.Graph.add_edges_from`). The topology arrays are shared when there is nothing to add.
+
+        :param edges: array of new edges with shape (E, 2)
+        :return: CSRAdjacency
+        """
+        if len(edges) == 0:
+            return CSRAdjacency(self.indptr, self.indices)
+        new_rows = edges.ravel()
+        new_indices = edges[:, ::-1].ravel()
+        rows = np.concatenate((np.repeat(np.arange(self.n_nodes), np.diff(self.indptr)), new_rows))
+        order = np.argsort(rows, kind='stable')
+        indptr = np.zeros(self.n_nodes + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=self.n_nodes), out=indptr[1:])
+        indices = np.concatenate((self.indices, new_indices))[order]
+        return CSRAdjacency(indptr, indices)
+
+    def neighbors(self, node) -> np.ndarray:
+        if not self.active_agents[node]:
+            return self.indices[:0]
+        neighbours = self.indices[self.indptr[node]:self.indptr[node + 1]]
+        return neighbours[self.active_agents[neighbours]]
+
+    def degree(self, node) -> int:
+        if not self.active_agents[node]:
+            return 0
+        neighbours = self.indices[self.indptr[node]:self.indptr[node + 1]]
+        return int(np.count_nonzero(self.active_agents[neighbours]))
+
+    def isolate(self, node):
+        """
+        Switch off all links of `node` (in both directions)
+
+        :param node: index of the agent
+        """
+        self.active_agents[node] = False
+
+    def row_indices(self) -> np.ndarray:
+        """
+        :return: agent of every link in the order of `indices`
+        """
+        return np.repeat(np.arange(self.n_nodes), np.diff(self.indptr))
+
+    def active_links(self, rows: np.ndarray = None) -> np.ndarray:
+        """
+        Mask of links between two active agents in the order of `indices`
+
+        :param rows: output of `row_indices` (computed when not given)
+        :return: boolean array
+        """
+        if rows is None:
+            rows = self.row_indices()
+        return self.active_agents[rows] & self.active_agents[self.indices]
+
+    def n_active_links(self) -> int:
+        """
+        :return: number of undirected links between two active agents
+        """
+        return int(np.count_nonzero(self.active_links())) // 2
+
+    def edges(self):
+        """
+        Iterate over active links, every undirected link is returned once
+
+        :return: generator of (u, v) tuples
+        """
+        for node in range(self.n_nodes):
+            for neighbour in self.neighbors(node):
+                if node <= neighbour:
+                    yield node, int(neighbour)
+
+
+class CompartmentCounters:
+    """Number of agents in every l1 status and the sum of l2 opinions
+
+    Counters are updated in place by the transitions in `scripts.epidemic_layer` and `scripts.virtual_layer`,
+    so the built-in metrics can be read in O(1) instead of scanning all agents.
+    """
+
+    def __init__(self, status: np.ndarray, opinion: np.ndarray):
+        self.n_agents = len(status)
+        self.counts = np.bincount(status, minlength=len(STATUS_LABELS)).tolist()
+        self.opinion_sum = int(np.sum(opinion))
+
+    def transition(self, old_status, new_status):
+        self.counts[old_status] -= 1
+        self.counts[new_status] += 1
+
+    def change_opinion(self, old_opinion, new_opinion):
+        self.opinion_sum += int(new_opinion) - int(old_opinion)
+
+    def ratio(self, status):
+        return self.counts[status] / self.n_agents
+
+    def mean_opinion(self):
+        return self.opinion_sum / self.n_agents
+
+    def epidemic_ended(self):
+        """No infected and quarantined agents are left, so statuses cannot change anymore"""
+        return self.counts[INFECTED] + self.counts[QUARANTINED] == 0
+
+
+class AgentState:
+    """Array-backed state of all agents and adjacency of both layers
+
+    Attributes of agent `i` are stored at index `i` of:
+
+    status: l1 status code (`SUSCEPTIBLE`, `INFECTED`, `QUARANTINED`, `RECOVERED`, `DEAD`)
+
+    age, gender (code from `GENDER_CODES`), comorbid_A, comorbid_B, infected_time
+
+    opinion: l2 opinion (+1 or -1), zeros when there is no virtual layer
+
+    l1, l2: CSRAdjacency of physical and virtual layer (l2 is None for the single layer model)
+
+    counters: CompartmentCounters, call `recount` after writing to `status` or `opinion` directly
+    """
+
+    def __init__(self, l1: CSRAdjacency, l2: CSRAdjacency = None):
+        n = l1.n_nodes
+        self.n_agents = n
+        self.l1 = l1
+        self.l2 = l2
+        self.status = np.full(n, SUSCEPTIBLE, dtype=np.uint8)
+        self.age = np.zeros(n, dtype=np.int16)
+        self.gender = np.zeros(n, dtype=np.uint8)
+        self.comorbid_A = np.zeros(n, dtype=bool)
+        self.comorbid_B = np.zeros(n, dtype=bool)
+        self.infected_time = np.zeros(n, dtype=np.float64)
+        self.opinion = np.zeros(n, dtype=np.int8)
+        self.counters = CompartmentCounters(self.status, self.opinion)
+
+    def recount(self):
+        self.counters = CompartmentCounters(self.status, self.opinion)
+
+
+Layer = Union[nx.Graph, AgentState]
+
+
+def from_graphs(l1_layer: nx.Graph, l2_layer: nx.Graph = None) -> AgentState:
+    """
+    Convert initialized layers (see `initialize_epidemic` and `initialize_virtual`) into `AgentState`
+
+    :param l1_layer: physical layer
+    :param l2_layer: virtual layer (optional)
+    :return: AgentState
+    """
+    l2 = CSRAdjacency.from_graph(l2_layer) if l2_layer is not None else None
+    state = AgentState(CSRAdjacency.from_graph(l1_layer), l2)
+    for node in range(state.n_agents):
+        attributes = l1_layer.nodes[node]
+        state.status[node] = STATUS_CODES[attributes.get('l1_status', 'S')]
+        state.age[node] = attributes.get('age', 0)
+        state.gender[node] = GENDER_CODES[attributes.get('gender', 'F')]
+        state.comorbid_A[node] = attributes.get('comorbid_A', False)
+        state.comorbid_B[node] = attributes.get('comorbid_B', False)
+        state.infected_time[node] = attributes.get('I_time', 0)
+        if l2_layer is not None:
+            state.opinion[node] = l2_layer.nodes[node].get('l2_opinion', 0)
+    state.recount()
+    return state
+
+
+def to_graphs(state: AgentState):
+    """
+    Convert `AgentState` back into layers with the same node attributes as `initialize_epidemic` and
+    `initialize_virtual` produce. Removed links are not included.
+
+    :param state: AgentState
+    :return: tuple (l1_layer, l2_layer), l2_layer is None for the single layer model
+    """
+    l1_layer = nx.Graph()
+    for node in range(state.n_agents):
+        l1_layer.add_node(node,
+                          l1_status=STATUS_LABELS[state.status[node]],
+                          age=int(state.age[node]),
+                          gender=GENDER_LABELS[state.gender[node]],
+                          comorbid_A=bool(state.comorbid_A[node]),
+                          comorbid_B=bool(state.comorbid_B[node]),
+                          I_time=float(state.infected_time[node]))
+    l1_layer.add_edges_from(state.l1.edges())
+    if state.l2 is None:
+        return l1_layer, None
+
+    l2_layer = nx.Graph()
+    for node in range(state.n_agents):
+        l2_layer.add_node(node, l2_opinion=int(state.opinion[node]))
+    l2_layer.add_edges_from(state.l2.edges())
+    return l1_layer, l2_layer
+
+
+def state_aware(metrics_function):
+    """
+    Mark a metric function which computes its value from `AgentState`, e.g. the built-in metrics in
+    `scripts.epidemic_metrics` and `scripts.virtual_metrics`. Other metric functions are called with layers built by
+    `to_graphs` (see `state_metrics`).
+
+    :param metrics_function: function called with AgentState
+    :return: `metrics_function`
+    """
+    metrics_function.state_aware = True
+    return metrics_function
+
+
+def state_metrics(metrics: dict) -> dict:
+    """
+    Metrics which can all be called with `AgentState`. Functions marked with `state_aware` are kept, other functions
+    are called with the layer of the metric (`nx.Graph` as in the simulation on graphs). Layers are built by
+    `to_graphs` by the first of these functions, so all metrics of one record have to be evaluated in the order of
+    `metrics` (as every backend does).
+
+    :param metrics: the same format as in `run`, e.g. {'infected_ratio': ('l1_layer', infected_ratio), ...}
+    :return: `metrics` if all functions are state aware, otherwise metrics with wrapped graph functions
+    """
+    graph_metrics = [name for name, (_, metrics_function) in metrics.items()
+                     if not getattr(metrics_function, 'state_aware', False)]
+    if not graph_metrics:
+        return metrics
+    layers = {}
+
+    def graph_metric(metrics_name, layer, metrics_function):
+        @state_aware
+        def value(state: AgentState):
+            if metrics_name == graph_metrics[0]:
+                layers.update(zip(('l1_layer', 'l2_layer'), to_graphs(state)))
+            return metrics_function(layers[layer])
+        return value
+
+    return {metrics_name: (layer, metrics_function if metrics_name not in graph_metrics
+                           else graph_metric(metrics_name, layer, metrics_function))
+            for metrics_name, (layer, metrics_function) in metrics.items()}
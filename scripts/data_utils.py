@@ -1,22 +1,53 @@
+import os
+import re
+
 import pandas as pd
 
+# `name=value` pairs in file names of CSV results, values never contain `_`
+PARAMETER_PATTERN = re.compile(r'(?:^|[_-])([A-Za-z][A-Za-z_]*?)=([^_=]+)(?=_|$)')
 
-def get_value(text):
-    return text.split("_")[0]
+# Metrics of CSV results, files are named `<metric>_<experiment>_<parameters>.csv`
+METRICS = ('dead_ratio', 'infected_ratio', 'mean_opinion')
 
 
-def load_results(path: str, params):
-    all_parameters = {}
-    file_name = path.split("/")[-1].split(".csv")[0]
-    file_name = file_name.split("=")[1:]
+def parse_parameters(file_name: str):
+    """
+    :param file_name: file name of CSV results without extension
+    :return: list of parameter values (as strings) in the order they appear in the file name
+    """
+    return [value for _, value in PARAMETER_PATTERN.findall(file_name)]
+
 
-    for i, f in enumerate(file_name):
-        all_parameters[params[i]] = get_value(f)
+def load_results(path: str, params):
+    file_name = os.path.splitext(os.path.basename(path))[0]
+    all_parameters = dict(zip(params, parse_parameters(file_name)))
 
     df = pd.read_csv(path, index_col=0)
     return all_parameters, df
 
 
+def load_results_frame(path: str, params, index_name: str, columns_name: str):
+    """
+    Convert CSV results into the dataset format (see `scripts.dataset`), one row per cell of the CSV table
+
+    :param path: path of CSV results
+    :param params: names of parameters in the file name (see `load_multilayer_results`)
+    :param index_name: name of the parameter in rows of the CSV table
+    :param columns_name: name of the parameter in columns of the CSV table
+    :return: DataFrame with all parameters and the metric as columns
+    """
+    all_parameters, df = load_results(path, params)
+    file_name = os.path.basename(path)
+    metric = next(m for m in METRICS if file_name.startswith(m + '_'))
+    df.index.name = index_name
+    df.columns = pd.to_numeric(df.columns)
+    df = df.rename_axis(columns=columns_name).stack().rename(metric).reset_index()
+    for name, value in all_parameters.items():
+        if name not in df:  # parameters of rows and columns replace values from the file name
+            df[name] = pd.to_numeric(value)
+    return df
+
+
 def load_multilayer_results(path: str):
     params = ['beta', 'gamma', 'mu', 'kappa', 'max_infected_time', 'q', 'p', 'xi', 'n', 'n_times', 'n_steps',
               'n_agents', 'n_fraclinks']
@@ -0,0 +1,78 @@
+import glob
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+
+def realisations_to_frame(realisations: np.ndarray, constants: dict, experiment: str) -> pd.DataFrame:
+    """
+    One row per realisation with all parameters as columns
+
+    :param realisations: structured array with parameters of the points, run, seed and metrics
+                         (see `scripts.realisations.results_to_array`)
+    :param constants: values of all other parameters, e.g. {'beta': 0.1, 'gamma': 0.2, ...}, parameters of the points
+                      take precedence
+    :param experiment: name of the sweep
+    :return: DataFrame with columns: experiment, parameters, run, seed and metrics
+    """
+    df = pd.DataFrame(realisations)
+    constants = {name: value for name, value in constants.items() if name not in df}
+    columns = pd.DataFrame(dict(experiment=experiment, **constants), index=df.index)
+    return pd.concat([columns, df], axis=1)
+
+
+def save_dataset(df: pd.DataFrame, path: str):
+    """
+    Save results as a single Parquet file, files of different sweeps can be kept in one directory tree
+    and loaded at once with `load_dataset`
+
+    :param df: results (see `realisations_to_frame`)
+    :param path: path of `.parquet` file
+    """
+    df.to_parquet(path, index=False)
+
+
+def load_dataset(path: str, filters: list = None, columns: list = None) -> pd.DataFrame:
+    """
+    Load results from a Parquet file or from all Parquet files in a directory tree. Only row groups which can match
+    `filters` are read (based on statistics stored in file metadata). Files of different sweeps may have different
+    columns, missing values are NaN. Other files in the directory tree (e.g. `ResultStore` files of the sweeps)
+    are skipped.
+
+    :param path: path of `.parquet` file or directory
+    :param filters: predicates in the `pandas.read_parquet` format, e.g. [('q', '==', 4), ('p', '<', 0.5)]
+    :param columns: columns to load (all columns when not given)
+    :return: DataFrame with one row per realisation
+    """
+    files = _parquet_files(path)
+    dataset = ds.dataset(files, format='parquet')
+    schema = pa.unify_schemas([fragment.physical_schema for fragment in dataset.get_fragments()])
+    dataset = ds.dataset(files, format='parquet', schema=schema)
+    expression = pq.filters_to_expression(filters) if filters else None
+    return dataset.to_table(columns=columns, filter=expression).to_pandas()
+
+
+def metric_table(df: pd.DataFrame, metric: str, index: str, columns: str, aggfunc='mean') -> pd.DataFrame:
+    """
+    Table of `metric` aggregated over realisations, the same format as in CSV results of the previous sweeps
+
+    :param df: results (see `load_dataset`)
+    :param metric: name of the metric, e.g. 'dead_ratio'
+    :param index: parameter in rows
+    :param columns: parameter in columns
+    :param aggfunc: aggregation of realisations
+    """
+    return df.pivot_table(values=metric, index=index, columns=columns, aggfunc=aggfunc)
+
+
+def _parquet_files(path: str):
+    if not os.path.isdir(path):
+        return path
+    files = sorted(glob.glob(os.path.join(path, '**', '*.parquet'), recursive=True))
+    if not files:
+        raise FileNotFoundError(f'No Parquet files in {path}')
+    return files
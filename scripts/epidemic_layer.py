@@ -1,14 +1,18 @@
 import copy
 
 import networkx as nx
+import numpy as np
 import random
 
-from scripts.age_statistics import generate_from_age_gender_distribution
+from scripts.age_statistics import generate_ages_and_genders
+from scripts.agent_state import AgentState, Layer, STATUS_CODES, STATUS_LABELS, GENDER_CODES, GENDER_LABELS, \
+    SUSCEPTIBLE
 
 
 def initialize_epidemic(g: nx.Graph,
                         comorbid_disease_A_fraction=0,
-                        comorbid_disease_B_fraction=0):
+                        comorbid_disease_B_fraction=0,
+                        inplace=False):
     """
     Initialize `l1` layer with `g.number_of_nodes() * infected_fraction` infected agents and the rest susceptible.
 
@@ -19,23 +23,16 @@ def initialize_epidemic(g: nx.Graph,
     :return g_copy: nx.Graph l1 layer with initialized agents
     :param comorbid_disease_A_fraction: fraction of agents with comorbid disease A
     :param comorbid_disease_B_fraction: fraction of agents with comorbid disease B
+    :param inplace: initialize agents of `g` instead of a copy
     """
     assert g.number_of_nodes() % 2 == 0  # odd number
-    g_copy = copy.deepcopy(g)
+    g_copy = g if inplace else copy.deepcopy(g)
 
-    females_ages = generate_from_age_gender_distribution(g.number_of_nodes(), 'F')
-    males_ages = generate_from_age_gender_distribution(g.number_of_nodes(), 'M')
+    ages, genders = generate_ages_and_genders(g.number_of_nodes())
     i = 0
     for node in g_copy.nodes:
         set_susceptible(g_copy, node)
 
-        if random.random() < 0.5:
-            age = females_ages[i]
-            gender = 'F'
-        else:
-            age = males_ages[i]
-            gender = 'M'
-
         if random.random() < comorbid_disease_A_fraction:
             set_comorbid_disease_A(g_copy, node)
         else:
@@ -46,102 +43,179 @@ def initialize_epidemic(g: nx.Graph,
         else:
             set_no_comorbid_disease_B(g_copy, node)
 
-        set_age(g_copy, node, age)
-        set_gender(g_copy, node, gender)
+        set_age(g_copy, node, int(ages[i]))
+        set_gender(g_copy, node, GENDER_LABELS[genders[i]])
         set_infected_time(g_copy, node, 0)
         i += 1
 
     return g_copy
 
 
-def _set_status(g: nx.Graph, node, status: str):
-    g.nodes[node]['l1_status'] = status
+def initialize_epidemic_state(state: AgentState,
+                              comorbid_disease_A_fraction=0,
+                              comorbid_disease_B_fraction=0,
+                              random_state=np.random,
+                              static_attributes: dict = None):
+    """
+    The same as `initialize_epidemic` but for all agents of `state` at once (in place)
+
+    :param state: AgentState
+    :param comorbid_disease_A_fraction: fraction of agents with comorbid disease A
+    :param comorbid_disease_B_fraction: fraction of agents with comorbid disease B
+    :param random_state: `np.random` or `np.random.Generator`
+    :param static_attributes: arrays 'age', 'gender', 'comorbid_A' and 'comorbid_B' which are used by `state`
+                              without copying (e.g. `SharedTopology.attributes`) instead of drawing new attributes,
+                              fractions are not used then
+    :return: state with initialized agents
+    """
+    n = state.n_agents
+    assert n % 2 == 0  # odd number
+
+    state.status[:] = SUSCEPTIBLE
+    if static_attributes is not None:
+        state.age = static_attributes['age']
+        state.gender = static_attributes['gender']
+        state.comorbid_A = static_attributes['comorbid_A']
+        state.comorbid_B = static_attributes['comorbid_B']
+    else:
+        ages, genders = generate_ages_and_genders(n, random_state)
+        state.age[:] = ages
+        state.gender[:] = genders
+        state.comorbid_A[:] = random_state.random(n) < comorbid_disease_A_fraction
+        state.comorbid_B[:] = random_state.random(n) < comorbid_disease_B_fraction
+    state.infected_time[:] = 0
+    state.recount()
+    return state
+
+
+def _set_status(g: Layer, node, status: str):
+    if isinstance(g, AgentState):
+        old_status = g.status[node]
+        g.status[node] = STATUS_CODES[status]
+        g.counters.transition(old_status, g.status[node])
+    else:
+        g.nodes[node]['l1_status'] = status
 
 
-def set_susceptible(g: nx.Graph, node):
+def set_susceptible(g: Layer, node):
     _set_status(g, node, 'S')
 
 
-def set_infected(g: nx.Graph, node):
+def set_infected(g: Layer, node):
     _set_status(g, node, 'I')
 
 
-def set_quarantined(g: nx.Graph, node):
+def set_quarantined(g: Layer, node):
     _set_status(g, node, 'Q')
 
 
-def set_recovered(g: nx.Graph, node):
+def set_recovered(g: Layer, node):
     _set_status(g, node, 'R')
 
 
-def set_dead(g: nx.Graph, node):
+def set_dead(g: Layer, node):
     _set_status(g, node, 'D')
 
 
-def set_age(g: nx.Graph, node, age: int):
-    g.nodes[node]['age'] = age
+def set_age(g: Layer, node, age: int):
+    if isinstance(g, AgentState):
+        g.age[node] = age
+    else:
+        g.nodes[node]['age'] = age
 
 
-def set_gender(g: nx.Graph, node, gender: str):
-    g.nodes[node]['gender'] = gender
+def set_gender(g: Layer, node, gender: str):
+    if isinstance(g, AgentState):
+        g.gender[node] = GENDER_CODES[gender]
+    else:
+        g.nodes[node]['gender'] = gender
 
 
-def get_status(g: nx.Graph, node):
+def get_status(g: Layer, node):
+    if isinstance(g, AgentState):
+        return STATUS_LABELS[g.status[node]]
     return g.nodes[node]['l1_status']
 
 
-def get_age(g: nx.Graph, node):
+def get_age(g: Layer, node):
+    if isinstance(g, AgentState):
+        return g.age[node]
     return g.nodes[node]['age']
 
 
-def get_gender(g: nx.Graph, node):
+def get_gender(g: Layer, node):
+    if isinstance(g, AgentState):
+        return GENDER_LABELS[g.gender[node]]
     return g.nodes[node]['gender']
 
 
-def set_comorbid_disease_A(g: nx.Graph, node):
-    g.nodes[node]['comorbid_A'] = True
+def _set_comorbid_disease(g: Layer, node, disease: str, value: bool):
+    if isinstance(g, AgentState):
+        getattr(g, disease)[node] = value
+    else:
+        g.nodes[node][disease] = value
+
+
+def set_comorbid_disease_A(g: Layer, node):
+    _set_comorbid_disease(g, node, 'comorbid_A', True)
 
 
-def set_no_comorbid_disease_A(g: nx.Graph, node):
-    g.nodes[node]['comorbid_A'] = False
+def set_no_comorbid_disease_A(g: Layer, node):
+    _set_comorbid_disease(g, node, 'comorbid_A', False)
 
 
-def set_comorbid_disease_B(g: nx.Graph, node):
-    g.nodes[node]['comorbid_B'] = True
+def set_comorbid_disease_B(g: Layer, node):
+    _set_comorbid_disease(g, node, 'comorbid_B', True)
 
 
-def set_no_comorbid_disease_B(g: nx.Graph, node):
-    g.nodes[node]['comorbid_B'] = False
+def set_no_comorbid_disease_B(g: Layer, node):
+    _set_comorbid_disease(g, node, 'comorbid_B', False)
 
 
-def get_comorbid_disease_A(g: nx.Graph, node):
+def get_comorbid_disease_A(g: Layer, node):
+    if isinstance(g, AgentState):
+        return g.comorbid_A[node]
     return g.nodes[node]['comorbid_A']
 
 
-def get_comorbid_disease_B(g: nx.Graph, node):
+def get_comorbid_disease_B(g: Layer, node):
+    if isinstance(g, AgentState):
+        return g.comorbid_B[node]
     return g.nodes[node]['comorbid_B']
 
 
-def set_infected_time(g: nx.Graph, node, value):
-    g.nodes[node]['I_time'] = value
+def set_infected_time(g: Layer, node, value):
+    if isinstance(g, AgentState):
+        g.infected_time[node] = value
+    else:
+        g.nodes[node]['I_time'] = value
+
+
+def _add_infected_time(g: Layer, node, value):
+    if isinstance(g, AgentState):
+        g.infected_time[node] += value
+    else:
+        g.nodes[node]['I_time'] += value
 
 
-def increment_infected_time(g: nx.Graph, node, opinion):
+def increment_infected_time(g: Layer, node, opinion):
     if opinion == 1:
-        g.nodes[node]['I_time'] += 5
+        _add_infected_time(g, node, 5)
     elif opinion == -1:
-        g.nodes[node]['I_time'] += 1
+        _add_infected_time(g, node, 1)
 
 
-def increment_infected_time_comorbid(g: nx.Graph, node, comorbid_A, comorbid_B):
+def increment_infected_time_comorbid(g: Layer, node, comorbid_A, comorbid_B):
     """
     The agents with a comorbid_B stay longer in an infected state
     """
     if comorbid_B:
-        g.nodes[node]['I_time'] += 0.5
+        _add_infected_time(g, node, 0.5)
     else:
-        g.nodes[node]['I_time'] += 1
+        _add_infected_time(g, node, 1)
 
 
-def get_infected_time(g: nx.Graph, node):
+def get_infected_time(g: Layer, node):
+    if isinstance(g, AgentState):
+        return g.infected_time[node]
     return g.nodes[node]['I_time']
@@ -1,27 +1,36 @@
 import networkx as nx
 
+from scripts.agent_state import AgentState, Layer, STATUS_CODES, state_aware
 
-def infected_ratio(g: nx.Graph):
+
+@state_aware
+def infected_ratio(g: Layer):
     return _calculate_ratio(g, 'I')
 
 
-def susceptible_ratio(g: nx.Graph):
+@state_aware
+def susceptible_ratio(g: Layer):
     return _calculate_ratio(g, 'S')
 
 
-def dead_ratio(g: nx.Graph):
+@state_aware
+def dead_ratio(g: Layer):
     return _calculate_ratio(g, 'D')
 
 
-def recovered_ratio(g: nx.Graph):
+@state_aware
+def recovered_ratio(g: Layer):
     return _calculate_ratio(g, 'R')
 
 
-def quarantined_ratio(g: nx.Graph):
+@state_aware
+def quarantined_ratio(g: Layer):
     return _calculate_ratio(g, 'Q')
 
 
-def _calculate_ratio(g: nx.Graph, status: str):
+def _calculate_ratio(g: Layer, status: str):
+    if isinstance(g, AgentState):
+        return g.counters.ratio(STATUS_CODES[status])
     size = nx.number_of_nodes(g)
     statuses = nx.get_node_attributes(g, 'l1_status').values()
     count = sum([1 for s in statuses if s == status])
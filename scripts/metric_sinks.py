@@ -0,0 +1,245 @@
+import collections
+import functools
+
+import numpy as np
+
+MC_SWEEP = 'sweep'
+
+
+class SeriesSink:
+    """Keep every recorded value (default sink)"""
+
+    def __init__(self):
+        self.values = []
+
+    def append(self, value):
+        self.values.append(value)
+
+    def extend(self, values):
+        self.values.extend(values)
+
+    def result(self):
+        return self.values
+
+
+class LastSink:
+    """Keep only the last recorded value"""
+
+    def __init__(self):
+        self.value = None
+
+    def append(self, value):
+        self.value = value
+
+    def extend(self, values):
+        if len(values):
+            self.value = values[-1]
+
+    def result(self):
+        return self.value
+
+
+class MaxSink:
+    """Keep the maximum of recorded values"""
+
+    def __init__(self):
+        self.value = None
+
+    def append(self, value):
+        if self.value is None or value > self.value:
+            self.value = value
+
+    def extend(self, values):
+        if len(values):
+            self.append(max(values))
+
+    def result(self):
+        return self.value
+
+
+class MeanSink:
+    """Keep the running mean of recorded values"""
+
+    def __init__(self):
+        self.total = 0
+        self.count = 0
+
+    def append(self, value):
+        self.total += value
+        self.count += 1
+
+    def extend(self, values):
+        self.total += sum(values)
+        self.count += len(values)
+
+    def result(self):
+        return self.total / self.count if self.count else None
+
+
+class RingBufferSink:
+    """Keep the last `size` recorded values
+
+    Use `functools.partial(RingBufferSink, size)` as a sink factory.
+    """
+
+    def __init__(self, size: int):
+        self.values = collections.deque(maxlen=size)
+
+    def append(self, value):
+        self.values.append(value)
+
+    def extend(self, values):
+        self.values.extend(values)
+
+    def result(self):
+        return list(self.values)
+
+
+class TrajectoryRecorder:
+    """Recorded values of metrics written directly into a preallocated `.npy` file
+
+    The file holds a structured array with one float32 field per metric and one row per record, all rows are NaN
+    until they are recorded. Memory does not grow with the number of records and the file can be opened with
+    `load_trajectory` while the simulation is still running (recorded rows are visible after `flush`).
+
+    Use `sinks` as the sinks of the simulation, e.g.:
+    recorder = TrajectoryRecorder.for_run('run.npy', metrics, steps, n_agents)
+    init_run_simulation(..., metrics, sinks=recorder.sinks())
+    """
+
+    def __init__(self, path: str, metrics_names: list, n_records: int, flush_every: int = 10000):
+        """
+        :param path: path of `.npy` file, an existing file is overwritten
+        :param metrics_names: names of recorded metrics
+        :param n_records: number of rows
+        :param flush_every: number of records of a metric between writes to the disk
+        """
+        self.path = path
+        self.flush_every = flush_every
+        dtype = np.dtype([(name, np.float32) for name in metrics_names])
+        self.values = np.lib.format.open_memmap(path, mode='w+', dtype=dtype, shape=(n_records,))
+        for name in metrics_names:
+            self.values[name] = np.nan
+        self.flush()
+
+    @staticmethod
+    def for_run(path: str, metrics: dict, steps: int, n_agents: int, record_every=1, flush_every: int = 10000):
+        """
+        Recorder with one row for every recorded step of the simulation (see `run`), the synchronous backend
+        records at most once per sweep, so the last rows may stay NaN
+
+        :param path: path of `.npy` file
+        :param metrics: metrics dictionary (see `run` function)
+        :param steps: number of simulation steps
+        :param n_agents: number of agents
+        :param record_every: see `record_interval`
+        :param flush_every: see `TrajectoryRecorder`
+        :return: TrajectoryRecorder
+        """
+        n_records = remaining_records(-1, steps, record_interval(record_every, n_agents))
+        return TrajectoryRecorder(path, list(metrics), n_records, flush_every)
+
+    def sinks(self) -> dict:
+        """
+        :return: sinks of all metrics (see `create_sinks`)
+        """
+        return {name: functools.partial(MemmapSink, self, name) for name in self.values.dtype.names}
+
+    def flush(self):
+        self.values.flush()
+
+
+class MemmapSink:
+    """Write recorded values into the field of `TrajectoryRecorder`, the result is a view of the field"""
+
+    def __init__(self, recorder: TrajectoryRecorder, name: str):
+        self.recorder = recorder
+        self.values = recorder.values[name]
+        self.position = 0
+
+    def append(self, value):
+        self.values[self.position] = value
+        self.position += 1
+        if self.position % self.recorder.flush_every == 0:
+            self.recorder.flush()
+
+    def extend(self, values):
+        if not len(values):
+            return
+        start = self.position
+        self.position += len(values)
+        self.values[start:self.position] = values
+        if self.position // self.recorder.flush_every != start // self.recorder.flush_every:
+            self.recorder.flush()
+
+    def result(self):
+        self.recorder.flush()
+        return self.values
+
+
+def load_trajectory(path: str) -> np.ndarray:
+    """
+    Open trajectory recorded by `TrajectoryRecorder` without reading it into memory
+
+    :param path: path of `.npy` file
+    :return: read-only structured array, e.g. `trajectory['dead_ratio']`, rows which are not recorded yet are NaN
+    """
+    return np.load(path, mmap_mode='r')
+
+
+def record_interval(record_every, n_agents: int) -> int:
+    """
+    Number of simulation steps between two recorded values
+
+    :param record_every: number of steps or `MC_SWEEP` to record once per Monte-Carlo sweep (`n_agents` steps)
+    :param n_agents: number of agents
+    """
+    if record_every == MC_SWEEP:
+        return n_agents
+    if record_every < 1:
+        raise ValueError(f'record_every has to be positive, got {record_every}')
+    return int(record_every)
+
+
+def is_recorded(step: int, steps: int, interval: int) -> bool:
+    """
+    Whether metrics are recorded after `step`. The last step is always recorded.
+    """
+    return (step + 1) % interval == 0 or step == steps - 1
+
+
+def remaining_records(step: int, steps: int, interval: int) -> int:
+    """
+    Number of recorded steps after `step` (see `is_recorded`)
+    """
+    if step >= steps - 1:
+        return 0
+    return steps // interval - (step + 1) // interval + (1 if steps % interval else 0)
+
+
+def fast_forward(output_sinks: dict, values: dict, n_records: int):
+    """
+    Record the same values `n_records` times, e.g. when the state does not change anymore
+
+    :param output_sinks: dictionary {metric name: sink}
+    :param values: dictionary {metric name: value}
+    :param n_records: number of records
+    """
+    for metrics_name, value in values.items():
+        output_sinks[metrics_name].extend([value] * n_records)
+
+
+def create_sinks(metrics: dict, sinks: dict = None) -> dict:
+    """
+    Create one sink for every metric
+
+    :param metrics: metrics dictionary (see `run` function)
+    :param sinks: format e.g.: {'dead_ratio': LastSink, 'infected_ratio': MaxSink}, missing metrics use `SeriesSink`
+    :return: dictionary {metric name: sink}
+    """
+    sinks = sinks if sinks is not None else {}
+    return {m: sinks.get(m, SeriesSink)() for m in metrics.keys()}
+
+
+def collect_results(output_sinks: dict) -> dict:
+    return {m: sink.result() for m, sink in output_sinks.items()}
@@ -0,0 +1,240 @@
+import math
+
+import numpy as np
+
+from scripts.agent_state import AgentState, CSRAdjacency, state_metrics
+from scripts.metric_sinks import create_sinks, collect_results, record_interval, fast_forward
+from scripts.multilayer.simulation import initialize_state, initialize_agents
+from scripts.multilayer.synchronous import _is_recorded_sweep, _adjacency_matrix, _virtual_layer_sweep, \
+    _epidemic_layer_sweep
+from scripts.multilayer.transition_rates import get_transition_rates
+from scripts.parameters import *
+from scripts.random_streams import RandomStreams, get_streams
+from scripts.topology_cache import TopologyCache
+
+
+def init_run_batched(n_replicas: int,
+                     n_agents: int,
+                     n_additional_virtual_links: int,
+                     steps: int,
+                     l1_params: PhysicalLayerParameters,
+                     l2_voter_params: QVoterParameters,
+                     l2_social_media_params: SocialMediaParameters,
+                     metrics: dict,
+                     infected_fraction: float = 0.1,
+                     negative_opinion_fraction: float = 0.5,
+                     network_m: int = 3,
+                     network_p: int = 0.8,
+                     record_every=1,
+                     sinks: dict = None,
+                     shared_topology=True,
+                     topology_cache: TopologyCache = None,
+                     seed: int = None,
+                     early_stop=True,
+                     verbose=False):
+    """
+    Perform `n_replicas` realisations of COVID-19 simulation on multilayer networks at once (see `run_batched`)
+
+    :param n_replicas: number of realisations
+    :param shared_topology: all replicas use the network of the first replica, otherwise every replica gets its own
+                            network
+    :param seed: root seed of the batch, replicas and sweeps of the batch get independent child seeds
+                 (see `replica_seeds`), random when not given
+    :return: output_metrics: format: {'dead_ratio': array with shape (n_replicas, ...), ...},
+             list of AgentState of every replica and list of seeds of every replica
+    Other parameters are the same as in `scripts.multilayer.simulation.init_run_simulation`.
+    """
+    seeds, batch_seed = replica_seeds(n_replicas, seed)
+    states = initialize_replicas(seeds, n_agents, n_additional_virtual_links, infected_fraction,
+                                 negative_opinion_fraction, network_m, network_p, shared_topology, topology_cache)
+    output_metrics, replicas = run_batched(states, steps, l1_params, l2_voter_params, l2_social_media_params,
+                                           metrics, record_every=record_every, sinks=sinks, early_stop=early_stop,
+                                           streams=RandomStreams(batch_seed), verbose=verbose)
+    return output_metrics, replicas, seeds
+
+
+def replica_seeds(n_replicas: int, seed: int = None):
+    """
+    Seeds of replicas of the batch with root `seed`. Seeds are drawn from independent children of the root
+    `np.random.SeedSequence` (the same scheme as `scripts.random_streams.realisation_seed`), so batches with
+    different root seeds never share replicas.
+
+    :param n_replicas: number of replicas
+    :param seed: root seed of the batch, random when not given
+    :return: tuple (list of 64-bit seeds of every replica, 64-bit seed of the sweeps of the batch)
+    """
+    replicas_sequence, batch_sequence = np.random.SeedSequence(seed).spawn(2)
+    seeds = [int(sequence.generate_state(1, np.uint64)[0]) for sequence in replicas_sequence.spawn(n_replicas)]
+    return seeds, int(batch_sequence.generate_state(1, np.uint64)[0])
+
+
+def initialize_replicas(seeds: list,
+                        n_agents: int,
+                        n_additional_virtual_links: int,
+                        infected_fraction: float = 0.1,
+                        negative_opinion_fraction: float = 0.5,
+                        network_m: int = 3,
+                        network_p: int = 0.8,
+                        shared_topology=True,
+                        topology_cache: TopologyCache = None,
+                        comorbid_disease_A_fraction: float = 0,
+                        comorbid_disease_B_fraction: float = 0):
+    """
+    Create layers and initialize agents of every replica (see `init_run_batched`). The network and agents of a
+    replica are drawn from `RandomStreams` of its seed, so the initial state of the replica is the same as in
+    `scripts.multilayer.simulation.init_run_simulation` with these streams (the sweeps of all replicas are drawn
+    from one stream of the batch).
+
+    :param seeds: seed of every replica (see `replica_seeds`)
+    :return: list of AgentState
+    """
+    states = []
+    for replica, seed in enumerate(seeds):
+        streams = RandomStreams(seed)
+        if replica == 0 or not shared_topology:
+            state = initialize_state(n_agents, n_additional_virtual_links, infected_fraction, negative_opinion_fraction,
+                                     network_m, network_p, topology_cache, streams=streams,
+                                     comorbid_disease_A_fraction=comorbid_disease_A_fraction,
+                                     comorbid_disease_B_fraction=comorbid_disease_B_fraction)
+            l1_adjacency, l2_adjacency = state.l1, state.l2
+        else:
+            # topology arrays are shared, but every replica switches off agents in its own `active_agents` mask
+            state = initialize_agents(AgentState(CSRAdjacency(l1_adjacency.indptr, l1_adjacency.indices),
+                                                 CSRAdjacency(l2_adjacency.indptr, l2_adjacency.indices)),
+                                      infected_fraction, negative_opinion_fraction, streams.numpy, None,
+                                      comorbid_disease_A_fraction, comorbid_disease_B_fraction)
+        states.append(state)
+    return states
+
+
+def run_batched(states: list,
+                steps: int,
+                l1_params: PhysicalLayerParameters,
+                l2_voter_params: QVoterParameters,
+                l2_social_media_params: SocialMediaParameters,
+                metrics: dict,
+                record_every=1,
+                sinks: dict = None,
+                early_stop=True,
+                streams: RandomStreams = None,
+                verbose=False):
+    """
+    Run `steps` of the synchronous simulation (see `run_synchronous`) of all replicas at once.
+
+    Replicas are stacked into one state with block diagonal adjacency (`stack_states`), so every Monte-Carlo sweep of
+    all replicas is a single vectorized update. Replicas are independent, they only share the random number stream.
+
+    :param states: list of AgentState of all replicas with the same number of agents, they are not modified
+    :param steps: number of simulation steps of every replica
+    :param l1_params: parameters for l1_layer
+    :param l2_voter_params: parameters for voter model in l2_layer
+    :param l2_social_media_params: parameters for social media in l2_layer
+    :param metrics: the same format as in `run`, metric functions are called with the state of every
+                    replica (see `state_metrics`)
+    :param record_every: number of steps between recorded metrics (see `run`)
+    :param sinks: reducers of recorded metrics (see `run`)
+    :param early_stop: skip the epidemic after it ended in all replicas (see `run`)
+    :param streams: random number streams of the whole batch (see `RandomStreams`)
+    :param verbose: print simulation status
+    :return: output_metrics: format: {'dead_ratio': array with shape (replicas, ...) , ...}, every row is the result
+             of one replica (recorded values or the output of the sink), and list of AgentState of every replica
+             (views of the stacked state)
+    """
+    random_state = get_streams(streams).numpy
+    batch = stack_states(states)
+    n = states[0].n_agents
+    replicas = [replica_view(batch, replica * n, (replica + 1) * n) for replica in range(len(states))]
+    sweeps = math.ceil(steps / n)
+    interval = record_interval(record_every, n)
+    metrics = state_metrics(metrics)
+    output_sinks = [create_sinks(metrics, sinks) for _ in replicas]
+    l1_matrix = _adjacency_matrix(batch.l1)
+    l2_rows = batch.l2.row_indices()
+    rates = get_transition_rates(batch, l1_params)
+    evolve_opinions = any(layer == 'l2_layer' for layer, _ in metrics.values())
+    epidemic_ended = False
+    for sweep in range(sweeps):
+        _virtual_layer_sweep(batch, l2_rows, l2_voter_params, random_state)
+        if not epidemic_ended:
+            _epidemic_layer_sweep(batch, l1_matrix, rates, l1_params, random_state)
+        batch.recount()
+
+        if verbose:
+            print('Sweep: {} / {}'.format(sweep, sweeps))
+
+        if _is_recorded_sweep(sweep, sweeps, steps, n, interval):
+            for replica, replica_sinks in zip(replicas, output_sinks):
+                replica.recount()
+                for metrics_name, (layer, metrics_function) in metrics.items():
+                    if layer == 'l1_layer' or layer == 'l2_layer':
+                        replica_sinks[metrics_name].append(metrics_function(replica))
+                    else:
+                        print('Unsupported layer name')
+                        return
+
+        if early_stop and not epidemic_ended and batch.counters.epidemic_ended():
+            epidemic_ended = True
+            if not evolve_opinions:
+                n_records = sum(_is_recorded_sweep(s, sweeps, steps, n, interval) for s in range(sweep + 1, sweeps))
+                for replica, replica_sinks in zip(replicas, output_sinks):
+                    replica.recount()
+                    values = {metrics_name: metrics_function(replica)
+                              for metrics_name, (_, metrics_function) in metrics.items()}
+                    fast_forward(replica_sinks, values, n_records)
+                break
+
+    results = [collect_results(replica_sinks) for replica_sinks in output_sinks]
+    return {metrics_name: np.array([result[metrics_name] for result in results]) for metrics_name in metrics}, replicas
+
+
+def stack_states(states: list) -> AgentState:
+    """
+    Join states with the same number of agents into one state. Agent `i` of state `r` is agent `r * N + i` and
+    layers are disjoint unions of layers of all states.
+
+    :param states: list of AgentState
+    :return: AgentState with `len(states) * N` agents
+    """
+    n = states[0].n_agents
+    if any(state.n_agents != n for state in states):
+        raise ValueError('All replicas must have the same number of agents')
+    l2 = _stack_adjacency([state.l2 for state in states]) if states[0].l2 is not None else None
+    batch = AgentState(_stack_adjacency([state.l1 for state in states]), l2)
+    for name in ('status', 'age', 'gender', 'comorbid_A', 'comorbid_B', 'infected_time', 'opinion'):
+        setattr(batch, name, np.concatenate([getattr(state, name) for state in states]))
+    batch.recount()
+    return batch
+
+
+def replica_view(batch: AgentState, start: int, stop: int) -> AgentState:
+    """
+    State of agents `start, ..., stop - 1` of the stacked state (see `stack_states`). Attributes and masks of
+    active agents are views of `batch`, counters have to be updated with `recount`.
+
+    :param batch: stacked AgentState
+    :param start: index of the first agent
+    :param stop: index after the last agent
+    :return: AgentState
+    """
+    l2 = _adjacency_view(batch.l2, start, stop) if batch.l2 is not None else None
+    state = AgentState(_adjacency_view(batch.l1, start, stop), l2)
+    for name in ('status', 'age', 'gender', 'comorbid_A', 'comorbid_B', 'infected_time', 'opinion'):
+        setattr(state, name, getattr(batch, name)[start:stop])
+    state.recount()
+    return state
+
+
+def _stack_adjacency(adjacencies: list) -> CSRAdjacency:
+    node_offsets = np.cumsum([0] + [adjacency.n_nodes for adjacency in adjacencies])
+    link_offsets = np.cumsum([0] + [len(adjacency.indices) for adjacency in adjacencies])
+    indptr = np.concatenate([adjacency.indptr[:-1] + offset for adjacency, offset in zip(adjacencies, link_offsets)]
+                            + [link_offsets[-1:]])
+    indices = np.concatenate([adjacency.indices + offset for adjacency, offset in zip(adjacencies, node_offsets)])
+    active_agents = np.concatenate([adjacency.active_agents for adjacency in adjacencies])
+    return CSRAdjacency(indptr, indices, active_agents)
+
+
+def _adjacency_view(adjacency: CSRAdjacency, start: int, stop: int) -> CSRAdjacency:
+    first, last = adjacency.indptr[start], adjacency.indptr[stop]
+    return CSRAdjacency(adjacency.indptr[start:stop + 1] - first, adjacency.indices[first:last] - start,
+                        adjacency.active_agents[start:stop])
@@ -6,9 +6,16 @@ class SimulationConstants:
     N_STEPS = 150000
     FRAC_ADDITIONAL_VIRTUAL_LINKS = 0.1
     NEGATIVE_OPINION_FRACTION = 0.5
+    FRACTION_COMORBIDITIES_A = 0
+    FRACTION_COMORBIDITIES_B = 0
+    NETWORK_M = 3
+    NETWORK_P = 0.8
     L1_DEFAULT_PARAMS = PhysicalLayerParameters(0.1, 0.2, 0.9, 0.05, 10)
     L2_VOTER_DEFAULT_PARAMS = QVoterParameters(0.5, 4)
     L2_SOCIAL_MEDIA_DEFAULT_PARAMS = SocialMediaParameters(0.1, 100)
+    BACKEND = 'python'
+    TOPOLOGY_POOL_SIZE = None
+    TOPOLOGY_CACHE_DIR = None
 
     @staticmethod
     def _get_additional_virtual_links(n):
@@ -21,7 +28,14 @@ class SimulationConstants:
                  l1_params=None,
                  l2_voter_params=None,
                  l2_social_media_params=None,
-                 negative_opinion_fraction=None):
+                 negative_opinion_fraction=None,
+                 backend=None,
+                 topology_pool_size=None,
+                 topology_cache_dir=None,
+                 comorbid_disease_A_fraction=None,
+                 comorbid_disease_B_fraction=None,
+                 network_m=None,
+                 network_p=None):
         self.n_agents = n_agents if n_agents is not None else SimulationConstants.N_AGENTS
         self.n_steps = n_steps if n_steps is not None else SimulationConstants.N_STEPS
         self.n_additional_virtual_links = n_additional_virtual_links if n_additional_virtual_links is not None \
@@ -33,3 +47,14 @@ class SimulationConstants:
             else SimulationConstants.L2_SOCIAL_MEDIA_DEFAULT_PARAMS
         self.negative_opinion_fraction = negative_opinion_fraction if negative_opinion_fraction is not None \
             else SimulationConstants.NEGATIVE_OPINION_FRACTION
+        self.backend = backend if backend is not None else SimulationConstants.BACKEND
+        self.topology_pool_size = topology_pool_size if topology_pool_size is not None \
+            else SimulationConstants.TOPOLOGY_POOL_SIZE
+        self.topology_cache_dir = topology_cache_dir if topology_cache_dir is not None \
+            else SimulationConstants.TOPOLOGY_CACHE_DIR
+        self.comorbid_disease_A_fraction = comorbid_disease_A_fraction if comorbid_disease_A_fraction is not None \
+            else SimulationConstants.FRACTION_COMORBIDITIES_A
+        self.comorbid_disease_B_fraction = comorbid_disease_B_fraction if comorbid_disease_B_fraction is not None \
+            else SimulationConstants.FRACTION_COMORBIDITIES_B
+        self.network_m = network_m if network_m is not None else SimulationConstants.NETWORK_M
+        self.network_p = network_p if network_p is not None else SimulationConstants.NETWORK_P
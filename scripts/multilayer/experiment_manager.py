@@ -1,21 +1,35 @@
 import itertools
 import logging
-import math
 import multiprocessing as mp
 import time
-from collections import ChainMap
 from typing import Callable
 from logger_tt import setup_logging, logger
 
 import numpy as np
 
 from scripts.multilayer.constants import SimulationConstants
+from scripts.dataset import realisations_to_frame, save_dataset
 from scripts.epidemic_metrics import *
 from scripts.parameters import *
-from scripts.multilayer.save_output import format_parameters, save_results
+from scripts.profiling import RunProfile, summarize
+from scripts.random_streams import RandomStreams, get_streams
+from scripts.metric_sinks import LastSink, MaxSink
+from scripts.multilayer.batched import initialize_replicas, run_batched
+from scripts.multilayer.save_output import format_parameters, parameter_columns
 from scripts.multilayer.simulation import init_run_simulation
+from scripts.realisations import results_to_array
+from scripts.result_store import ResultStore
+from scripts.scheduler import run_realisations
+from scripts.shared_topology import create_shared_topologies, get_shared_topology
+from scripts.topology_cache import get_topology_cache
 from scripts.virtual_metrics import mean_opinion
 
+# Experiments use only the final dead ratio and opinion and the peak of infected ratio
+SUMMARY_SINKS = {'dead_ratio': LastSink,
+                 'infected_ratio': MaxSink,
+                 'last_infected_ratio': LastSink,
+                 'mean_opinion': LastSink}
+
 
 def run_parallel(params1: list,
                  params2: list,
@@ -29,16 +43,28 @@ def run_parallel(params1: list,
                  n_steps: int = None,
                  frac_additional_virtual_links: float = None,
                  negative_opinion_fraction: float = None,
+                 backend: str = None,
+                 topology_pool_size: int = None,
+                 topology_cache_dir: str = None,
                  constants: SimulationConstants = SimulationConstants(),
                  n_runs=100,
-                 cpus=mp.cpu_count()):
+                 cpus=mp.cpu_count(),
+                 chunksize: int = None,
+                 results_path: str = None,
+                 dataset_path: str = None,
+                 params_names: tuple = ('q', 'p'),
+                 seed: int = None,
+                 profile=False,
+                 shared_topology=False,
+                 batch_size: int = None):
     """
     Perform simulations in parallel
 
     :param params1: list of parameters
     :param params2: list of parameters
-    :param filename: output file name prefix
-    :param experiment_fun: function to execute in parallel (see more in `example_experiment` function)
+    :param filename: output file name prefix and the name of the experiment in the dataset
+    :param experiment_fun: function which runs a single realisation of one parameter point
+                           (see more in `example_experiment` function)
     :param l1_params:
     :param l2_voter_params:
     :param l2_social_media_params:
@@ -47,9 +73,34 @@ def run_parallel(params1: list,
     :param n_steps:
     :param frac_additional_virtual_links:
     :param negative_opinion_fraction:
+    :param backend: simulation backend (see `scripts.multilayer.simulation.run`)
+    :param topology_pool_size: number of distinct networks reused by all simulations (see `TopologyCache`),
+                               a new network is generated for every simulation when not given
+    :param topology_cache_dir: directory with generated networks shared by all processes
     :param constants:
     :param n_runs: number of realizations of each run
     :param cpus: number of threads (default max number)
+    :param chunksize: number of realisations sent to a process at once (see `scripts.scheduler.get_chunksize`)
+    :param results_path: append-only file with results of every finished realisation (see `ResultStore`), an
+                         interrupted sweep started again with the same file and settings runs only missing realisations
+                         (default `filename` + '_results.jsonl')
+    :param dataset_path: Parquet file with all realisations (see `scripts.dataset`), default `filename` + '.parquet'
+    :param params_names: dataset column names of `params1` and `params2`
+    :param seed: root seed of all realisations (see `scripts.scheduler.run_realisations`)
+    :param profile: every realisation returns its `RunProfile` (see `scripts.profiling`) with the results, profiles
+                    are stored as `profile_*` fields and their totals are logged
+    :param shared_topology: generate `topology_pool_size` topologies (required) with static attributes of agents
+                            once and share them with all processes without copying (see `SharedTopology`), in
+                            memory-mapped `.npy` files in `topology_cache_dir` if it is given, otherwise in shared
+                            memory
+    :param batch_size: opt-in: every task runs up to `batch_size` realisations of one point at once as replicas of
+                       one vectorized simulation (see `scripts.multilayer.batched`), `experiment_fun` is called with
+                       (point, params, seeds) and returns results of every seed (see `batched_experiment`). Replicas
+                       are updated synchronously, so it requires the 'synchronous' backend, and do not use shared
+                       topologies or profiles. A realisation depends on the other realisations of its block, so it
+                       cannot be run again alone.
+    :return: structured array with summary metrics and seed of every realisation (see `results_to_array`),
+             statistics over realisations can be computed with `scripts.realisations.aggregate`
     """
     if metrics is None:
         metrics = {'dead_ratio': ('l1_layer', dead_ratio),
@@ -69,114 +120,192 @@ def run_parallel(params1: list,
         frac_additional_virtual_links = constants.FRAC_ADDITIONAL_VIRTUAL_LINKS
     if negative_opinion_fraction is None:
         negative_opinion_fraction = constants.NEGATIVE_OPINION_FRACTION
+    if backend is None:
+        backend = constants.BACKEND
+    if topology_pool_size is None:
+        topology_pool_size = constants.TOPOLOGY_POOL_SIZE
+    if topology_cache_dir is None:
+        topology_cache_dir = constants.TOPOLOGY_CACHE_DIR
+    if shared_topology and topology_pool_size is None:
+        # otherwise all realisations would use one network and one set of ages and genders
+        raise ValueError('topology_pool_size is required with shared_topology')
+    if batch_size is not None and (backend != 'synchronous' or shared_topology or profile):
+        raise ValueError('batch_size requires the synchronous backend without shared_topology and profile')
 
     updated_constants = SimulationConstants(n_agents, n_steps, frac_additional_virtual_links,
                                             l1_params, l2_voter_params, l2_social_media_params,
-                                            negative_opinion_fraction)
-
-    params_all = list(itertools.product(params1, params2))
-    length = math.ceil(len(params_all) / cpus)
-    params_chunks = []
-    for i in range(cpus):
-        start_idx = i * length
-        end_idx = (i + 1) * length
-        to_add = params_all[start_idx:end_idx]
-        if len(to_add) > 0:
-            params_chunks.append(to_add)
+                                            negative_opinion_fraction, backend, topology_pool_size,
+                                            topology_cache_dir, constants.comorbid_disease_A_fraction,
+                                            constants.comorbid_disease_B_fraction, constants.network_m,
+                                            constants.network_p)
 
     all_parameters = {
         'constants': updated_constants,
         'metrics': metrics,
-        'n_runs': n_runs
+        'n_runs': n_runs,
+        'profile': profile,
+        'shared_topologies': []
     }
-    all_parameters = [[p, all_parameters] for p in params_chunks]
+    params_all = list(itertools.product(params1, params2))
+    # all settings which change results, a sweep is resumed only with the same settings
+    description = {'experiment': filename,
+                   'experiment_fun': experiment_fun.__name__,
+                   'parameters': format_parameters(l1_params, l2_voter_params, l2_social_media_params, n_runs,
+                                                   n_steps, n_agents, frac_additional_virtual_links),
+                   'metrics': sorted(metrics),
+                   'negative_opinion_fraction': negative_opinion_fraction,
+                   'comorbid_disease_A_fraction': updated_constants.comorbid_disease_A_fraction,
+                   'comorbid_disease_B_fraction': updated_constants.comorbid_disease_B_fraction,
+                   'network_m': updated_constants.network_m,
+                   'network_p': updated_constants.network_p,
+                   'backend': backend,
+                   'seed': seed,
+                   'topology_pool_size': topology_pool_size,
+                   'shared_topology': shared_topology,
+                   'batch_size': batch_size}
+    if results_path is None:
+        results_path = filename + '_results.jsonl'
+    store = ResultStore(results_path, description)
 
-    output_dead_rate = []
-    output_infected_rate = []
-    output_mean_opinion = []
     start = time.time()
-    with mp.Pool(cpus) as pool:
-        for tmp_dead_rate, tmp_infected_rate, tmp_mean_opinion in pool.starmap(experiment_fun, all_parameters):
-            output_dead_rate.append(tmp_dead_rate)
-            output_infected_rate.append(tmp_infected_rate)
-            output_mean_opinion.append(tmp_mean_opinion)
-
-    output_dead_rate = dict(ChainMap(*output_dead_rate))
-    output_infected_rate = dict(ChainMap(*output_infected_rate))
-    output_mean_opinion = dict(ChainMap(*output_mean_opinion))
-    parameters_name = filename + '_' + format_parameters(l1_params, l2_voter_params, l2_social_media_params,
-                                                         n_runs, n_steps, n_agents,
-                                                         frac_additional_virtual_links) + '.csv'
-    save_results(output_dead_rate, output_infected_rate, output_mean_opinion, params1, params2, parameters_name)
+    shared_topologies = []
+    if shared_topology:
+        shared_topologies = create_shared_topologies(n_agents, updated_constants.n_additional_virtual_links,
+                                                     updated_constants.network_m, updated_constants.network_p,
+                                                     topology_pool_size, updated_constants.comorbid_disease_A_fraction,
+                                                     updated_constants.comorbid_disease_B_fraction,
+                                                     directory=topology_cache_dir)
+        all_parameters['shared_topologies'] = [topology.handle for topology in shared_topologies]
+    try:
+        results = run_realisations(experiment_fun, params_all, all_parameters, n_runs, cpus, chunksize, store, seed,
+                                   batch_size=batch_size)
+    finally:
+        for topology in shared_topologies:
+            topology.close()
+            topology.unlink()
+
+    constants_columns = parameter_columns(l1_params, l2_voter_params, l2_social_media_params, n_steps, n_agents,
+                                          frac_additional_virtual_links, negative_opinion_fraction)
+    if dataset_path is None:
+        dataset_path = filename + '.parquet'
+    realisations = results_to_array(results, params_names)
+    save_dataset(realisations_to_frame(realisations, constants_columns, filename), dataset_path)
+    if profile:
+        logger.info(f'Profile: {summarize(realisations)}')
     end = time.time()
     logger.info(f'Elapsed: {end - start} s')
+    return realisations
+
+
+def example_experiment(q_p: tuple, params: dict, streams: RandomStreams = None):
+    """
+    Example function to run in parallel, a single realisation for one parameter point
+
+    :param q_p: parameters in format: (q, p)
+    :param params: dictionary with all possible parameters (see variable `all_parameters` in `run_parallel` function)
+    :param streams: random number streams of the realisation (see `scripts.scheduler.run_realisations`)
+    :return: dictionary with dead ratio, peak of infected ratio and mean opinion of the realisation
+    """
+    q, p = q_p
+    constants = params['constants']
+    profile = RunProfile() if params.get('profile') else None
+    shared_topology = get_shared_topology(params.get('shared_topologies'), get_streams(streams).numpy)
+    topology_cache = get_topology_cache(constants.topology_pool_size, constants.topology_cache_dir)
+    q_voter_parameters = QVoterParameters(p, q, constants.l2_voter_params.panel)
+    out, _, _ = init_run_simulation(constants.n_agents,
+                                    constants.n_additional_virtual_links,
+                                    constants.n_steps,
+                                    constants.l1_params,
+                                    q_voter_parameters,
+                                    constants.l2_social_media_params,
+                                    params['metrics'],
+                                    negative_opinion_fraction=constants.negative_opinion_fraction,
+                                    network_m=constants.network_m,
+                                    network_p=constants.network_p,
+                                    comorbid_disease_A_fraction=constants.comorbid_disease_A_fraction,
+                                    comorbid_disease_B_fraction=constants.comorbid_disease_B_fraction,
+                                    sinks=SUMMARY_SINKS,
+                                    backend=constants.backend,
+                                    return_graphs=False,
+                                    topology_cache=topology_cache,
+                                    shared_topology=shared_topology,
+                                    streams=streams,
+                                    profile=profile)
+    if profile is not None:
+        out.update(profile.to_dict())
+    return out
 
 
-def example_experiment(qs_ps: list, params: dict):
+def batched_experiment(q_p: tuple, params: dict, seeds: list):
     """
-    Example function to run in parallel
+    Example function to run with `batch_size` of `run_parallel`, a block of realisations of one parameter point at once
+    (see `run_batched`)
 
-    :param qs_ps: parameters in format: [(q1, p1), (q2, p2), ...]
+    :param q_p: parameters in format: (q, p)
     :param params: dictionary with all possible parameters (see variable `all_parameters` in `run_parallel` function)
-    :return: tuple of dead and infected ratio for every parameters
+    :param seeds: seeds of realisations, network and agents of every replica are drawn from its own seed and
+                  synchronous sweeps of all replicas from one stream of the block (see `initialize_replicas`)
+    :return: list of dictionaries with dead ratio, peak of infected ratio and mean opinion of every realisation
     """
-    output_dead_rate = {}
-    output_infected_rate = {}
+    q, p = q_p
     constants = params['constants']
-    for q, p in qs_ps:
-        print(f'Running q={q}, p={p} in process {mp.current_process().name}')
-        dead_rate = []
-        infected_rate = []
-        for _ in range(params['n_runs']):
-            q_voter_parameters = QVoterParameters(p, q)
-            out, _, _ = init_run_simulation(constants.n_agents,
-                                            constants.n_additional_virtual_links,
-                                            constants.n_steps,
-                                            constants.l1_params,
-                                            q_voter_parameters,
-                                            constants.l2_social_media_params,
-                                            params['metrics'],
-                                            negative_opinion_fraction=constants.negative_opinion_fraction)
-            dead_rate.append(out['dead_ratio'][-1])
-            infected_rate.append(max(out['infected_ratio']))
-        output_dead_rate[(p, q)] = np.mean(dead_rate)
-        output_infected_rate[(p, q)] = np.mean(infected_rate)
-    return output_dead_rate, output_infected_rate
-
-
-def experiment1(qs_ps: list, params: dict):
-    output_dead_rate = {}
-    output_infected_rate = {}
-    output_mean_opinion = {}
+    topology_cache = get_topology_cache(constants.topology_pool_size, constants.topology_cache_dir)
+    q_voter_parameters = QVoterParameters(p, q, constants.l2_voter_params.panel)
+    states = initialize_replicas(seeds,
+                                 constants.n_agents,
+                                 constants.n_additional_virtual_links,
+                                 negative_opinion_fraction=constants.negative_opinion_fraction,
+                                 network_m=constants.network_m,
+                                 network_p=constants.network_p,
+                                 shared_topology=False,
+                                 topology_cache=topology_cache,
+                                 comorbid_disease_A_fraction=constants.comorbid_disease_A_fraction,
+                                 comorbid_disease_B_fraction=constants.comorbid_disease_B_fraction)
+    out, _ = run_batched(states,
+                         constants.n_steps,
+                         constants.l1_params,
+                         q_voter_parameters,
+                         constants.l2_social_media_params,
+                         params['metrics'],
+                         sinks=SUMMARY_SINKS,
+                         streams=RandomStreams(np.random.SeedSequence(seeds)))
+    return [{metrics_name: values[replica] for metrics_name, values in out.items()} for replica in range(len(seeds))]
+
+
+def experiment1(q_p: tuple, params: dict, streams: RandomStreams = None):
+    q, p = q_p
+    start = time.time()
     constants = params['constants']
-    for q, p in qs_ps:
-        start = time.time()
-        logger.info(f'Running q={q}, p={p} in process {mp.current_process().name}')
-        dead_rate = []
-        infected_rate = []
-        opinion_rate = []
-        min_infected_rate = []
-        for _ in range(params['n_runs']):
-            q_voter_parameters = QVoterParameters(p, q)
-            out, _, _ = init_run_simulation(constants.n_agents,
-                                            constants.n_additional_virtual_links,
-                                            constants.n_steps,
-                                            constants.l1_params,
-                                            q_voter_parameters,
-                                            constants.l2_social_media_params,
-                                            params['metrics'],
-                                            negative_opinion_fraction=constants.negative_opinion_fraction)
-            dead_rate.append(out['dead_ratio'][-1])
-            infected_rate.append(max(out['infected_ratio']))
-            min_infected_rate.append(out['infected_ratio'][-1])
-            opinion_rate.append(out['mean_opinion'][-1])
-        output_dead_rate[(p, q)] = np.mean(dead_rate)
-        output_infected_rate[(p, q)] = np.mean(infected_rate)
-        output_mean_opinion[(p, q)] = np.mean(opinion_rate)
-        logger.info('Last infected rate: {}'.format(np.mean(min_infected_rate)))
-        end = time.time()
-        logger.info(f'Elapsed: {end - start} s')
-    return output_dead_rate, output_infected_rate, output_mean_opinion
+    profile = RunProfile() if params.get('profile') else None
+    shared_topology = get_shared_topology(params.get('shared_topologies'), get_streams(streams).numpy)
+    topology_cache = get_topology_cache(constants.topology_pool_size, constants.topology_cache_dir)
+    metrics = dict(params['metrics'], last_infected_ratio=params['metrics']['infected_ratio'])
+    q_voter_parameters = QVoterParameters(p, q, constants.l2_voter_params.panel)
+    out, _, _ = init_run_simulation(constants.n_agents,
+                                    constants.n_additional_virtual_links,
+                                    constants.n_steps,
+                                    constants.l1_params,
+                                    q_voter_parameters,
+                                    constants.l2_social_media_params,
+                                    metrics,
+                                    negative_opinion_fraction=constants.negative_opinion_fraction,
+                                    network_m=constants.network_m,
+                                    network_p=constants.network_p,
+                                    comorbid_disease_A_fraction=constants.comorbid_disease_A_fraction,
+                                    comorbid_disease_B_fraction=constants.comorbid_disease_B_fraction,
+                                    sinks=SUMMARY_SINKS,
+                                    backend=constants.backend,
+                                    return_graphs=False,
+                                    topology_cache=topology_cache,
+                                    shared_topology=shared_topology,
+                                    streams=streams,
+                                    profile=profile)
+    if profile is not None:
+        out.update(profile.to_dict())
+    end = time.time()
+    logger.debug(f'q={q}, p={p} in process {mp.current_process().name}: '
+                 f'last infected rate {out["last_infected_ratio"]}, elapsed {end - start} s')
+    return out
 
 
 if __name__ == '__main__':
@@ -1,4 +1,5 @@
 from scripts.epidemic_metrics import *
+from scripts.metric_sinks import TrajectoryRecorder
 from scripts.parameters import *
 from scripts.multilayer.simulation import init_run_simulation
 from scripts.virtual_metrics import *
@@ -21,7 +22,15 @@ N_ADDITIONAL_VIRTUAL_LINKS = 5000
 
 def perform_simulation(l1_params=DEFAULT_L1_PARAMS,
                        l2_voter_params=DEFAULT_L2_VOTER_PARAMS,
-                       l2_social_media_params=DEFAULT_L2_SOCIAL_MEDIA_PARAMS):
+                       l2_social_media_params=DEFAULT_L2_SOCIAL_MEDIA_PARAMS,
+                       trajectory_path: str = None):
+    """
+    :param trajectory_path: record metrics into `.npy` file instead of lists (see `TrajectoryRecorder`), it can be
+                            opened with `load_trajectory` during the simulation
+    """
+    sinks = None
+    if trajectory_path is not None:
+        sinks = TrajectoryRecorder.for_run(trajectory_path, metrics, N_STEPS, N_AGENTS).sinks()
     return init_run_simulation(
         N_AGENTS,
         N_ADDITIONAL_VIRTUAL_LINKS,
@@ -30,4 +39,5 @@ def perform_simulation(l1_params=DEFAULT_L1_PARAMS,
         l2_voter_params,
         l2_social_media_params,
         metrics,
+        sinks=sinks,
         verbose=True)
@@ -0,0 +1,223 @@
+import numpy as np
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+from scripts.agent_state import AgentState, STATUS_LABELS, SUSCEPTIBLE, INFECTED, QUARANTINED, RECOVERED, DEAD
+from scripts.epidemic_metrics import susceptible_ratio, infected_ratio, quarantined_ratio, recovered_ratio, dead_ratio
+from scripts.metric_sinks import create_sinks, collect_results, record_interval
+from scripts.multilayer.transition_rates import get_transition_rates
+from scripts.parameters import *
+from scripts.profiling import RunProfile
+from scripts.random_streams import RandomStreams, get_streams
+from scripts.transition_rates import OPINION_OFFSET
+from scripts.virtual_metrics import mean_opinion
+
+OPINION_SUM_COLUMN = len(STATUS_LABELS)
+
+# Metrics which are recorded inside the compiled loop: metric function -> column of recorded counts
+RECORDED_METRICS = {susceptible_ratio: SUSCEPTIBLE,
+                    infected_ratio: INFECTED,
+                    quarantined_ratio: QUARANTINED,
+                    recovered_ratio: RECOVERED,
+                    dead_ratio: DEAD,
+                    mean_opinion: OPINION_SUM_COLUMN}
+
+# Codes of `QVoterParameters.panel` in the compiled loop
+Q_PANEL_CODES = {panel: code for code, panel in enumerate(Q_PANELS)}
+FIRST_NEIGHBOURS_CODE = Q_PANEL_CODES[FIRST_NEIGHBOURS]
+WITH_REPLACEMENT_CODE = Q_PANEL_CODES[WITH_REPLACEMENT]
+
+
+def _jit(function):
+    return numba.njit(cache=True)(function) if numba is not None else function
+
+
+def is_available():
+    return numba is not None
+
+
+def run_jit(state: AgentState,
+            steps: int,
+            l1_params: PhysicalLayerParameters,
+            l2_voter_params: QVoterParameters,
+            l2_social_media_params: SocialMediaParameters,
+            metrics: dict,
+            record_every=1,
+            sinks: dict = None,
+            early_stop=True,
+            streams: RandomStreams = None,
+            profile: RunProfile = None,
+            verbose=False,
+            seed: int = None):
+    """
+    Compiled version of `run_state` with the same random sequential updates of single agents. The whole loop runs in
+    numba with its own random number generator seeded with `seed` (drawn from the python stream of `streams` when not given).
+
+    Only metrics from `RECORDED_METRICS` are supported. Requires numba (see `is_available`).
+
+    :param state: AgentState with both layers
+    :param steps: number of simulation steps
+    :param l1_params: parameters for l1_layer
+    :param l2_voter_params: parameters for voter model in l2_layer
+    :param l2_social_media_params: parameters for social media in l2_layer (not used, see `_social_media_layer_step`)
+    :param metrics: the same format as in `run`
+    :param record_every: number of steps between recorded metrics (see `run`)
+    :param sinks: reducers of recorded metrics (see `run`)
+    :param early_stop: skip the epidemic after it ended (see `run`)
+    :param streams: random number streams (see `run`)
+    :param profile: RunProfile (see `run`), the compiled loop is not instrumented, only links removed by quarantine
+                    are counted
+    :param verbose: print simulation status
+    :param seed: seed of the random number generator
+    :return: output_metrics and state
+    """
+    unsupported = [m for m, (_, metrics_function) in metrics.items() if metrics_function not in RECORDED_METRICS]
+    if unsupported:
+        raise ValueError(f'Metrics not supported by numba backend: {unsupported}')
+
+    if seed is None:
+        seed = get_streams(streams).python.randrange(2 ** 32)
+    interval = record_interval(record_every, state.n_agents)
+    n_records = steps // interval + (1 if steps % interval else 0)
+    records = np.zeros((n_records, OPINION_SUM_COLUMN + 1), dtype=np.int64)
+    rates = get_transition_rates(state, l1_params)
+    evolve_opinions = any(layer == 'l2_layer' for layer, _ in metrics.values())
+
+    if verbose:
+        print('Running {} steps in numba'.format(steps))
+    if profile is not None:
+        active_links = state.l1.n_active_links() + state.l2.n_active_links()
+    _run_kernel(steps, seed, interval, records, early_stop, evolve_opinions,
+                state.status, state.infected_time, state.opinion,
+                state.l1.indptr, state.l1.indices, state.l1.active_agents,
+                state.l2.indptr, state.l2.indices, state.l2.active_agents,
+                rates.beta_by_opinion, rates.gamma, rates.mu, rates.kappa, l1_params.max_infected_time,
+                l2_voter_params.p_p, l2_voter_params.q, Q_PANEL_CODES[l2_voter_params.panel],
+                np.empty(max(np.diff(state.l2.indptr).max(initial=0), 1), dtype=state.l2.indices.dtype))
+    state.recount()
+    if profile is not None:
+        profile.removed_links += active_links - state.l1.n_active_links() - state.l2.n_active_links()
+
+    output_sinks = create_sinks(metrics, sinks)
+    for metrics_name, (_, metrics_function) in metrics.items():
+        values = records[:, RECORDED_METRICS[metrics_function]] / state.n_agents
+        output_sinks[metrics_name].extend(values.tolist())
+    return collect_results(output_sinks), state
+
+
+@_jit
+def _run_kernel(steps, seed, interval, records, early_stop, evolve_opinions,
+                status, infected_time, opinion,
+                l1_indptr, l1_indices, l1_active,
+                l2_indptr, l2_indices, l2_active,
+                beta, gamma, mu, kappa, max_infected_time,
+                p_p, q, panel, neighbours):
+    np.random.seed(seed)
+    n = len(status)
+    counts = np.zeros(OPINION_SUM_COLUMN + 1, dtype=np.int64)
+    for i in range(n):
+        counts[status[i]] += 1
+        counts[OPINION_SUM_COLUMN] += opinion[i]
+
+    record = 0
+    epidemic_ended = False
+    for step in range(steps):
+        node = np.random.randint(0, n)
+
+        # l2 layer, q-voter model
+        if np.random.random() < p_p:
+            if np.random.random() < 0.5:
+                counts[OPINION_SUM_COLUMN] -= 2 * opinion[node]
+                opinion[node] = -opinion[node]
+        else:
+            panel_size = 0
+            panel_sum = 0
+            # links of inactive (quarantined) agents are switched off in both directions
+            last = l2_indptr[node + 1] if l2_active[node] else l2_indptr[node]
+            if panel == FIRST_NEIGHBOURS_CODE:
+                # Repeating neighbours of agents with less than `q` neighbours does not change whether the panel
+                # is unanimous, so only the first `q` neighbours are checked
+                for i in range(l2_indptr[node], last):
+                    if panel_size == q:
+                        break
+                    if l2_active[l2_indices[i]]:
+                        panel_size += 1
+                        panel_sum += opinion[l2_indices[i]]
+            else:
+                degree = 0
+                for i in range(l2_indptr[node], last):
+                    if l2_active[l2_indices[i]]:
+                        neighbours[degree] = l2_indices[i]
+                        degree += 1
+                if degree > 0 and panel == WITH_REPLACEMENT_CODE:
+                    panel_size = q
+                    for _ in range(q):
+                        panel_sum += opinion[neighbours[np.random.randint(0, degree)]]
+                elif degree > 0:
+                    # partial Fisher-Yates shuffle of active neighbours
+                    panel_size = min(q, degree)
+                    for j in range(panel_size):
+                        r = np.random.randint(j, degree)
+                        neighbours[j], neighbours[r] = neighbours[r], neighbours[j]
+                        panel_sum += opinion[neighbours[j]]
+            if panel_size > 0 and abs(panel_sum) == panel_size:
+                new_opinion = 1 if panel_sum > 0 else -1
+                counts[OPINION_SUM_COLUMN] += new_opinion - opinion[node]
+                opinion[node] = new_opinion
+
+        # l1 layer, epidemic
+        node_status = status[node]
+        if epidemic_ended:
+            pass
+        elif node_status == SUSCEPTIBLE:
+            # susceptible agents are always active
+            p_infection = beta[opinion[node] + OPINION_OFFSET]
+            for i in range(l1_indptr[node], l1_indptr[node + 1]):
+                if l1_active[l1_indices[i]] and status[l1_indices[i]] == INFECTED:
+                    if np.random.random() < p_infection:
+                        status[node] = INFECTED
+                        counts[SUSCEPTIBLE] -= 1
+                        counts[INFECTED] += 1
+                        break
+        elif node_status == INFECTED:
+            if opinion[node] == 1:
+                infected_time[node] += 5
+            elif opinion[node] == -1:
+                infected_time[node] += 1
+            if infected_time[node] >= max_infected_time:
+                new_status = INFECTED
+                if np.random.random() < gamma[node]:
+                    new_status = QUARANTINED
+                    l1_active[node] = False
+                    l2_active[node] = False
+                elif np.random.random() < kappa[node]:
+                    new_status = DEAD
+                elif np.random.random() < mu[node]:
+                    new_status = RECOVERED
+                status[node] = new_status
+                counts[INFECTED] -= 1
+                counts[new_status] += 1
+        elif node_status == QUARANTINED:
+            new_status = QUARANTINED
+            if np.random.random() < mu[node]:
+                new_status = RECOVERED
+            elif np.random.random() < kappa[node]:
+                new_status = DEAD
+            status[node] = new_status
+            counts[QUARANTINED] -= 1
+            counts[new_status] += 1
+
+        if (step + 1) % interval == 0 or step == steps - 1:
+            records[record, :] = counts
+            record += 1
+
+        if early_stop and not epidemic_ended and counts[INFECTED] + counts[QUARANTINED] == 0:
+            epidemic_ended = True
+            if not evolve_opinions:
+                # statuses cannot change anymore, the remaining records are the same
+                for i in range(record, len(records)):
+                    records[i, :] = counts
+                break
@@ -1,6 +1,3 @@
-import numpy as np
-import pandas as pd
-
 from scripts.parameters import *
 
 
@@ -16,16 +13,28 @@ def format_parameters(l1_params: PhysicalLayerParameters,
            + f'_NAGENTS={n_agents}' + f'_NFRACLINKS={frac_additional_virtual_links}'
 
 
-def save_results(output_dead_rate: dict, output_infected_rate: dict, output_mean_opinion, params1, params2, path: str):
-    output_dead_rate = _format_result(output_dead_rate, params1, params2)
-    output_infected_rate = _format_result(output_infected_rate, params1, params2)
-    output_mean_opinion = _format_result(output_mean_opinion, params1, params2)
-    output_dead_rate.to_csv('dead_ratio_' + path)
-    output_infected_rate.to_csv('infected_ratio_' + path)
-    output_mean_opinion.to_csv('mean_opinion_' + path)
-
-
-def _format_result(output_results: dict, params1, params2):
-    output_results = np.array(list(output_results.values())).reshape(len(params1), len(params2))
-    output_results = pd.DataFrame(output_results, index=params1, columns=params2)
-    return output_results
+def parameter_columns(l1_params: PhysicalLayerParameters,
+                      l2_voter_params: QVoterParameters,
+                      l2_social_media_params: SocialMediaParameters,
+                      n_steps: int,
+                      n_agents: int,
+                      frac_additional_virtual_links: float,
+                      negative_opinion_fraction: float):
+    """
+    Values of all parameters of the multilayer model as dataset columns (see `scripts.dataset.realisations_to_frame`)
+    """
+    return {'model': 'multilayer',
+            'beta': l1_params.p_beta,
+            'gamma': l1_params.p_gamma,
+            'mu': l1_params.p_mu,
+            'kappa': l1_params.p_kappa,
+            'max_infected_time': l1_params.max_infected_time,
+            'q': l2_voter_params.q,
+            'p': l2_voter_params.p_p,
+            'panel': l2_voter_params.panel,
+            'xi': l2_social_media_params.p_xi,
+            'n': l2_social_media_params.n,
+            'n_steps': n_steps,
+            'n_agents': n_agents,
+            'frac_additional_virtual_links': frac_additional_virtual_links,
+            'negative_opinion_fraction': negative_opinion_fraction}
@@ -1,14 +1,25 @@
 import math
 import random
+import time
 import networkx as nx
 import numpy as np
 import copy
 
 import scripts.epidemic_layer as l1
 import scripts.virtual_layer as l2
-from scripts.age_statistics import death_rate_ratio
-from scripts.network import create_bilayer_network
+from scripts.agent_state import AgentState, INFECTED, from_graphs, to_graphs, state_metrics
+from scripts.metric_sinks import create_sinks, collect_results, record_interval, is_recorded, remaining_records, \
+    fast_forward
+from scripts.multilayer import jit
+from scripts.multilayer.synchronous import run_synchronous
+from scripts.multilayer.transition_rates import get_transition_rates
+from scripts.network import create_bilayer_topology
 from scripts.parameters import *
+from scripts.profiling import RunProfile, profile_phase
+from scripts.random_streams import RandomStreams, get_streams
+from scripts.shared_topology import SharedTopology
+from scripts.topology_cache import TopologyCache
+from scripts.transition_rates import TransitionRates
 
 
 def init_run_simulation(n_agents: int,
@@ -22,10 +33,25 @@ def init_run_simulation(n_agents: int,
                         negative_opinion_fraction: float = 0.5,
                         network_m: int = 3,
                         network_p: int = 0.8,
+                        comorbid_disease_A_fraction: float = 0,
+                        comorbid_disease_B_fraction: float = 0,
+                        record_every=1,
+                        sinks: dict = None,
+                        backend: str = 'python',
+                        return_graphs=True,
+                        topology_cache: TopologyCache = None,
+                        shared_topology: SharedTopology = None,
+                        network_seed: int = None,
+                        streams: RandomStreams = None,
+                        early_stop=True,
+                        profile: RunProfile = None,
                         verbose=False):
     """
     Perform COVID-19 simulation on multilayer networks
 
+    Agents are initialized directly in `AgentState` (see `initialize_state`), layers are built as graphs only
+    for the returned result.
+
     :param n_agents: number of agents in each layer
     :param n_additional_virtual_links: number of additional links in virtual layer
     :param steps: number of simulation steps
@@ -38,35 +64,127 @@ def init_run_simulation(n_agents: int,
     :param negative_opinion_fraction: Fraction of agents with negative opinion
     :param network_m: The number of random edges to add for each new node
     :param network_p: Probability of adding the triangle after adding a random edge
+    :param comorbid_disease_A_fraction: Fraction of agents with comorbid disease A
+    :param comorbid_disease_B_fraction: Fraction of agents with comorbid disease B
+    :param record_every: number of steps between recorded metrics (see `run`)
+    :param sinks: reducers of recorded metrics (see `run`)
+    :param backend: simulation backend (see `run`)
+    :param return_graphs: convert final state into layers, otherwise None is returned instead of both layers
+    :param topology_cache: take network topology from the cache instead of generating a new one
+    :param shared_topology: use the topology (and static attributes of agents if they are shared) attached from
+                            another process instead of generating a new one (see `SharedTopology`)
+    :param network_seed: seed of the network topology (default seed of `streams`)
+    :param streams: random number streams of the realisation used by the network, initialization and all steps
+                    (see `RandomStreams`), global random modules when not given
+    :param early_stop: stop the epidemic when no infected agents are left (see `run`)
+    :param profile: RunProfile which collects times of the network creation, initialization and the run (see `run`)
     :param verbose: print simulation status
     :return: output_metrics: format: {'aware_ratio': [0.45, 0.4, ...], 'infected_ratio': [0.4, 0.55, 0.7, ...], ...}
              l1_layer and l2_layer
     """
-    l1_layer, l2_layer = create_bilayer_network(n_agents, n_additional_virtual_links, m=network_m, p=network_p)
-    l1_layer_init = l1.initialize_epidemic(l1_layer)
-    l2_layer_init = l2.initialize_virtual(l2_layer, negative_opinion_fraction)
-    l1_layer_init, l2_layer_init = initialize_bilayer_network(l1_layer_init, l2_layer_init, infected_fraction)
-    return run(l1_layer_init,
-               l2_layer_init,
-               steps,
-               l1_params,
-               l2_voter_params,
-               l2_social_media_params,
-               metrics,
-               verbose)
-
-
-def initialize_bilayer_network(l1_layer, l2_layer, infected_fraction):
+    state = initialize_state(n_agents, n_additional_virtual_links, infected_fraction, negative_opinion_fraction,
+                             network_m, network_p, topology_cache, network_seed, streams, profile, shared_topology,
+                             comorbid_disease_A_fraction, comorbid_disease_B_fraction)
+    run_backend = _get_backend(backend)
+    with profile_phase(profile, 'run'):
+        result = run_backend(state, steps, l1_params, l2_voter_params, l2_social_media_params, metrics,
+                             record_every=record_every, sinks=sinks, early_stop=early_stop, streams=streams,
+                             profile=profile, verbose=verbose)
+    if result is None:
+        return
+    output_metrics, state = result
+    if not return_graphs:
+        return output_metrics, None, None
+    l1_layer, l2_layer = to_graphs(state)
+    return output_metrics, l1_layer, l2_layer
+
+
+def initialize_state(n_agents: int,
+                     n_additional_virtual_links: int,
+                     infected_fraction: float = 0.1,
+                     negative_opinion_fraction: float = 0.5,
+                     network_m: int = 3,
+                     network_p: int = 0.8,
+                     topology_cache: TopologyCache = None,
+                     network_seed: int = None,
+                     streams: RandomStreams = None,
+                     profile: RunProfile = None,
+                     shared_topology: SharedTopology = None,
+                     comorbid_disease_A_fraction: float = 0,
+                     comorbid_disease_B_fraction: float = 0):
+    """
+    Create both layers and initialize all agents (see `init_run_simulation`)
+
+    :return: AgentState
+    """
+    streams = get_streams(streams)
+    static_attributes = shared_topology.attributes if shared_topology is not None else None
+    with profile_phase(profile, 'network'):
+        if shared_topology is not None:
+            l1_adjacency, l2_adjacency = shared_topology.adjacency()
+        elif topology_cache is not None:
+            # without a seed the topology is drawn from the pool of the cache
+            l1_adjacency, l2_adjacency = topology_cache.get(n_agents, n_additional_virtual_links, m=network_m,
+                                                            p=network_p, seed=network_seed,
+                                                            random_state=streams.numpy)
+        else:
+            seed = network_seed if network_seed is not None else streams.network_seed
+            l1_adjacency, l2_adjacency = create_bilayer_topology(n_agents, n_additional_virtual_links, m=network_m,
+                                                                 p=network_p, seed=seed)
+    with profile_phase(profile, 'initialize'):
+        return initialize_agents(AgentState(l1_adjacency, l2_adjacency), infected_fraction,
+                                 negative_opinion_fraction, streams.numpy, static_attributes,
+                                 comorbid_disease_A_fraction, comorbid_disease_B_fraction)
+
+
+def initialize_agents(state: AgentState, infected_fraction: float = 0.1, negative_opinion_fraction: float = 0.5,
+                      random_state=np.random, static_attributes: dict = None, comorbid_disease_A_fraction: float = 0,
+                      comorbid_disease_B_fraction: float = 0):
+    """
+    Initialize attributes, opinions and infected agents of a state with given layers (in place)
+
+    :param state: AgentState
+    :param infected_fraction: Fraction of infected agents
+    :param negative_opinion_fraction: Fraction of agents with negative opinion
+    :param random_state: `np.random` or `np.random.Generator`
+    :param static_attributes: shared attributes of agents (see `initialize_epidemic_state`)
+    :param comorbid_disease_A_fraction: Fraction of agents with comorbid disease A
+    :param comorbid_disease_B_fraction: Fraction of agents with comorbid disease B
+    :return: state
+    """
+    l1.initialize_epidemic_state(state, comorbid_disease_A_fraction, comorbid_disease_B_fraction, random_state,
+                                 static_attributes)
+    l2.initialize_virtual_state(state, negative_opinion_fraction, random_state)
+    return initialize_infected(state, infected_fraction, random_state)
+
+
+def initialize_infected(state: AgentState, infected_fraction, random_state=np.random):
+    """
+    Set `floor(N * infected_fraction)` randomly chosen agents (with repetitions) as infected (in place)
+
+    :param state: AgentState
+    :param infected_fraction:
+    :param random_state: `np.random` or `np.random.Generator`
+    :return: state
+    """
+    infected_size = math.floor(state.n_agents * infected_fraction)
+    state.status[random_state.choice(state.n_agents, size=infected_size)] = INFECTED
+    state.recount()
+    return state
+
+
+def initialize_bilayer_network(l1_layer, l2_layer, infected_fraction, inplace=False):
     """
     Create only one infected and aware agent!
 
     :param l1_layer:
     :param l2_layer:
     :param infected_fraction:
+    :param inplace: modify given layers instead of copies
     :return: l1_layer, l2_layer
     """
-    l1_layer_copy = copy.deepcopy(l1_layer)
-    l2_layer_copy = copy.deepcopy(l2_layer)
+    l1_layer_copy = l1_layer if inplace else copy.deepcopy(l1_layer)
+    l2_layer_copy = l2_layer if inplace else copy.deepcopy(l2_layer)
 
     N = nx.number_of_nodes(l1_layer)
     infected_size = math.floor(N * infected_fraction)
@@ -83,10 +201,18 @@ def run(l1_layer: nx.Graph,
         l2_voter_params: QVoterParameters,
         l2_social_media_params: SocialMediaParameters,
         metrics: dict,
+        record_every=1,
+        sinks: dict = None,
+        backend: str = 'python',
+        early_stop=True,
+        streams: RandomStreams = None,
+        profile: RunProfile = None,
         verbose=False):
     """
     Run `steps` of COVID-19 simulation on both physical (`l1_layer`) and virtual (`l2_layer`) layers.
 
+    Layers are converted into `AgentState` before the simulation and back into graphs afterwards (see `run_state`).
+
     :param l1_layer: physical layer
     :param l2_layer: virtual layer
     :param steps: number of simulation steps
@@ -95,27 +221,119 @@ def run(l1_layer: nx.Graph,
     :param l2_social_media_params: parameters for social media in l2_layer
     :param metrics: format e.g.:
                 {'aware_ratio': ('l1_layer': aware_ratio), 'infected_ratio': ('l2_layer', infected_ratio), ... }
+    :param record_every: number of steps between recorded metrics or `MC_SWEEP` to record once per Monte-Carlo
+                         sweep, the last step is always recorded
+    :param sinks: reducers of recorded metrics from `scripts.metric_sinks`, e.g.:
+                {'dead_ratio': LastSink, 'infected_ratio': MaxSink}, metrics without sink keep all values
+    :param backend: 'python' - random sequential updates of single agents (see `run_state`),
+                    'synchronous' - vectorized updates of all agents once per Monte-Carlo sweep (see `run_synchronous`),
+                    'numba' - compiled random sequential updates (see `run_jit`), 'python' when numba is not installed
+    :param early_stop: when there are no infected and quarantined agents statuses cannot change anymore, so
+                       the remaining steps only evolve opinions if any l2_layer metric is recorded, otherwise
+                       the simulation stops and the last values of metrics are recorded for the remaining steps
+    :param streams: random number streams of the realisation (see `RandomStreams`), global random modules when
+                    not given
+    :param profile: `RunProfile` filled with the time of the whole run, 'python' and 'synchronous' backends also
+                    measure steps of both layers and metrics and count transitions, opinion changes and links
+                    removed by quarantine, the simulation is not instrumented when not given
     :param verbose: print simulation status
     :return: output_metrics: format: {'aware_ratio': [0.45, 0.4, ...], 'infected_ratio': [0.4, 0.55, 0.7, ...], ...}
              l1_layer and l2_layer
     """
-    output_metrics = {m: [] for m in metrics.keys()}
+    state = from_graphs(l1_layer, l2_layer)
+    run_backend = _get_backend(backend)
+    with profile_phase(profile, 'run'):
+        result = run_backend(state, steps, l1_params, l2_voter_params, l2_social_media_params, metrics,
+                             record_every=record_every, sinks=sinks, early_stop=early_stop, streams=streams,
+                             profile=profile, verbose=verbose)
+    if result is None:
+        return
+    output_metrics, state = result
+    l1_layer, l2_layer = to_graphs(state)
+    return output_metrics, l1_layer, l2_layer
+
+
+def _get_backend(backend: str):
+    if backend == 'python':
+        return run_state
+    elif backend == 'synchronous':
+        return run_synchronous
+    elif backend == 'numba':
+        return jit.run_jit if jit.is_available() else run_state
+    raise ValueError(f'Unsupported backend: {backend}')
+
+
+def run_state(state: AgentState,
+              steps: int,
+              l1_params: PhysicalLayerParameters,
+              l2_voter_params: QVoterParameters,
+              l2_social_media_params: SocialMediaParameters,
+              metrics: dict,
+              record_every=1,
+              sinks: dict = None,
+              early_stop=True,
+              streams: RandomStreams = None,
+              profile: RunProfile = None,
+              verbose=False):
+    """
+    Run `steps` of COVID-19 simulation on the array-backed state of both layers. `state` is modified in place.
+
+    :param state: AgentState with both layers
+    :param steps: number of simulation steps
+    :param l1_params: parameters for l1_layer
+    :param l2_voter_params: parameters for voter model in l2_layer
+    :param l2_social_media_params: parameters for social media in l2_layer
+    :param metrics: the same format as in `run`, metric functions are called with `state`
+                    (see `state_metrics`)
+    :param record_every: number of steps between recorded metrics (see `run`)
+    :param sinks: reducers of recorded metrics (see `run`)
+    :param early_stop: skip the epidemic after it ended (see `run`)
+    :param streams: random number streams (see `run`)
+    :param profile: RunProfile of steps, metrics and events (see `run`)
+    :param verbose: print simulation status
+    :return: output_metrics and state
+    """
+    rng = get_streams(streams).python
+    interval = record_interval(record_every, state.n_agents)
+    metrics = state_metrics(metrics)
+    output_sinks = create_sinks(metrics, sinks)
+    rates = get_transition_rates(state, l1_params)
+    evolve_opinions = any(layer == 'l2_layer' for layer, _ in metrics.values())
+    epidemic_ended = False
     for step in range(steps):
-        _single_step(step, l1_layer, l2_layer, l1_params, l2_voter_params, l2_social_media_params)
+        if profile is not None:
+            _profiled_single_step(state, rates, l1_params, l2_voter_params, epidemic_ended, profile, rng)
+        elif epidemic_ended:
+            # the epidemic layer step does not change anything and does not draw random numbers anymore
+            _virtual_layer_step(rng.randint(0, state.n_agents - 1), state, l2_voter_params, rng)
+        else:
+            _single_step(step, state, rates, l1_params, l2_voter_params, l2_social_media_params, rng)
 
         if verbose:
             _print_simulation_status(step, steps)
 
-        for metrics_name, (layer, metrics_function) in metrics.items():
-            if layer == 'l1_layer':
-                output_metrics[metrics_name].append(metrics_function(l1_layer))
-            elif layer == 'l2_layer':
-                output_metrics[metrics_name].append(metrics_function(l2_layer))
-            else:
-                print('Unsupported layer name')
-                return
-
-    return output_metrics, l1_layer, l2_layer
+        if is_recorded(step, steps, interval):
+            start = time.perf_counter() if profile is not None else None
+            for metrics_name, (layer, metrics_function) in metrics.items():
+                if layer == 'l1_layer' or layer == 'l2_layer':
+                    output_sinks[metrics_name].append(metrics_function(state))
+                else:
+                    print('Unsupported layer name')
+                    return
+            if profile is not None:
+                profile.add_time('metrics', time.perf_counter() - start)
+
+        if early_stop and not epidemic_ended and state.counters.epidemic_ended():
+            epidemic_ended = True
+            if verbose:
+                print('Epidemic ended at step: {} / {}'.format(step, steps))
+            if not evolve_opinions:
+                values = {metrics_name: metrics_function(state)
+                          for metrics_name, (_, metrics_function) in metrics.items()}
+                fast_forward(output_sinks, values, remaining_records(step, steps, interval))
+                break
+
+    return collect_results(output_sinks), state
 
 
 def _print_simulation_status(step: int, steps: int, num=10):
@@ -124,140 +342,121 @@ def _print_simulation_status(step: int, steps: int, num=10):
 
 
 def _single_step(step,
-                 l1_layer: nx.Graph,
-                 l2_layer: nx.Graph,
+                 state: AgentState,
+                 rates: TransitionRates,
                  l1_params: PhysicalLayerParameters,
                  l2_voter_params: QVoterParameters,
-                 l2_social_media_params: SocialMediaParameters):
-    N = l1_layer.number_of_nodes()
-    random_node = random.randint(0, N - 1)
-    # _social_media_layer_step(step, l2_layer, l2_social_media_params) # For not it is not working
-    _virtual_layer_step(random_node, l2_layer, l2_voter_params)
-    _epidemic_layer_step(random_node, l1_layer, l2_layer, l1_params)
+                 l2_social_media_params: SocialMediaParameters,
+                 rng=random):
+    random_node = rng.randint(0, state.n_agents - 1)
+    # _social_media_layer_step(step, state, l2_social_media_params) # For not it is not working
+    _virtual_layer_step(random_node, state, l2_voter_params, rng)
+    _epidemic_layer_step(random_node, state, rates, l1_params, rng)
+
+
+def _profiled_single_step(state: AgentState,
+                          rates: TransitionRates,
+                          l1_params: PhysicalLayerParameters,
+                          l2_voter_params: QVoterParameters,
+                          epidemic_ended: bool,
+                          profile: RunProfile,
+                          rng=random):
+    # the same random numbers as `_single_step` (or only the virtual layer step after the epidemic ended)
+    random_node = rng.randint(0, state.n_agents - 1)
+    opinion = state.opinion[random_node]
+    start = time.perf_counter()
+    _virtual_layer_step(random_node, state, l2_voter_params, rng)
+    profile.add_time('virtual_layer', time.perf_counter() - start)
+    if state.opinion[random_node] != opinion:
+        profile.opinion_changes += 1
+    if epidemic_ended:
+        return
 
+    status = state.status[random_node]
+    degree = state.l1.degree(random_node) + state.l2.degree(random_node) if status == INFECTED else 0
+    start = time.perf_counter()
+    _epidemic_layer_step(random_node, state, rates, l1_params, rng)
+    profile.add_time('epidemic_layer', time.perf_counter() - start)
+    profile.count_agent_transition(status, state.status[random_node], degree)
 
-def _social_media_layer_step(step, l2_layer: nx.Graph, l2_social_media_params: SocialMediaParameters):
+
+def _social_media_layer_step(step, state: AgentState, l2_social_media_params: SocialMediaParameters):
     # Social media can influence every agent
     if step % l2_social_media_params.n == 0:
-        for n in l2_layer.nodes:
+        for n in range(state.n_agents):
             if random.random() < l2_social_media_params.p_xi:
                 pass  # TODO: implement influence on opinion
 
 
 def _virtual_layer_step(random_node,
-                        l2_layer: nx.Graph,
-                        l2_voter_params: QVoterParameters):
-    if random.random() < l2_voter_params.p_p:
-        _voter_act_non_conformity(random_node, l2_layer)
+                        state: AgentState,
+                        l2_voter_params: QVoterParameters,
+                        rng=random):
+    if rng.random() < l2_voter_params.p_p:
+        _voter_act_non_conformity(random_node, state, rng)
     else:
-        _voter_act_conformity(random_node, l2_layer, l2_voter_params)
+        _voter_act_conformity(random_node, state, l2_voter_params, rng)
 
 
-def _voter_act_non_conformity(random_node, l2_layer: nx.Graph):
-    if random.random() < 0.5:
-        l2.flip_opinion(l2_layer, random_node)
+def _voter_act_non_conformity(random_node, state: AgentState, rng=random):
+    if rng.random() < 0.5:
+        l2.flip_opinion(state, random_node)
 
 
-def _voter_act_conformity(random_node, l2_layer: nx.Graph, l2_voter_params: QVoterParameters):
-    neighbours = list(l2_layer.neighbors(random_node))
+def _voter_act_conformity(random_node, state: AgentState, l2_voter_params: QVoterParameters, rng=random):
+    neighbours = state.l2.neighbors(random_node)
     if len(neighbours) < 1:  # when the selected node is isolated
         return
-    # Add the same neighbours if `random_node` does not have more than `q` neighbours
-    if len(neighbours) > l2_voter_params.q:
-        neighbours = neighbours[:l2_voter_params.q]
-    while len(neighbours) < l2_voter_params.q:
-        neighbours.append(random.choice(neighbours))
-    neighbours_opinions = sum([l2.get_opinion(l2_layer, n) for n in neighbours])
-    if neighbours_opinions == len(neighbours):
-        l2.set_positive_opinion(l2_layer, random_node)
-    elif neighbours_opinions == -len(neighbours):
-        l2.set_negative_opinion(l2_layer, random_node)
-
-
-def _epidemic_layer_step(random_node, l1_layer: nx.Graph, l2_layer: nx.Graph, l1_params: PhysicalLayerParameters):
-    l1_node_status = l1.get_status(l1_layer, random_node)
-    age = l1.get_age(l1_layer, random_node)
-    opinion = l2.get_opinion(l2_layer, random_node)
-    is_disease_A = l1.get_comorbid_disease_A(l1_layer, random_node)
-    is_disease_B = l1.get_comorbid_disease_B(l1_layer, random_node)
+    panel = _q_panel(neighbours, l2_voter_params, rng)
+    neighbours_opinions = int(state.opinion[panel].sum())
+    if neighbours_opinions == len(panel):
+        l2.set_positive_opinion(state, random_node)
+    elif neighbours_opinions == -len(panel):
+        l2.set_negative_opinion(state, random_node)
+
+
+def _q_panel(neighbours: np.ndarray, l2_voter_params: QVoterParameters, rng=random) -> np.ndarray:
+    q = l2_voter_params.q
+    k = len(neighbours)
+    if l2_voter_params.panel == WITH_REPLACEMENT:
+        return neighbours[[rng.randrange(k) for _ in range(q)]]
+    elif l2_voter_params.panel == WITHOUT_REPLACEMENT:
+        return neighbours[rng.sample(range(k), q)] if k > q else neighbours
+    # Repeating neighbours of agents with less than `q` neighbours does not change whether the panel is unanimous,
+    # they are only drawn to keep the same random numbers as the original panel padded with random neighbours
+    for size in range(k, q):
+        rng.randrange(size)
+    return neighbours[:q]
+
+
+def _epidemic_layer_step(random_node, state: AgentState, rates: TransitionRates, l1_params: PhysicalLayerParameters,
+                         rng=random):
+    l1_node_status = l1.get_status(state, random_node)
+    opinion = l2.get_opinion(state, random_node)
 
     if l1_node_status == 'S':
-        # Check whether any neighbour is infected
-        for neighbour in l1_layer.neighbors(random_node):
-            if l1.get_status(l1_layer, neighbour) == 'I':
-                if random.random() < _get_combined_beta_probability(l1_params.p_beta, opinion):
-                    l1.set_infected(l1_layer, random_node)
-                    break
+        # Every infected neighbour is a separate chance of infection
+        neighbours = state.l1.neighbors(random_node)
+        infected_neighbours = np.count_nonzero(state.status[neighbours] == INFECTED)
+        for _ in range(infected_neighbours):
+            if rng.random() < rates.beta(opinion):
+                l1.set_infected(state, random_node)
+                break
     elif l1_node_status == 'I':
-        l1.increment_infected_time(l1_layer, random_node, opinion)
-        if l1.get_infected_time(l1_layer, random_node) >= l1_params.max_infected_time:
-            if random.random() < _get_combined_gamma_probability(l1_params.p_gamma):  # I -> Q
-                l1.set_quarantined(l1_layer, random_node)
-                # remove all links in both layers if agent goes into quarantined state
-                links = list(l1_layer.edges(random_node))
-                l1_layer.remove_edges_from(links)
-                links = list(l2_layer.edges(random_node))
-                l2_layer.remove_edges_from(links)
-            elif random.random() < _get_combined_kappa_probability(l1_params.p_kappa, age, is_disease_A,
-                                                                   is_disease_B):  # I -> R
-                l1.set_dead(l1_layer, random_node)
-            elif random.random() < _get_combined_mu_probability(l1_params.p_mu, age, is_disease_A,
-                                                                is_disease_B):  # I -> D
-                l1.set_recovered(l1_layer, random_node)
+        l1.increment_infected_time(state, random_node, opinion)
+        if l1.get_infected_time(state, random_node) >= l1_params.max_infected_time:
+            if rng.random() < rates.gamma[random_node]:  # I -> Q
+                l1.set_quarantined(state, random_node)
+                # switch off all links in both layers if agent goes into quarantined state
+                state.l1.isolate(random_node)
+                state.l2.isolate(random_node)
+            elif rng.random() < rates.kappa[random_node]:  # I -> R
+                l1.set_dead(state, random_node)
+            elif rng.random() < rates.mu[random_node]:  # I -> D
+                l1.set_recovered(state, random_node)
 
     elif l1_node_status == 'Q':
-        if random.random() < _get_combined_mu_probability(l1_params.p_mu, age, is_disease_A, is_disease_B):
-            l1.set_recovered(l1_layer, random_node)
-        elif random.random() < _get_combined_kappa_probability(l1_params.p_kappa, age, is_disease_A, is_disease_B):
-            l1.set_dead(l1_layer, random_node)
-
-
-def _get_combined_beta_probability(p_beta: float, opinion):
-    """
-    S -> I
-    :param p_beta:
-    :param opinion: positive opinion reduce the probability of infection
-    :return: combined infected probability
-    """
-    opinion_rate = 1
-    if opinion == 1:
-        opinion_rate /= 2
-
-    return p_beta * opinion_rate
-
-
-def _get_combined_gamma_probability(p_gamma: float):
-    """
-    I -> Q
-    """
-    return p_gamma
-
-
-def _get_combined_mu_probability(p_mu: float, age: int, is_disease_A: bool, is_disease_B: bool):
-    """
-    I -> R, Q -> R
-    """
-    # TODO: For not we neglect the comorbidity
-    # comoribidities_rate = _comorbid_rate(is_disease_A, is_disease_B)
-    # death_rate = death_rate_ratio(age)
-    return p_mu
-
-
-def _get_combined_kappa_probability(p_kappa, age, is_disease_A: bool, is_disease_B: bool):
-    """
-    I -> D, Q -> D
-    """
-    # comoribidities_rate = _comorbid_rate(is_disease_A, is_disease_B)
-    death_rate = death_rate_ratio(age)
-    return p_kappa * death_rate
-
-
-def _comorbid_rate(is_disease_A: bool, is_disease_B: bool):
-    comoribidities_rate = 1.0
-    if is_disease_A and is_disease_B:
-        comoribidities_rate *= 3
-    elif is_disease_A:
-        comoribidities_rate *= 1.5
-    elif is_disease_B:
-        comoribidities_rate *= 2
-    return comoribidities_rate
+        if rng.random() < rates.mu[random_node]:
+            l1.set_recovered(state, random_node)
+        elif rng.random() < rates.kappa[random_node]:
+            l1.set_dead(state, random_node)
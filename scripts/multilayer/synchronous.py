@@ -0,0 +1,228 @@
+import math
+import time
+
+import numpy as np
+from scipy.sparse import csr_matrix
+
+from scripts.agent_state import AgentState, CSRAdjacency, SUSCEPTIBLE, INFECTED, QUARANTINED, RECOVERED, DEAD, \
+    state_metrics
+from scripts.metric_sinks import create_sinks, collect_results, record_interval, fast_forward
+from scripts.multilayer.transition_rates import get_transition_rates
+from scripts.parameters import *
+from scripts.profiling import RunProfile
+from scripts.random_streams import RandomStreams, get_streams
+from scripts.transition_rates import TransitionRates
+
+
+def run_synchronous(state: AgentState,
+                    steps: int,
+                    l1_params: PhysicalLayerParameters,
+                    l2_voter_params: QVoterParameters,
+                    l2_social_media_params: SocialMediaParameters,
+                    metrics: dict,
+                    record_every=1,
+                    sinks: dict = None,
+                    early_stop=True,
+                    streams: RandomStreams = None,
+                    profile: RunProfile = None,
+                    verbose=False):
+    """
+    Synchronous version of `run_state`. Every Monte-Carlo sweep (`state.n_agents` steps) updates all agents at once
+    from the state at the beginning of the sweep, first opinions in l2 layer and then statuses in l1 layer.
+
+    Metrics are recorded at most once per sweep, `steps` is rounded up to the full sweep.
+
+    :param state: AgentState with both layers
+    :param steps: number of simulation steps
+    :param l1_params: parameters for l1_layer
+    :param l2_voter_params: parameters for voter model in l2_layer
+    :param l2_social_media_params: parameters for social media in l2_layer (not used, see `_social_media_layer_step`)
+    :param metrics: the same format as in `run`, metric functions are called with `state`
+                    (see `state_metrics`)
+    :param record_every: number of steps between recorded metrics (see `run`)
+    :param sinks: reducers of recorded metrics (see `run`)
+    :param early_stop: skip the epidemic after it ended (see `run`)
+    :param streams: random number streams (see `run`)
+    :param profile: RunProfile of sweeps, metrics and events (see `run`), events are counted from the difference of
+                    states before and after every sweep
+    :param verbose: print simulation status
+    :return: output_metrics and state
+    """
+    random_state = get_streams(streams).numpy
+    n = state.n_agents
+    sweeps = math.ceil(steps / n)
+    interval = record_interval(record_every, n)
+    metrics = state_metrics(metrics)
+    output_sinks = create_sinks(metrics, sinks)
+    l1_matrix = _adjacency_matrix(state.l1)
+    l2_rows = state.l2.row_indices()
+    rates = get_transition_rates(state, l1_params)
+    evolve_opinions = any(layer == 'l2_layer' for layer, _ in metrics.values())
+    epidemic_ended = False
+    for sweep in range(sweeps):
+        if profile is not None:
+            _profiled_sweep(state, l1_matrix, l2_rows, rates, l1_params, l2_voter_params, epidemic_ended, profile,
+                            random_state)
+        else:
+            _virtual_layer_sweep(state, l2_rows, l2_voter_params, random_state)
+            if not epidemic_ended:
+                _epidemic_layer_sweep(state, l1_matrix, rates, l1_params, random_state)
+        state.recount()
+
+        if verbose:
+            print('Sweep: {} / {}'.format(sweep, sweeps))
+
+        if _is_recorded_sweep(sweep, sweeps, steps, n, interval):
+            start = time.perf_counter() if profile is not None else None
+            for metrics_name, (layer, metrics_function) in metrics.items():
+                if layer == 'l1_layer' or layer == 'l2_layer':
+                    output_sinks[metrics_name].append(metrics_function(state))
+                else:
+                    print('Unsupported layer name')
+                    return
+            if profile is not None:
+                profile.add_time('metrics', time.perf_counter() - start)
+
+        if early_stop and not epidemic_ended and state.counters.epidemic_ended():
+            epidemic_ended = True
+            if not evolve_opinions:
+                values = {metrics_name: metrics_function(state)
+                          for metrics_name, (_, metrics_function) in metrics.items()}
+                n_records = sum(_is_recorded_sweep(s, sweeps, steps, n, interval) for s in range(sweep + 1, sweeps))
+                fast_forward(output_sinks, values, n_records)
+                break
+
+    return collect_results(output_sinks), state
+
+
+def _profiled_sweep(state: AgentState, l1_matrix, l2_rows, rates: TransitionRates, l1_params: PhysicalLayerParameters,
+                    l2_voter_params: QVoterParameters, epidemic_ended: bool, profile: RunProfile,
+                    random_state=np.random):
+    opinion = state.opinion.copy()
+    start = time.perf_counter()
+    _virtual_layer_sweep(state, l2_rows, l2_voter_params, random_state)
+    profile.add_time('virtual_layer', time.perf_counter() - start)
+    profile.opinion_changes += int(np.count_nonzero(state.opinion != opinion))
+    if epidemic_ended:
+        return
+
+    status = state.status.copy()
+    active_links = state.l1.n_active_links() + state.l2.n_active_links()
+    start = time.perf_counter()
+    _epidemic_layer_sweep(state, l1_matrix, rates, l1_params, random_state)
+    profile.add_time('epidemic_layer', time.perf_counter() - start)
+    changed = status != state.status
+    transitions, counts = np.unique(np.stack((status[changed], state.status[changed])), axis=1, return_counts=True)
+    for (old_status, new_status), count in zip(transitions.T, counts):
+        profile.count_transition(old_status, new_status, int(count))
+    profile.removed_links += active_links - state.l1.n_active_links() - state.l2.n_active_links()
+
+
+def _is_recorded_sweep(sweep: int, sweeps: int, steps: int, n: int, interval: int):
+    first_step, last_step = sweep * n, min((sweep + 1) * n, steps)
+    return last_step // interval != first_step // interval or sweep == sweeps - 1
+
+
+def _adjacency_matrix(adjacency: CSRAdjacency):
+    # the topology does not change during the run, links of inactive agents are switched off by the agent mask
+    return csr_matrix((np.ones(len(adjacency.indices)), adjacency.indices, adjacency.indptr),
+                      shape=(adjacency.n_nodes, adjacency.n_nodes))
+
+
+def _virtual_layer_sweep(state: AgentState, l2_rows, l2_voter_params: QVoterParameters, random_state=np.random):
+    n = state.n_agents
+    independent = random_state.random(n) < l2_voter_params.p_p
+    flip = independent & (random_state.random(n) < 0.5)
+
+    panel_sum, panel_size = _panel_opinion(state.l2, l2_rows, state.opinion, l2_voter_params, random_state)
+    # Repeating neighbours of agents with less than `q` neighbours does not change whether the panel is unanimous
+    unanimous = ~independent & (panel_size > 0) & (np.abs(panel_sum) == panel_size)
+
+    state.opinion[flip] *= -1
+    state.opinion[unanimous] = np.sign(panel_sum[unanimous])
+
+
+def _panel_opinion(adjacency: CSRAdjacency, rows, opinion, l2_voter_params: QVoterParameters,
+                   random_state=np.random):
+    """
+    Sum of opinions and size of q-panel of every agent (see `QVoterParameters.panel`)
+    """
+    if l2_voter_params.panel == WITH_REPLACEMENT:
+        return _sampled_neighbours_opinion(adjacency, rows, opinion, l2_voter_params.q, random_state)
+    elif l2_voter_params.panel == WITHOUT_REPLACEMENT:
+        # the first `q` active neighbours in random order of links of every agent
+        order = np.lexsort((random_state.random(len(rows)), rows))
+        return _first_neighbours_opinion(adjacency, rows, opinion, l2_voter_params.q, order)
+    return _first_neighbours_opinion(adjacency, rows, opinion, l2_voter_params.q)
+
+
+def _first_neighbours_opinion(adjacency: CSRAdjacency, rows, opinion, q: int, order=None):
+    """
+    Sum of opinions and size of q-panel made of the first `q` active neighbours of every agent
+
+    :param order: permutation of links which keeps links of every agent together (the order of links when not given)
+    """
+    active = adjacency.active_links(rows)
+    indices = adjacency.indices
+    if order is not None:
+        active, indices = active[order], indices[order]
+    active_before = np.concatenate(([0], np.cumsum(active)))
+    rank = active_before[1:] - 1 - active_before[adjacency.indptr[:-1]][rows]
+    in_panel = active & (rank < q)
+    panel_rows = rows[in_panel]
+    panel_size = np.bincount(panel_rows, minlength=adjacency.n_nodes)
+    panel_sum = np.bincount(panel_rows, weights=opinion[indices[in_panel]], minlength=adjacency.n_nodes)
+    return panel_sum.astype(np.int64), panel_size
+
+
+def _sampled_neighbours_opinion(adjacency: CSRAdjacency, rows, opinion, q: int, random_state=np.random):
+    """
+    Sum of opinions and size of q-panel made of `q` active neighbours of every agent drawn with repetitions
+    """
+    n = adjacency.n_nodes
+    active = adjacency.active_links(rows)
+    neighbours = adjacency.indices[active]
+    degree = np.bincount(rows[active], minlength=n)
+    first = np.concatenate(([0], np.cumsum(degree)[:-1]))
+    draws = (random_state.random((n, q)) * degree[:, np.newaxis]).astype(np.int64)
+    connected = degree > 0
+    panel_sum = np.zeros(n, dtype=np.int64)
+    panel_sum[connected] = opinion[neighbours[first[connected, np.newaxis] + draws[connected]]].sum(axis=1)
+    return panel_sum, np.where(connected, q, 0)
+
+
+def _epidemic_layer_sweep(state: AgentState, l1_matrix, rates: TransitionRates, l1_params: PhysicalLayerParameters,
+                          random_state=np.random):
+    n = state.n_agents
+    status = state.status
+    susceptible = status == SUSCEPTIBLE
+    infected = status == INFECTED
+    quarantined = status == QUARANTINED
+
+    # S -> I, every infected neighbour is a separate chance of infection
+    active = state.l1.active_agents
+    infected_neighbours = active * (l1_matrix @ (infected & active).astype(np.float64))
+    beta = rates.beta(state.opinion)
+    new_infected = susceptible & (random_state.random(n) < 1 - (1 - beta) ** infected_neighbours)
+
+    # I -> Q, I -> D, I -> R
+    state.infected_time += infected * np.select([state.opinion == 1, state.opinion == -1], [5, 1], 0)
+    eligible = infected & (state.infected_time >= l1_params.max_infected_time)
+    r_gamma, r_kappa, r_mu = random_state.random((3, n))
+    to_quarantine = eligible & (r_gamma < rates.gamma)
+    i_to_dead = eligible & ~to_quarantine & (r_kappa < rates.kappa)
+    i_to_recovered = eligible & ~to_quarantine & ~i_to_dead & (r_mu < rates.mu)
+
+    # Q -> R, Q -> D
+    r_mu, r_kappa = random_state.random((2, n))
+    q_to_recovered = quarantined & (r_mu < rates.mu)
+    q_to_dead = quarantined & ~q_to_recovered & (r_kappa < rates.kappa)
+
+    status[new_infected] = INFECTED
+    status[to_quarantine] = QUARANTINED
+    status[i_to_dead | q_to_dead] = DEAD
+    status[i_to_recovered | q_to_recovered] = RECOVERED
+
+    # switch off all links in both layers of agents which go into quarantined state
+    state.l1.active_agents[to_quarantine] = False
+    state.l2.active_agents[to_quarantine] = False
@@ -0,0 +1,59 @@
+import numpy as np
+
+from scripts.age_statistics import death_rate_ratio
+from scripts.agent_state import AgentState
+from scripts.parameters import PhysicalLayerParameters
+from scripts.transition_rates import TransitionRates, OPINIONS
+
+
+def get_transition_rates(state: AgentState, l1_params: PhysicalLayerParameters) -> TransitionRates:
+    """
+    Probabilities of l1 transitions of all agents in the multilayer model
+
+    :param state: AgentState with initialized agents
+    :param l1_params: parameters for l1_layer
+    :return: TransitionRates
+    """
+    ones = np.ones(state.n_agents)
+    return TransitionRates(
+        _get_combined_beta_probability(l1_params.p_beta, OPINIONS),
+        _get_combined_gamma_probability(l1_params.p_gamma) * ones,
+        _get_combined_mu_probability(l1_params.p_mu, state.age, state.comorbid_A, state.comorbid_B) * ones,
+        _get_combined_kappa_probability(l1_params.p_kappa, state.age, state.comorbid_A, state.comorbid_B) * ones)
+
+
+def _get_combined_beta_probability(p_beta: float, opinion):
+    """
+    S -> I
+    :param p_beta:
+    :param opinion: positive opinion reduce the probability of infection
+    :return: combined infected probability
+    """
+    opinion_rate = np.where(np.asarray(opinion) == 1, 0.5, 1.0)
+    return p_beta * opinion_rate
+
+
+def _get_combined_gamma_probability(p_gamma: float):
+    """
+    I -> Q
+    """
+    return p_gamma
+
+
+def _get_combined_mu_probability(p_mu: float, age, is_disease_A, is_disease_B):
+    """
+    I -> R, Q -> R
+    """
+    # TODO: For not we neglect the comorbidity
+    # comoribidities_rate = comorbid_rate(is_disease_A, is_disease_B)
+    # death_rate = death_rate_ratio(age)
+    return p_mu
+
+
+def _get_combined_kappa_probability(p_kappa, age, is_disease_A, is_disease_B):
+    """
+    I -> D, Q -> D
+    """
+    # comoribidities_rate = comorbid_rate(is_disease_A, is_disease_B)
+    death_rate = death_rate_ratio(age)
+    return p_kappa * death_rate
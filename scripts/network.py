@@ -1,7 +1,9 @@
 import copy
-import random
 
 import networkx as nx
+import numpy as np
+
+from scripts.agent_state import CSRAdjacency
 
 
 def create_bilayer_network(agents: int, additional_virtual_links: int, m=3, p=None):
@@ -17,38 +19,97 @@ def create_bilayer_network(agents: int, additional_virtual_links: int, m=3, p=No
     :param p: probability of adding a triangle after adding a random edge
     :return: tuple (layer1, layer2)
     """
-    if p is None:
-        l1_layer = nx.barabasi_albert_graph(agents, m=m)
-    else:
-        l1_layer = nx.powerlaw_cluster_graph(agents, m=m, p=p)
-    l2_layer = copy.deepcopy(l1_layer)
+    l1_layer = _create_physical_layer(agents, m, p)
+    l2_layer = copy.deepcopy(l1_layer)  # keeps the order of neighbours, unlike nx.Graph.copy
     l2_layer = add_edges_randomly(l2_layer, additional_virtual_links)
     return l1_layer, l2_layer
 
 
+def create_bilayer_topology(agents: int, additional_virtual_links: int, m=3, p=None, seed: int = None):
+    """
+    The same network as in `create_bilayer_network` but only as CSR adjacency of both layers, the virtual layer is
+    never built as a graph. Layers share topology arrays when there are no additional virtual links.
+
+    :param agents: number of individuals
+    :param additional_virtual_links: number of additional edges in virtual layer
+    :param m: starting number of nodes in the BA model
+    :param p: probability of adding a triangle after adding a random edge
+    :param seed: seed of both layers, global random state is used when not given
+    :return: tuple (l1 CSRAdjacency, l2 CSRAdjacency)
+    """
+    l1_layer = _create_physical_layer(agents, m, p, seed)
+    l1 = CSRAdjacency.from_graph(l1_layer)
+    random_state = np.random.RandomState(seed) if seed is not None else np.random
+    new_edges = sample_non_edges(agents, np.array(l1_layer.edges, dtype=np.int64), additional_virtual_links,
+                                 random_state)
+    return l1, l1.with_edges(new_edges)
+
+
+def _create_physical_layer(agents: int, m, p, seed: int = None):
+    if p is None:
+        return nx.barabasi_albert_graph(agents, m=m, seed=seed)
+    return nx.powerlaw_cluster_graph(agents, m=m, p=p, seed=seed)
+
+
 def add_edges_randomly(g: nx.Graph, n_edges: int):
     """
-    Add randomly `n_edges` in `g` graph
+    Add randomly `n_edges` in `g` graph (see `sample_non_edges`)
 
-    :param g: nx.Graph
+    :param g: nx.Graph with nodes labelled 0, 1, ..., N - 1
     :param n_edges:
     :return: modified graph
     """
-    new_edges = []
-    for node in g.nodes:
-        connected = [to for (fr, to) in g.edges(node)]
-        unconnected = [n for n in g.nodes if n not in connected]
-
-        if len(unconnected):
-            if len(new_edges) < n_edges:
-                new = random.choice(unconnected)
-                g.add_edge(node, new)
-                new_edges.append((node, new))
-            else:
-                break
+    new_edges = sample_non_edges(g.number_of_nodes(), np.array(g.edges, dtype=np.int64), n_edges)
+    g.add_edges_from(new_edges.tolist())
     return g
 
 
+def sample_non_edges(n_nodes: int, edges: np.ndarray, n_edges: int, random_state=np.random):
+    """
+    Draw `n_edges` distinct pairs of nodes uniformly at random from pairs which are not connected by `edges`.
+    Self-loops are not allowed. If there are fewer free pairs than `n_edges`, all of them are returned.
+
+    Pairs are encoded as integers `u * n_nodes + v` (u < v) and drawn in batches with rejection of existing edges and
+    duplicates, which takes O(n_edges) time as long as the graph stays sparse. When more than half of the free pairs
+    are requested they are chosen from the explicit list of free pairs instead.
+
+    :param n_nodes: number of nodes
+    :param edges: array of existing edges with shape (E, 2)
+    :param n_edges: number of edges to draw
+    :param random_state: `np.random` or `np.random.RandomState`
+    :return: array of new edges with shape (n_edges, 2) in random order
+    """
+    existing = np.unique(_encode_pairs(n_nodes, edges.reshape(-1, 2)))
+    n_free = n_nodes * (n_nodes - 1) // 2 - len(existing)
+    n_edges = min(int(n_edges), n_free)
+    if n_edges <= 0:
+        return np.empty((0, 2), dtype=np.int64)
+
+    if 2 * n_edges > n_free:
+        u, v = np.triu_indices(n_nodes, k=1)
+        free = np.setdiff1d(u.astype(np.int64) * n_nodes + v, existing, assume_unique=True)
+        sampled = random_state.choice(free, size=n_edges, replace=False)
+    else:
+        sampled = np.empty(0, dtype=np.int64)
+        acceptance = (1 - 1 / n_nodes) * n_free / (n_free + len(existing))
+        while len(sampled) < n_edges:
+            size = int((n_edges - len(sampled)) / acceptance * 1.05) + 16
+            pairs = random_state.randint(0, n_nodes, size=(size, 2))
+            pairs = pairs[pairs[:, 0] != pairs[:, 1]]
+            keys = _encode_pairs(n_nodes, pairs)
+            keys = keys[~np.isin(keys, existing)]
+            sampled = np.concatenate((sampled, keys))
+            _, first = np.unique(sampled, return_index=True)
+            sampled = sampled[np.sort(first)]  # drop duplicates but keep the random order
+        sampled = sampled[:n_edges]
+    return np.column_stack((sampled // n_nodes, sampled % n_nodes))
+
+
+def _encode_pairs(n_nodes: int, pairs: np.ndarray):
+    pairs = pairs.astype(np.int64)
+    return np.minimum(pairs[:, 0], pairs[:, 1]) * n_nodes + np.maximum(pairs[:, 0], pairs[:, 1])
+
+
 def degree_node_size(g: nx.Graph, scale=10):
     """
     Create list of degree-based node sizes list
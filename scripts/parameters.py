@@ -1,5 +1,11 @@
 from dataclasses import dataclass
 
+# Selection of the q-panel of `QVoterParameters`
+FIRST_NEIGHBOURS = 'first'
+WITH_REPLACEMENT = 'with_replacement'
+WITHOUT_REPLACEMENT = 'without_replacement'
+Q_PANELS = (FIRST_NEIGHBOURS, WITH_REPLACEMENT, WITHOUT_REPLACEMENT)
+
 
 @dataclass
 class PhysicalLayerParameters:
@@ -31,14 +37,23 @@ class QVoterParameters:
     p_p: probability that agent acts individually
 
     q: number of neighbours
+
+    panel: how the q-panel is chosen from active neighbours,
+    `FIRST_NEIGHBOURS` - the first `q` neighbours in the order of links (all neighbours when there are less than `q`),
+    `WITH_REPLACEMENT` - `q` neighbours drawn with repetitions,
+    `WITHOUT_REPLACEMENT` - `q` distinct neighbours drawn at random (all neighbours when there are less than `q`)
     """
 
-    def __init__(self, p_p, q):
+    def __init__(self, p_p, q, panel=FIRST_NEIGHBOURS):
+        if panel not in Q_PANELS:
+            raise ValueError(f'Unsupported q-panel: {panel}')
         self.p_p = p_p
         self.q = q
+        self.panel = panel
 
     def __str__(self):
-        return f'q={self.q}_p={self.p_p}'
+        panel = '' if self.panel == FIRST_NEIGHBOURS else f'_panel={self.panel}'
+        return f'q={self.q}_p={self.p_p}' + panel
 
 
 @dataclass
@@ -0,0 +1,96 @@
+import collections
+import contextlib
+import time
+
+import numpy as np
+
+from scripts.agent_state import STATUS_LABELS, INFECTED, QUARANTINED, RECOVERED, DEAD, SUSCEPTIBLE
+
+PHASES = ('network', 'initialize', 'virtual_layer', 'epidemic_layer', 'metrics', 'run')
+TRANSITIONS = ((SUSCEPTIBLE, INFECTED), (INFECTED, QUARANTINED), (INFECTED, RECOVERED), (INFECTED, DEAD),
+               (QUARANTINED, RECOVERED), (QUARANTINED, DEAD))
+
+
+class RunProfile:
+    """Time spent in phases of one simulation and the number of events
+
+    Phases (in seconds):
+    network - creation of the topology (or lookup in the cache),
+    initialize - initialization of agents,
+    virtual_layer - steps of the virtual layer ('python' and 'synchronous' backends),
+    epidemic_layer - steps of the epidemic layer ('python', 'synchronous', 'event' and 'gillespie' backends),
+    metrics - evaluation of recorded metrics ('python' and 'synchronous' backends),
+    run - the whole run of the backend, including the other phases of the run
+
+    Events: transitions in l1 layer and links switched off by quarantine in both layers (all backends except
+    'numba', which counts only removed links), opinion changes ('python' and 'synchronous' backends).
+
+    Timers of single steps add their own overhead, so only the ratio of phases is meaningful, not the sum of them.
+    """
+
+    def __init__(self):
+        self.times = dict.fromkeys(PHASES, 0.0)
+        self.transitions = collections.Counter()
+        self.opinion_changes = 0
+        self.removed_links = 0
+
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.times[name] += time.perf_counter() - start
+
+    def add_time(self, name: str, seconds: float):
+        self.times[name] += seconds
+
+    def count_transition(self, old_status, new_status, count=1):
+        self.transitions[int(old_status), int(new_status)] += count
+
+    def count_agent_transition(self, old_status, new_status, degree: int):
+        """
+        Count the change of status of a single agent
+
+        :param old_status: status before the step
+        :param new_status: status after the step
+        :param degree: number of links of the agent before the step, they are removed when it goes into quarantine
+        """
+        if new_status != old_status:
+            self.count_transition(old_status, new_status)
+            if new_status == QUARANTINED:
+                self.removed_links += degree
+
+    def to_dict(self, prefix='profile_') -> dict:
+        """
+        Flat dictionary with the same keys for every run, so it can be stored with the results of the realisation
+
+        :param prefix: prefix of all keys
+        :return: e.g. {'profile_time_run': 1.2, ..., 'profile_transitions_S_I': 120, ..., 'profile_removed_links': 30}
+        """
+        profile = {f'{prefix}time_{name}': seconds for name, seconds in self.times.items()}
+        for old_status, new_status in TRANSITIONS:
+            name = f'{prefix}transitions_{STATUS_LABELS[old_status]}_{STATUS_LABELS[new_status]}'
+            profile[name] = self.transitions[old_status, new_status]
+        profile[f'{prefix}opinion_changes'] = self.opinion_changes
+        profile[f'{prefix}removed_links'] = self.removed_links
+        return profile
+
+
+def profile_phase(profile: RunProfile, name: str):
+    """
+    :return: context manager which measures the phase `name` of `profile`, it does nothing without profile
+    """
+    return profile.phase(name) if profile is not None else contextlib.nullcontext()
+
+
+def summarize(realisations, prefix='profile_') -> dict:
+    """
+    Total of every profile field over all realisations
+
+    :param realisations: structured array with results of realisations (see `scripts.realisations.results_to_array`)
+    :param prefix: prefix of profile fields (see `RunProfile.to_dict`)
+    :return: e.g. {'profile_time_run': 120.5, ..., 'profile_removed_links': 3000}, NaN values are skipped
+    """
+    return {name: float(np.nansum(realisations[name])) for name in realisations.dtype.names
+            if name.startswith(prefix)}
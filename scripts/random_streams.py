@@ -0,0 +1,74 @@
+import hashlib
+import json
+import random
+
+import numpy as np
+
+
+class RandomStreams:
+    """Random number streams of one realisation
+
+    numpy: `np.random.Generator` for vectorized draws (initialization of agents, synchronous backends)
+
+    python: `random.Random` for single draws in the loops of random sequential backends, which is much faster than
+    single draws from `np.random.Generator`
+
+    network_seed: seed of the network topology
+
+    All streams are derived from one `np.random.SeedSequence`, so the realisation is reproduced from `seed` alone and
+    streams of different seeds are independent. Without a seed the global `np.random` and `random` modules are used
+    and a new network is generated every time (the behaviour without streams).
+    """
+
+    def __init__(self, seed=None):
+        """
+        :param seed: int or `np.random.SeedSequence`, the global random modules are used when not given
+        """
+        self.seed = seed
+        if seed is None:
+            self.numpy = np.random
+            self.python = random
+            self.network_seed = None
+            return
+        seed_sequence = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+        numpy_sequence, python_sequence, network_sequence = seed_sequence.spawn(3)
+        self.numpy = np.random.default_rng(numpy_sequence)
+        self.python = random.Random(int(python_sequence.generate_state(1, np.uint64)[0]))
+        self.network_seed = int(network_sequence.generate_state(1)[0])
+
+
+def realisation_seed(root_seed, point: tuple, run: int) -> int:
+    """
+    Seed of realisation `run` of the parameter point `point` in the sweep with `root_seed`. Seeds are drawn
+    from independent children of the root `np.random.SeedSequence`, so parallel workers never share streams.
+    Children are chosen by the values of the point (see `point_key`) and not by its position in the sweep, so the
+    same realisation gets the same seed when the sweep is extended or reordered.
+
+    :param root_seed: int or `np.random.SeedSequence` of the sweep
+    :param point: values of parameters of the point, e.g. (q, p)
+    :param run: index of the realisation
+    :return: 64-bit seed (see `RandomStreams`)
+    """
+    entropy = root_seed.entropy if isinstance(root_seed, np.random.SeedSequence) else root_seed
+    sequence = np.random.SeedSequence(entropy, spawn_key=(point_key(point), run))
+    return int(sequence.generate_state(1, np.uint64)[0])
+
+
+def point_key(point: tuple) -> int:
+    """
+    :param point: values of parameters, numbers (numpy scalars are the same as Python numbers) or strings
+    :return: 128-bit hash of values of `point`
+    """
+    values = json.dumps([value.item() if isinstance(value, np.generic) else value for value in point])
+    return int.from_bytes(hashlib.sha256(values.encode()).digest()[:16], 'little')
+
+
+def get_streams(streams: RandomStreams = None) -> RandomStreams:
+    """
+    :param streams: RandomStreams or None
+    :return: `streams` or streams of the global random modules
+    """
+    return streams if streams is not None else _GLOBAL_STREAMS
+
+
+_GLOBAL_STREAMS = RandomStreams()
@@ -0,0 +1,94 @@
+import numpy as np
+
+RUN_FIELD = 'run'
+SEED_FIELD = 'seed'
+
+# Statistics computed by `aggregate`, quantiles are named `q<percent>`
+DEFAULT_STATISTICS = ('mean', 'std', 'sem', 'q05', 'q50', 'q95')
+
+
+def results_to_array(results: dict, params_names: tuple) -> np.ndarray:
+    """
+    Summary metrics of every realisation in a structured array
+
+    :param results: output of `scripts.scheduler.run_realisations`, {point: [(seed, result), ...]}
+    :param params_names: names of parameters of the points, e.g. ('q', 'p')
+    :return: structured array with fields: parameters, `RUN_FIELD`, `SEED_FIELD` and metrics (float64, missing
+             values are NaN), one element per realisation
+    """
+    rows = [(point, run, seed, result) for point, realisations in results.items()
+            for run, (seed, result) in enumerate(realisations)]
+    # realisations may have different metrics, e.g. an interrupted sweep continued with profiling
+    metrics = list(dict.fromkeys(metric for row in rows for metric in row[3]))
+    points = [row[0] for row in rows]
+    params_dtypes = [np.asarray([point[i] for point in points]).dtype for i in range(len(params_names))]
+    dtype = [(name, dtype) for name, dtype in zip(params_names, params_dtypes)] \
+        + [(RUN_FIELD, np.int32), (SEED_FIELD, np.uint64)] + [(metric, np.float64) for metric in metrics]
+
+    realisations = np.empty(len(rows), dtype=dtype)
+    for i, name in enumerate(params_names):
+        realisations[name] = [point[i] for point in points]
+    realisations[RUN_FIELD] = [row[1] for row in rows]
+    realisations[SEED_FIELD] = [row[2] for row in rows]
+    for metric in metrics:
+        realisations[metric] = [np.nan if row[3].get(metric) is None else row[3][metric] for row in rows]
+    return realisations
+
+
+def aggregate(realisations: np.ndarray, params_names: tuple, metrics: list = None,
+              statistics=DEFAULT_STATISTICS) -> np.ndarray:
+    """
+    Statistics of metrics over realisations of every parameter point, computed for all points at once
+
+    :param realisations: structured array (see `results_to_array`)
+    :param params_names: fields which identify the parameter point
+    :param metrics: fields to aggregate (default all fields except parameters, run and seed)
+    :param statistics: 'mean', 'std' (sample standard deviation), 'sem' (standard error of the mean), 'count' and
+                       quantiles 'q<percent>', e.g. 'q05', 'q50', 'q95'
+    :return: structured array with parameters, `count` and fields `<metric>_<statistic>`, one element per point
+    """
+    params_names = list(params_names)
+    if metrics is None:
+        metrics = [f for f in realisations.dtype.names if f not in params_names + [RUN_FIELD, SEED_FIELD]]
+
+    points, groups, counts = np.unique(realisations[params_names], return_inverse=True, return_counts=True)
+    groups = groups.ravel()
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+
+    dtype = [(name, realisations.dtype[name]) for name in params_names] + [('count', np.int64)] \
+        + [(f'{metric}_{statistic}', np.float64)
+           for metric in metrics for statistic in statistics if statistic != 'count']
+    output = np.empty(len(points), dtype=dtype)
+    for name in params_names:
+        output[name] = points[name]
+    output['count'] = counts
+
+    for metric in metrics:
+        # values sorted by point and then by value, so every point is a contiguous sorted block
+        order = np.lexsort((realisations[metric], groups))
+        values = realisations[metric][order]
+        sums = np.add.reduceat(values, starts)
+        mean = sums / counts
+        squares = np.add.reduceat((values - mean[groups[order]]) ** 2, starts)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            std = np.sqrt(squares / (counts - 1))
+        for statistic in statistics:
+            if statistic == 'mean':
+                output[f'{metric}_mean'] = mean
+            elif statistic == 'std':
+                output[f'{metric}_std'] = std
+            elif statistic == 'sem':
+                output[f'{metric}_sem'] = std / np.sqrt(counts)
+            elif statistic.startswith('q'):
+                output[f'{metric}_{statistic}'] = _sorted_quantile(values, starts, counts, int(statistic[1:]) / 100)
+            elif statistic != 'count':
+                raise ValueError(f'Unsupported statistic: {statistic}')
+    return output
+
+
+def _sorted_quantile(values: np.ndarray, starts: np.ndarray, counts: np.ndarray, quantile: float):
+    # linear interpolation between the closest ranks (the same as `np.quantile`) in every sorted block
+    position = quantile * (counts - 1)
+    lower = np.floor(position).astype(np.int64)
+    upper = np.ceil(position).astype(np.int64)
+    return values[starts + lower] + (position - lower) * (values[starts + upper] - values[starts + lower])
@@ -0,0 +1,81 @@
+import json
+import os
+
+import numpy as np
+
+
+class ResultStore:
+    """Append-only JSON lines file with results of finished realisations
+
+    The first line describes the sweep (`description`), e.g. {"description": {"backend": "python", ...}}, every next
+    line is one realisation:
+    {"point": [q, p], "run": 0, "seed": 123, "result": {"dead_ratio": 0.01, ...}}
+
+    Every record is flushed to disk as soon as it is appended, so an interrupted sweep can be resumed and only
+    missing realisations are run again (see `scripts.scheduler.run_realisations`).
+    """
+
+    def __init__(self, path: str, description=''):
+        """
+        :param path: path of the `.jsonl` file, it is created when it does not exist
+        :param description: description of the sweep which has to match the existing file, e.g. dictionary with all
+                            settings which change results of realisations, it is compared field by field
+        """
+        self.path = path
+        # the same types as in the header read from the file, e.g. lists instead of tuples
+        self.description = json.loads(json.dumps(description, default=_to_json))
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            with open(path) as f:
+                header = json.loads(f.readline())
+            if header.get('description') != self.description:
+                raise ValueError(f'{path} contains results of another sweep: '
+                                 f'{_difference(header.get("description"), self.description)}')
+            self._terminate_last_line()
+        else:
+            self._write({'description': self.description})
+
+    def load(self) -> list:
+        """
+        :return: list of all stored realisations, the last incomplete line of an interrupted write is skipped
+        """
+        records = []
+        with open(self.path) as f:
+            f.readline()  # omit header
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    continue
+        return records
+
+    def append(self, point: tuple, run: int, seed: int, result: dict):
+        self._write({'point': list(point), 'run': run, 'seed': seed, 'result': result})
+
+    def _terminate_last_line(self):
+        # a write interrupted in the middle of a line must not be merged with the next record
+        with open(self.path, 'rb+') as f:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b'\n':
+                f.write(b'\n')
+
+    def _write(self, record: dict):
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(record, default=_to_json) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+
+def _difference(stored, description) -> str:
+    if not isinstance(stored, dict) or not isinstance(description, dict):
+        return f'{stored} (expected {description})'
+    return ', '.join(f'{name}={stored.get(name)!r} (expected {description.get(name)!r})'
+                     for name in sorted(stored.keys() | description.keys())
+                     if stored.get(name) != description.get(name))
+
+
+def _to_json(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
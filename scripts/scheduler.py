@@ -0,0 +1,140 @@
+import collections
+import functools
+import itertools
+import multiprocessing as mp
+import random
+from typing import Callable
+
+import numpy as np
+from tqdm import tqdm
+
+from scripts.random_streams import RandomStreams, realisation_seed
+from scripts.result_store import ResultStore
+
+
+def run_realisations(experiment_fun: Callable,
+                     points: list,
+                     params: dict,
+                     n_runs: int,
+                     cpus: int = mp.cpu_count(),
+                     chunksize: int = None,
+                     store: ResultStore = None,
+                     seed: int = None,
+                     progress=True,
+                     batch_size: int = None):
+    """
+    Run `n_runs` realisations of `experiment_fun` for every parameter point. Every realisation is a separate task,
+    tasks are handed out to `cpus` processes as soon as they are free and results are collected in completion order.
+
+    Every realisation gets its own seed derived from the root seed, values of the point and the index of the run
+    (see `realisation_seed`), so results do not depend on the number of processes and a single realisation can be
+    run again with `run_realisation`. With `store`, every finished realisation is saved immediately and realisations
+    which are already in the store are not run again.
+
+    With `batch_size`, every task is a block of up to `batch_size` realisations of one point which `experiment_fun`
+    runs at once (see `run_batch`). Results of a realisation then depend on the other realisations of its block, so
+    it cannot be run again alone.
+
+    :param experiment_fun: function called with (point, params, streams) which returns results of one realisation,
+                           `streams` are RandomStreams of the realisation
+    :param points: list of parameter points, e.g. [(q1, p1), (q2, p2), ...]
+    :param params: parameters passed to every call of `experiment_fun`
+    :param n_runs: number of realisations of each point
+    :param cpus: number of processes
+    :param chunksize: number of tasks sent to a process at once (see `get_chunksize`)
+    :param store: ResultStore with results of finished realisations
+    :param seed: root seed of all realisations (random when not given)
+    :param progress: show progress bar with the estimated remaining time
+    :param batch_size: number of realisations of one point in a single call of `experiment_fun`, which is then called
+                       with (point, params, seeds) and returns a list of results of every seed
+    :return: dictionary {point: [(seed, result) of every realisation, ...]} in the order of `points`
+    """
+    results = collections.defaultdict(dict)
+    if store is not None:
+        for record in store.load():
+            results[tuple(record['point'])][record['run']] = record['seed'], record['result']
+
+    root = np.random.SeedSequence(seed)
+    tasks = [(point, run, realisation_seed(root, point, run))
+             for point in points for run in range(n_runs) if run not in results[point]]
+    if batch_size is not None:
+        tasks = _batch_tasks(tasks, batch_size)
+    if chunksize is None:
+        chunksize = get_chunksize(len(tasks), cpus)
+
+    if tasks:
+        run_task = functools.partial(_run_task if batch_size is None else _run_batch_task, experiment_fun, params)
+        with mp.Pool(cpus) as pool:
+            for finished in tqdm(pool.imap_unordered(run_task, tasks, chunksize),
+                                 total=len(tasks), disable=not progress, smoothing=0.1):
+                for point, run, task_seed, result in finished:
+                    if store is not None:
+                        store.append(point, run, task_seed, result)
+                    results[point][run] = task_seed, result
+    return {point: [results[point][run] for run in range(n_runs)] for point in points}
+
+
+def get_chunksize(n_tasks: int, cpus: int, tasks_per_cpu=8):
+    """
+    Chunk size which keeps inter-process communication low but still gives every process about `tasks_per_cpu`
+    chunks, so slow realisations at the end of the sweep do not leave other processes idle
+
+    :param n_tasks: number of all tasks
+    :param cpus: number of processes
+    :param tasks_per_cpu: number of chunks per process
+    """
+    return max(1, n_tasks // (cpus * tasks_per_cpu))
+
+
+def run_realisation(experiment_fun: Callable, point: tuple, params: dict, seed: int):
+    """
+    Run a single realisation, e.g. again with the seed recorded in the results of the sweep
+
+    :param experiment_fun: see `run_realisations`
+    :param point: parameter point
+    :param params: parameters passed to `experiment_fun`
+    :param seed: seed of the realisation
+    :return: results of the realisation
+    """
+    # global random modules are seeded as well for code which does not use the streams
+    random.seed(seed)
+    np.random.seed(seed % 2 ** 32)
+    return experiment_fun(point, params, RandomStreams(seed))
+
+
+def run_batch(experiment_fun: Callable, point: tuple, params: dict, seeds: list) -> list:
+    """
+    Run a block of realisations of one point at once (see `batch_size` of `run_realisations`)
+
+    :param experiment_fun: function called with (point, params, seeds) which returns a list of results
+    :param point: parameter point
+    :param params: parameters passed to `experiment_fun`
+    :param seeds: seeds of realisations
+    :return: list of results of every realisation
+    """
+    # global random modules are seeded as well for code which does not use the seeds
+    random.seed(seeds[0])
+    np.random.seed(seeds[0] % 2 ** 32)
+    return experiment_fun(point, params, seeds)
+
+
+def _batch_tasks(tasks: list, batch_size: int) -> list:
+    # blocks of consecutive realisations of the same point: (point, runs, seeds)
+    blocks = []
+    for point, point_tasks in itertools.groupby(tasks, key=lambda task: task[0]):
+        point_tasks = list(point_tasks)
+        for start in range(0, len(point_tasks), batch_size):
+            _, runs, seeds = zip(*point_tasks[start:start + batch_size])
+            blocks.append((point, list(runs), list(seeds)))
+    return blocks
+
+
+def _run_task(experiment_fun: Callable, params: dict, task):
+    point, run, seed = task
+    return [(point, run, seed, run_realisation(experiment_fun, point, params, seed))]
+
+
+def _run_batch_task(experiment_fun: Callable, params: dict, task):
+    point, runs, seeds = task
+    return [(point, run, seed, result)
+            for run, seed, result in zip(runs, seeds, run_batch(experiment_fun, point, params, seeds))]
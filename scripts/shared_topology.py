@@ -0,0 +1,186 @@
+import collections
+import os
+from multiprocessing import shared_memory
+
+import numpy as np
+
+import scripts.epidemic_layer as l1
+from scripts.agent_state import AgentState, CSRAdjacency
+from scripts.network import create_bilayer_topology
+from scripts.topology_cache import topology_key
+
+TOPOLOGY_FIELDS = ('l1_indptr', 'l1_indices', 'l2_indptr', 'l2_indices')
+ATTRIBUTE_FIELDS = ('age', 'gender', 'comorbid_A', 'comorbid_B')
+SHARED_MEMORY = 'shared_memory'
+
+# Picklable description of shared arrays sent to workers instead of the arrays:
+# location: `SHARED_MEMORY` or directory with `.npy` files, arrays: {field: (name, shape, dtype)}
+SharedTopologyHandle = collections.namedtuple('SharedTopologyHandle', ['location', 'arrays'])
+
+
+class SharedTopology:
+    """Topology of both layers and static attributes of agents (age, gender, comorbidities) shared by processes
+
+    Arrays are stored once in `multiprocessing.shared_memory` blocks or in memory-mapped `.npy` files, other processes
+    attach to them with `attach` without copying, so the memory grows with one topology and not with the number of
+    processes. All arrays are read-only, every simulation gets its own `active_agents` masks (see `adjacency`).
+    """
+
+    def __init__(self, arrays: dict, handle: SharedTopologyHandle, blocks: list = ()):
+        self.arrays = arrays
+        self.handle = handle
+        self._blocks = list(blocks)
+        for array in arrays.values():
+            array.flags.writeable = False
+
+    @staticmethod
+    def create(l1_adjacency: CSRAdjacency, l2_adjacency: CSRAdjacency, attributes: dict = None,
+               directory: str = None, name: str = None):
+        """
+        Copy the topology and attributes into shared memory or into `.npy` files
+
+        :param l1_adjacency: CSRAdjacency of the physical layer
+        :param l2_adjacency: CSRAdjacency of the virtual layer
+        :param attributes: arrays of `ATTRIBUTE_FIELDS`, agents draw their own attributes when not given
+        :param directory: directory with memory-mapped `.npy` files, files are kept after the sweep and reused when
+                          they exist, shared memory is used when not given
+        :param name: prefix of file names (required with `directory`, see `topology_key`)
+        :return: SharedTopology
+        """
+        arrays = dict(zip(TOPOLOGY_FIELDS, (l1_adjacency.indptr, l1_adjacency.indices,
+                                            l2_adjacency.indptr, l2_adjacency.indices)))
+        if attributes is not None:
+            arrays.update((field, attributes[field]) for field in ATTRIBUTE_FIELDS)
+
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+            handle = SharedTopologyHandle(directory, {field: (f'{name}_{field}.npy', array.shape, array.dtype.str)
+                                                      for field, array in arrays.items()})
+            for field, array in arrays.items():
+                path = os.path.join(directory, handle.arrays[field][0])
+                if not os.path.exists(path):
+                    # other processes can read the same file, so it is written under a temporary name first
+                    tmp_path = f'{path}.{os.getpid()}.tmp'
+                    with open(tmp_path, 'wb') as f:
+                        np.save(f, array)
+                    os.replace(tmp_path, path)
+            return SharedTopology.attach(handle)
+
+        blocks, shared_arrays, description = [], {}, {}
+        for field, array in arrays.items():
+            block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            shared_arrays[field] = np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)
+            shared_arrays[field][:] = array
+            description[field] = block.name, array.shape, array.dtype.str
+            blocks.append(block)
+        return SharedTopology(shared_arrays, SharedTopologyHandle(SHARED_MEMORY, description), blocks)
+
+    @staticmethod
+    def attach(handle: SharedTopologyHandle):
+        """
+        Attach to arrays created by `create` in another process
+
+        :param handle: `SharedTopology.handle`
+        :return: SharedTopology
+        """
+        if handle.location != SHARED_MEMORY:
+            arrays = {field: np.load(os.path.join(handle.location, name), mmap_mode='r')
+                      for field, (name, _, _) in handle.arrays.items()}
+            return SharedTopology(arrays, handle)
+
+        blocks, arrays = [], {}
+        for field, (name, shape, dtype) in handle.arrays.items():
+            block = shared_memory.SharedMemory(name=name)
+            arrays[field] = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+            blocks.append(block)
+        return SharedTopology(arrays, handle, blocks)
+
+    @property
+    def n_agents(self):
+        return len(self.arrays['l1_indptr']) - 1
+
+    @property
+    def attributes(self):
+        """
+        :return: {field: read-only array} of `ATTRIBUTE_FIELDS` or None when the attributes are not shared
+        """
+        if not all(field in self.arrays for field in ATTRIBUTE_FIELDS):
+            return None
+        return {field: self.arrays[field] for field in ATTRIBUTE_FIELDS}
+
+    def adjacency(self):
+        """
+        :return: tuple (l1 CSRAdjacency, l2 CSRAdjacency) with shared topology arrays and new `active_agents` masks
+        """
+        return (CSRAdjacency(self.arrays['l1_indptr'], self.arrays['l1_indices']),
+                CSRAdjacency(self.arrays['l2_indptr'], self.arrays['l2_indices']))
+
+    def close(self):
+        """Detach from shared memory, arrays of this object and adjacencies created from it cannot be used anymore"""
+        self.arrays = {}
+        for block in self._blocks:
+            block.close()
+
+    def unlink(self):
+        """Free shared memory after all processes have finished (`.npy` files are kept)"""
+        for block in self._blocks:
+            block.unlink()
+        self._blocks = []
+
+
+def create_shared_topologies(agents: int,
+                             additional_virtual_links: int,
+                             m=3,
+                             p=None,
+                             pool_size: int = None,
+                             comorbid_disease_A_fraction: float = None,
+                             comorbid_disease_B_fraction: float = None,
+                             directory: str = None) -> list:
+    """
+    Generate `pool_size` topologies with seeds 0, 1, ..., `pool_size` - 1 (the same networks as in `TopologyCache`)
+    and share them with worker processes (see `SharedTopology`)
+
+    :param agents: number of agents
+    :param additional_virtual_links: number of additional links in virtual layer
+    :param m: see `create_bilayer_topology`
+    :param p: see `create_bilayer_topology`
+    :param pool_size: number of topologies (default 1)
+    :param comorbid_disease_A_fraction: agents of every topology get static attributes drawn with the seed of the
+                                        topology (see `initialize_epidemic_state`), every realisation draws its own
+                                        attributes when fractions are not given
+    :param comorbid_disease_B_fraction: see `comorbid_disease_A_fraction`
+    :param directory: memory-mapped `.npy` files instead of shared memory (see `SharedTopology.create`)
+    :return: list of SharedTopology, call `close` and `unlink` of every topology after the sweep
+    """
+    topologies = []
+    for seed in range(pool_size or 1):
+        key = topology_key(agents, additional_virtual_links, m, p, seed)
+        l1_adjacency, l2_adjacency = create_bilayer_topology(agents, additional_virtual_links, m=m, p=p, seed=seed)
+        attributes = None
+        if comorbid_disease_A_fraction is not None and comorbid_disease_B_fraction is not None:
+            state = l1.initialize_epidemic_state(AgentState(l1_adjacency), comorbid_disease_A_fraction,
+                                                 comorbid_disease_B_fraction, np.random.default_rng(seed))
+            attributes = {field: getattr(state, field) for field in ATTRIBUTE_FIELDS}
+            key = f'{key}_A{comorbid_disease_A_fraction}_B{comorbid_disease_B_fraction}'
+        topologies.append(SharedTopology.create(l1_adjacency, l2_adjacency, attributes, directory, key))
+    return topologies
+
+
+_process_topologies = {}
+
+
+def get_shared_topology(handles: list, random_state=np.random) -> SharedTopology:
+    """
+    One of the shared topologies, drawn for every realisation, processes attach to every topology only once
+
+    :param handles: list of `SharedTopology.handle`
+    :param random_state: `np.random` or `np.random.Generator` used to draw a topology from the pool
+    :return: SharedTopology or None when `handles` are not given
+    """
+    if not handles:
+        return None
+    handle = handles[int(random_state.choice(len(handles)))]
+    key = handle.location, tuple(name for name, _, _ in handle.arrays.values())
+    if key not in _process_topologies:
+        _process_topologies[key] = SharedTopology.attach(handle)
+    return _process_topologies[key]
@@ -8,13 +8,23 @@ class SimulationConstants:
     L1_DEFAULT_PARAMS = PhysicalLayerParameters(0.1, 0.2, 0.9, 0.05, 10)
     FRACTION_COMORBIDITIES_A = 0.1
     FRACTION_COMORBIDITIES_B = 0.1
+    NETWORK_M = 3
+    NETWORK_P = 0.8
+    BACKEND = 'python'
+    TOPOLOGY_POOL_SIZE = None
+    TOPOLOGY_CACHE_DIR = None
 
     def __init__(self,
                  n_agents=None,
                  n_steps=None,
                  l1_params=None,
                  comorbid_disease_A_fraction=None,
-                 comorbid_disease_B_fraction=None):
+                 comorbid_disease_B_fraction=None,
+                 backend=None,
+                 topology_pool_size=None,
+                 topology_cache_dir=None,
+                 network_m=None,
+                 network_p=None):
         self.n_agents = n_agents if n_agents is not None else SimulationConstants.N_AGENTS
         self.n_steps = n_steps if n_steps is not None else SimulationConstants.N_STEPS
         self.l1_params = l1_params if l1_params is not None else SimulationConstants.L1_DEFAULT_PARAMS
@@ -22,3 +32,10 @@ class SimulationConstants:
             else SimulationConstants.FRACTION_COMORBIDITIES_A
         self.comorbid_disease_B_fraction = comorbid_disease_B_fraction if comorbid_disease_B_fraction is not None \
             else SimulationConstants.FRACTION_COMORBIDITIES_B
+        self.backend = backend if backend is not None else SimulationConstants.BACKEND
+        self.topology_pool_size = topology_pool_size if topology_pool_size is not None \
+            else SimulationConstants.TOPOLOGY_POOL_SIZE
+        self.topology_cache_dir = topology_cache_dir if topology_cache_dir is not None \
+            else SimulationConstants.TOPOLOGY_CACHE_DIR
+        self.network_m = network_m if network_m is not None else SimulationConstants.NETWORK_M
+        self.network_p = network_p if network_p is not None else SimulationConstants.NETWORK_P
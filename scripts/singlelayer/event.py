@@ -0,0 +1,192 @@
+import math
+import random
+import time
+
+import numpy as np
+
+from scripts.agent_state import AgentState, SUSCEPTIBLE, INFECTED, QUARANTINED, RECOVERED, DEAD, state_metrics
+from scripts.metric_sinks import create_sinks, collect_results, record_interval, is_recorded, remaining_records, \
+    fast_forward
+from scripts.parameters import *
+from scripts.profiling import RunProfile
+from scripts.random_streams import RandomStreams, get_streams
+from scripts.singlelayer import simulation
+from scripts.singlelayer.transition_rates import get_transition_rates
+from scripts.transition_rates import TransitionRates
+
+
+class IndexedSet:
+    """Set of agents with O(1) insertion, removal and uniform sampling
+
+    Members are kept in a dense list and `position[node]` is the index of `node` in this list (-1 when absent),
+    a removed member is replaced by the last one.
+    """
+
+    def __init__(self, n_agents: int):
+        self.members = []
+        self.position = [-1] * n_agents
+
+    def __len__(self):
+        return len(self.members)
+
+    def __contains__(self, node):
+        return self.position[node] >= 0
+
+    def add(self, node):
+        if self.position[node] < 0:
+            self.position[node] = len(self.members)
+            self.members.append(node)
+
+    def discard(self, node):
+        index = self.position[node]
+        if index < 0:
+            return
+        last = self.members.pop()
+        if last != node:
+            self.members[index] = last
+            self.position[last] = index
+        self.position[node] = -1
+
+    def sample(self, rng=random):
+        return self.members[rng.randrange(len(self.members))]
+
+
+def run_event(state: AgentState,
+              steps: int,
+              l1_params: PhysicalLayerParameters,
+              metrics: dict,
+              record_every=1,
+              sinks: dict = None,
+              early_stop=True,
+              streams: RandomStreams = None,
+              profile: RunProfile = None,
+              verbose=False):
+    """
+    Rejection-free version of `run_state` with the same dynamics.
+
+    A step of `run_state` changes nothing when the drawn agent is recovered, dead or susceptible without infected
+    neighbours. Only the other (active) agents are kept in `IndexedSet`, the number of steps until the next draw
+    of an active agent is drawn from the geometric distribution with success probability `active / N` and the agent
+    is drawn uniformly from the active set. Metrics of the skipped steps are the same as after the last event.
+
+    :param state: AgentState of the physical layer
+    :param steps: number of simulation steps
+    :param l1_params: parameters for l1_layer
+    :param metrics: the same format as in `run`, metric functions are called with `state`
+                    (see `state_metrics`)
+    :param record_every: number of steps between recorded metrics (see `run`)
+    :param sinks: reducers of recorded metrics (see `run`)
+    :param early_stop: stop after the epidemic ended (see `run`)
+    :param streams: random number streams (see `run`)
+    :param profile: RunProfile of events (see `run`)
+    :param verbose: print simulation status
+    :return: output_metrics and state
+    """
+    rng = get_streams(streams).python
+    interval = record_interval(record_every, state.n_agents)
+    metrics = state_metrics(metrics)
+    output_sinks = create_sinks(metrics, sinks)
+    rates = get_transition_rates(state, l1_params)
+    infected_neighbours = _count_infected_neighbours(state)
+    active = IndexedSet(state.n_agents)
+    for node in np.flatnonzero(_is_active(state.status, infected_neighbours)).tolist():
+        active.add(node)
+
+    step = -1
+    while step < steps - 1:
+        next_step = step + _geometric(len(active) / state.n_agents, rng) if len(active) else steps
+
+        # nothing changes until the next event, the skipped steps record the current values
+        n_records = remaining_records(step, steps, interval) - remaining_records(min(next_step, steps) - 1, steps,
+                                                                                 interval)
+        if n_records > 0:
+            values = _metric_values(state, metrics)
+            if values is None:
+                return
+            fast_forward(output_sinks, values, n_records)
+        if next_step >= steps:
+            break
+
+        step = next_step
+        if profile is not None:
+            start = time.perf_counter()
+            _event(active.sample(rng), state, rates, l1_params, active, infected_neighbours, rng, profile)
+            profile.add_time('epidemic_layer', time.perf_counter() - start)
+        else:
+            _event(active.sample(rng), state, rates, l1_params, active, infected_neighbours, rng)
+
+        if verbose:
+            simulation._print_simulation_status(step, steps)
+
+        if is_recorded(step, steps, interval):
+            values = _metric_values(state, metrics)
+            if values is None:
+                return
+            for metrics_name, value in values.items():
+                output_sinks[metrics_name].append(value)
+
+        if early_stop and state.counters.epidemic_ended():
+            if verbose:
+                print('Epidemic ended at step: {} / {}'.format(step, steps))
+            fast_forward(output_sinks, _metric_values(state, metrics), remaining_records(step, steps, interval))
+            break
+
+    return collect_results(output_sinks), state
+
+
+def _geometric(p: float, rng=random) -> int:
+    # number of draws until the first success (inclusive), inverse transform of uniform number
+    if p >= 1:
+        return 1
+    return 1 + int(math.log(1 - rng.random()) / math.log(1 - p))
+
+
+def _metric_values(state: AgentState, metrics: dict):
+    values = {}
+    for metrics_name, (layer, metrics_function) in metrics.items():
+        if layer != 'l1_layer':
+            print('Unsupported layer name')
+            return
+        values[metrics_name] = metrics_function(state)
+    return values
+
+
+def _count_infected_neighbours(state: AgentState) -> np.ndarray:
+    adjacency = state.l1
+    rows = adjacency.row_indices()
+    infected_links = adjacency.active_links(rows) & (state.status[adjacency.indices] == INFECTED)
+    return np.bincount(rows[infected_links], minlength=adjacency.n_nodes)
+
+
+def _is_active(status, infected_neighbours):
+    return (status == INFECTED) | (status == QUARANTINED) | ((status == SUSCEPTIBLE) & (infected_neighbours > 0))
+
+
+def _event(node, state: AgentState, rates: TransitionRates, l1_params: PhysicalLayerParameters,
+           active: IndexedSet, infected_neighbours: np.ndarray, rng=random, profile: RunProfile = None):
+    """
+    Single step of `run_state` for an active `node` followed by the update of the active set
+    """
+    old_status = state.status[node]
+    # links are removed when the agent goes into quarantine, so neighbours are taken before the step
+    neighbours = state.l1.neighbors(node) if old_status == INFECTED else None
+    simulation._epidemic_layer_step(node, state, rates, l1_params, rng)
+    new_status = state.status[node]
+    if profile is not None:
+        profile.count_agent_transition(old_status, new_status, len(neighbours) if neighbours is not None else 0)
+    if new_status == old_status:
+        return
+
+    if new_status == INFECTED:
+        neighbours = state.l1.neighbors(node)
+        infected_neighbours[neighbours] += 1
+        for neighbour in neighbours[state.status[neighbours] == SUSCEPTIBLE].tolist():
+            active.add(neighbour)
+    elif old_status == INFECTED:
+        infected_neighbours[neighbours] -= 1
+        inactive = (state.status[neighbours] == SUSCEPTIBLE) & (infected_neighbours[neighbours] == 0)
+        for neighbour in neighbours[inactive].tolist():
+            active.discard(neighbour)
+
+    if new_status == RECOVERED or new_status == DEAD:
+        active.discard(node)
@@ -1,19 +1,30 @@
 import itertools
 import logging
-import math
 import multiprocessing as mp
 import time
-from collections import ChainMap
 from typing import Callable
 from logger_tt import setup_logging, logger
 
 import numpy as np
 
 from scripts.singlelayer.constants import SimulationConstants
+from scripts.dataset import realisations_to_frame, save_dataset
 from scripts.epidemic_metrics import *
 from scripts.parameters import *
-from scripts.singlelayer.save_output import format_parameters, save_results
+from scripts.profiling import RunProfile, summarize
+from scripts.random_streams import RandomStreams, get_streams
+from scripts.metric_sinks import LastSink, MaxSink
+from scripts.singlelayer.save_output import format_parameters, parameter_columns
+from scripts.realisations import results_to_array
+from scripts.result_store import ResultStore
+from scripts.scheduler import run_realisations
+from scripts.shared_topology import create_shared_topologies, get_shared_topology
 from scripts.singlelayer.simulation import init_run_simulation
+from scripts.topology_cache import get_topology_cache
+
+# Experiments use only the final dead ratio and the peak of infected ratio
+SUMMARY_SINKS = {'dead_ratio': LastSink,
+                 'infected_ratio': MaxSink}
 
 
 def run_parallel(params1: list,
@@ -26,100 +37,161 @@ def run_parallel(params1: list,
                  n_steps: int = None,
                  comorbid_disease_A_fraction: float = None,
                  comorbid_disease_B_fraction: float = None,
+                 backend: str = None,
+                 topology_pool_size: int = None,
+                 topology_cache_dir: str = None,
                  n_runs=100,
-                 cpus=mp.cpu_count()):
+                 cpus=mp.cpu_count(),
+                 chunksize: int = None,
+                 results_path: str = None,
+                 dataset_path: str = None,
+                 params_names: tuple = ('beta', 'gamma'),
+                 seed: int = None,
+                 profile=False,
+                 shared_topology=False):
     """
     Perform simulations in parallel
 
     :param params1: list of parameters
     :param params2: list of parameters
-    :param filename: output file name prefix
-    :param experiment_fun: function to execute in parallel (see more in `example_experiment` function)
+    :param filename: output file name prefix and the name of the experiment in the dataset
+    :param experiment_fun: function which runs a single realisation of one parameter point
+                           (see more in `example_experiment` function)
     :param l1_params:
     :param metrics:
     :param n_agents:
     :param n_steps:
     :param comorbid_disease_A_fraction:
     :param comorbid_disease_B_fraction:
+    :param backend: simulation backend (see `scripts.singlelayer.simulation.run`)
+    :param topology_pool_size: number of distinct networks reused by all simulations (see `TopologyCache`),
+                               a new network is generated for every simulation when not given
+    :param topology_cache_dir: directory with generated networks shared by all processes
     :param constants:
     :param n_runs: number of realizations of each run
     :param cpus: number of threads (default max number)
+    :param chunksize: number of realisations sent to a process at once (see `scripts.scheduler.get_chunksize`)
+    :param results_path: append-only file with results of every finished realisation (see `ResultStore`), an
+                         interrupted sweep started again with the same file and settings runs only missing realisations
+                         (default `filename` + '_results.jsonl')
+    :param dataset_path: Parquet file with all realisations (see `scripts.dataset`), default `filename` + '.parquet'
+    :param params_names: dataset column names of `params1` and `params2`
+    :param seed: root seed of all realisations (see `scripts.scheduler.run_realisations`)
+    :param profile: every realisation returns its `RunProfile` (see `scripts.profiling`) with the results, profiles
+                    are stored as `profile_*` fields and their totals are logged
+    :param shared_topology: generate `topology_pool_size` topologies (required) with static attributes of agents
+                            once and share them with all processes without copying (see `SharedTopology`), in
+                            memory-mapped `.npy` files in `topology_cache_dir` if it is given, otherwise in shared
+                            memory
+    :return: structured array with summary metrics and seed of every realisation (see `results_to_array`),
+             statistics over realisations can be computed with `scripts.realisations.aggregate`
     """
     if metrics is None:
         metrics = {'dead_ratio': ('l1_layer', dead_ratio),
                    'infected_ratio': ('l1_layer', infected_ratio)}
 
     updated_constants = SimulationConstants(n_agents, n_steps, l1_params, comorbid_disease_A_fraction,
-                                            comorbid_disease_B_fraction)
-
-    params_all = list(itertools.product(params1, params2))
-    length = math.ceil(len(params_all) / cpus)
-    params_chunks = []
-    for i in range(cpus):
-        start_idx = i * length
-        end_idx = (i + 1) * length
-        to_add = params_all[start_idx:end_idx]
-        if len(to_add) > 0:
-            params_chunks.append(to_add)
+                                            comorbid_disease_B_fraction, backend, topology_pool_size,
+                                            topology_cache_dir)
+    if shared_topology and updated_constants.topology_pool_size is None:
+        # otherwise all realisations would use one network and one set of ages, genders and comorbidities
+        raise ValueError('topology_pool_size is required with shared_topology')
 
     all_parameters = {
         'constants': updated_constants,
         'metrics': metrics,
-        'n_runs': n_runs
+        'n_runs': n_runs,
+        'profile': profile,
+        'shared_topologies': []
     }
-    all_parameters = [[p, all_parameters] for p in params_chunks]
+    params_all = list(itertools.product(params1, params2))
+    # all settings which change results, a sweep is resumed only with the same settings
+    description = {'experiment': filename,
+                   'experiment_fun': experiment_fun.__name__,
+                   'parameters': format_parameters(updated_constants.l1_params,
+                                                   n_runs,
+                                                   updated_constants.n_steps,
+                                                   updated_constants.n_agents,
+                                                   updated_constants.comorbid_disease_A_fraction,
+                                                   updated_constants.comorbid_disease_B_fraction),
+                   'metrics': sorted(metrics),
+                   'network_m': updated_constants.network_m,
+                   'network_p': updated_constants.network_p,
+                   'backend': updated_constants.backend,
+                   'seed': seed,
+                   'topology_pool_size': updated_constants.topology_pool_size,
+                   'shared_topology': shared_topology}
+    if results_path is None:
+        results_path = filename + '_results.jsonl'
+    store = ResultStore(results_path, description)
 
-    output_dead_rate = []
-    output_infected_rate = []
     start = time.time()
-    with mp.Pool(cpus) as pool:
-        for tmp_dead_rate, tmp_infected_rate in pool.starmap(experiment_fun, all_parameters):
-            output_dead_rate.append(tmp_dead_rate)
-            output_infected_rate.append(tmp_infected_rate)
-
-    output_dead_rate = dict(ChainMap(*output_dead_rate))
-    output_infected_rate = dict(ChainMap(*output_infected_rate))
-    parameters_name = filename + '_' + format_parameters(updated_constants.l1_params,
-                                                         n_runs,
-                                                         updated_constants.n_steps,
-                                                         updated_constants.n_agents,
-                                                         updated_constants.comorbid_disease_A_fraction,
-                                                         updated_constants.comorbid_disease_B_fraction) + '.csv'
-    save_results(output_dead_rate, output_infected_rate, params1, params2, parameters_name)
+    shared_topologies = []
+    if shared_topology:
+        shared_topologies = create_shared_topologies(updated_constants.n_agents, 0,
+                                                     updated_constants.network_m, updated_constants.network_p,
+                                                     updated_constants.topology_pool_size,
+                                                     updated_constants.comorbid_disease_A_fraction,
+                                                     updated_constants.comorbid_disease_B_fraction,
+                                                     directory=updated_constants.topology_cache_dir)
+        all_parameters['shared_topologies'] = [topology.handle for topology in shared_topologies]
+    try:
+        results = run_realisations(experiment_fun, params_all, all_parameters, n_runs, cpus, chunksize, store, seed)
+    finally:
+        for topology in shared_topologies:
+            topology.close()
+            topology.unlink()
+
+    constants_columns = parameter_columns(updated_constants.l1_params,
+                                          updated_constants.n_steps,
+                                          updated_constants.n_agents,
+                                          updated_constants.comorbid_disease_A_fraction,
+                                          updated_constants.comorbid_disease_B_fraction)
+    if dataset_path is None:
+        dataset_path = filename + '.parquet'
+    realisations = results_to_array(results, params_names)
+    save_dataset(realisations_to_frame(realisations, constants_columns, filename), dataset_path)
+    if profile:
+        logger.info(f'Profile: {summarize(realisations)}')
     end = time.time()
     logger.info(f'Elapsed: {end - start} s')
+    return realisations
 
 
-def example_experiment(beta_gamma: list, params: dict):
+def example_experiment(beta_gamma: tuple, params: dict, streams: RandomStreams = None):
     """
-    Example function to run in parallel
+    Example function to run in parallel, a single realisation for one parameter point
 
-    :param beta_gamma: parameters in format: [(beta1, gamma1), (beta2, gamma2), ...]
+    :param beta_gamma: parameters in format: (beta, gamma)
     :param params: dictionary with all possible parameters (see variable `all_parameters` in `run_parallel` function)
-    :return: tuple of dead and infected ratio for every parameters
+    :param streams: random number streams of the realisation (see `scripts.scheduler.run_realisations`)
+    :return: dictionary with dead ratio and peak of infected ratio of the realisation
     """
-    output_dead_rate = {}
-    output_infected_rate = {}
+    beta, gamma = beta_gamma
     constants = params['constants']
-    for beta, gamma in beta_gamma:
-        print(f'Running beta={beta}, gamma={gamma} in process {mp.current_process().name}')
-        dead_rate = []
-        infected_rate = []
-        for _ in range(params['n_runs']):
-            l1_params = PhysicalLayerParameters(beta, gamma, constants.l1_params.p_mu, constants.l1_params.p_kappa,
-                                                constants.l1_params.max_infected_time)
-            out, _, = init_run_simulation(constants.n_agents,
-                                          constants.n_steps,
-                                          l1_params,
-                                          params['metrics'],
-                                          comorbid_disease_A_fraction=constants.comorbid_disease_A_fraction,
-                                          comorbid_disease_B_fraction=constants.comorbid_disease_B_fraction)
-
-            dead_rate.append(out['dead_ratio'][-1])
-            infected_rate.append(max(out['infected_ratio']))
-        output_dead_rate[(beta, gamma)] = np.mean(dead_rate)
-        output_infected_rate[(beta, gamma)] = np.mean(infected_rate)
-    return output_dead_rate, output_infected_rate
+    profile = RunProfile() if params.get('profile') else None
+    shared_topology = get_shared_topology(params.get('shared_topologies'), get_streams(streams).numpy)
+    topology_cache = get_topology_cache(constants.topology_pool_size, constants.topology_cache_dir)
+    l1_params = PhysicalLayerParameters(beta, gamma, constants.l1_params.p_mu, constants.l1_params.p_kappa,
+                                        constants.l1_params.max_infected_time)
+    out, _, = init_run_simulation(constants.n_agents,
+                                  constants.n_steps,
+                                  l1_params,
+                                  params['metrics'],
+                                  comorbid_disease_A_fraction=constants.comorbid_disease_A_fraction,
+                                  comorbid_disease_B_fraction=constants.comorbid_disease_B_fraction,
+                                  network_m=constants.network_m,
+                                  network_p=constants.network_p,
+                                  sinks=SUMMARY_SINKS,
+                                  backend=constants.backend,
+                                  return_graphs=False,
+                                  topology_cache=topology_cache,
+                                  shared_topology=shared_topology,
+                                  streams=streams,
+                                  profile=profile)
+    if profile is not None:
+        out.update(profile.to_dict())
+    return out
 
 
 if __name__ == '__main__':
@@ -0,0 +1,204 @@
+import heapq
+import math
+import random
+from time import perf_counter
+
+import scripts.epidemic_layer as l1
+from scripts.agent_state import AgentState, SUSCEPTIBLE, INFECTED, QUARANTINED, state_metrics
+from scripts.metric_sinks import create_sinks, collect_results, record_interval, remaining_records, fast_forward
+from scripts.parameters import *
+from scripts.profiling import RunProfile
+from scripts.random_streams import RandomStreams, get_streams
+from scripts.singlelayer.event import _count_infected_neighbours, _metric_values, _geometric
+from scripts.singlelayer.transition_rates import get_transition_rates
+from scripts.transition_rates import TransitionRates
+
+
+def run_gillespie(state: AgentState,
+                  steps: int,
+                  l1_params: PhysicalLayerParameters,
+                  metrics: dict,
+                  record_every=1,
+                  sinks: dict = None,
+                  early_stop=True,
+                  streams: RandomStreams = None,
+                  profile: RunProfile = None,
+                  verbose=False):
+    """
+    Continuous-time version of `run_state` simulated with the next-reaction method.
+
+    Every agent is updated at the ticks of its own Poisson clock with rate 1 per Monte-Carlo sweep (`N` steps of
+    `run_state`). Only the time of the next transition of every agent is kept in a binary heap:
+
+    - S -> I with rate `1 - (1 - beta) ** k` for `k` infected neighbours, the time is rescaled when `k` changes
+    - I -> Q, D, R at the first tick after the infected time reaches `max_infected_time` which passes
+      the transition probabilities, the number of ticks is drawn at infection and their total time is gamma
+      distributed
+    - Q -> R, D after exponentially distributed time
+
+    The cost scales with the number of transitions instead of the number of steps. Time `t` corresponds to the step
+    `t * N`, metrics are recorded at the same steps as in `run_state`. The infected time is updated only when
+    the agent leaves the infected state.
+
+    :param state: AgentState of the physical layer
+    :param steps: number of simulation steps
+    :param l1_params: parameters for l1_layer
+    :param metrics: the same format as in `run`, metric functions are called with `state`
+                    (see `state_metrics`)
+    :param record_every: number of steps between recorded metrics (see `run`)
+    :param sinks: reducers of recorded metrics (see `run`)
+    :param early_stop: not used, there are no events after the epidemic ended
+    :param streams: random number streams (see `run`)
+    :param profile: RunProfile of events (see `run`), `epidemic_layer` is the time of all transitions
+    :param verbose: print simulation status
+    :return: output_metrics and state
+    """
+    n = state.n_agents
+    interval = record_interval(record_every, n)
+    metrics = state_metrics(metrics)
+    output_sinks = create_sinks(metrics, sinks)
+    queue = _EventQueue(state, get_transition_rates(state, l1_params), l1_params, get_streams(streams).python)
+
+    last_step = -1
+    while queue:
+        time, node = queue.pop()
+        step = math.ceil(time * n) - 1
+        if step >= steps:
+            break
+        # metrics of the steps before the event
+        n_records = remaining_records(last_step, steps, interval) - remaining_records(step - 1, steps, interval)
+        if n_records > 0:
+            values = _metric_values(state, metrics)
+            if values is None:
+                return
+            fast_forward(output_sinks, values, n_records)
+        last_step = step - 1
+        if profile is not None:
+            status, degree = state.status[node], state.l1.degree(node)
+            start = perf_counter()
+            queue.fire(time, node)
+            profile.add_time('epidemic_layer', perf_counter() - start)
+            profile.count_agent_transition(status, state.status[node], degree)
+        else:
+            queue.fire(time, node)
+
+    if verbose and state.counters.epidemic_ended():
+        print('Epidemic ended at step: {} / {}'.format(last_step + 1, steps))
+    values = _metric_values(state, metrics)
+    if values is None:
+        return
+    fast_forward(output_sinks, values, remaining_records(last_step, steps, interval))
+    return collect_results(output_sinks), state
+
+
+class _EventQueue:
+    """Binary heap with the time of the next transition of every agent
+
+    Entries are not removed from the heap when the time of an agent changes, `scheduled[node]` is the only valid time
+    of `node` and other entries are skipped.
+    """
+
+    def __init__(self, state: AgentState, rates: TransitionRates, l1_params: PhysicalLayerParameters, rng=random):
+        self.state = state
+        self.rng = rng
+        self.rates = rates
+        self.max_infected_time = l1_params.max_infected_time
+        self.infected_neighbours = _count_infected_neighbours(state).tolist()
+        self.exit_infected_time = state.infected_time.copy()
+        self.scheduled = [math.inf] * state.n_agents
+        self.heap = []
+        for node in range(state.n_agents):
+            status = state.status[node]
+            if status == SUSCEPTIBLE:
+                self._update_infection(0, node, 0)
+            elif status == INFECTED:
+                self._schedule_infected(0, node)
+            elif status == QUARANTINED:
+                self._schedule_quarantined(0, node)
+
+    def __bool__(self):
+        while self.heap and self.heap[0][0] != self.scheduled[self.heap[0][1]]:
+            heapq.heappop(self.heap)
+        return bool(self.heap)
+
+    def pop(self):
+        time, node = heapq.heappop(self.heap)
+        self.scheduled[node] = math.inf
+        return time, node
+
+    def fire(self, time: float, node):
+        state = self.state
+        status = state.status[node]
+        if status == SUSCEPTIBLE:
+            l1.set_infected(state, node)
+            self._set_neighbours_infected(time, node, 1)
+            self._schedule_infected(time, node)
+        elif status == INFECTED:
+            self._set_neighbours_infected(time, node, -1)
+            state.infected_time[node] = self.exit_infected_time[node]
+            gamma, kappa = self.rates.gamma[node], self.rates.kappa[node]
+            u = self.rng.random() * self._infected_exit_probability(node)
+            if u < gamma:
+                l1.set_quarantined(state, node)
+                # switch off all links if agent goes into quarantined state
+                state.l1.isolate(node)
+                self._schedule_quarantined(time, node)
+            elif u < gamma + (1 - gamma) * kappa:
+                l1.set_dead(state, node)
+            else:
+                l1.set_recovered(state, node)
+        elif status == QUARANTINED:
+            mu = self.rates.mu[node]
+            if self.rng.random() * self._quarantined_exit_probability(node) < mu:
+                l1.set_recovered(state, node)
+            else:
+                l1.set_dead(state, node)
+
+    def _push(self, time: float, node):
+        self.scheduled[node] = time
+        heapq.heappush(self.heap, (time, node))
+
+    def _infection_rate(self, node, infected_neighbours):
+        return 1 - (1 - self.rates.beta(self.state.opinion[node])) ** infected_neighbours
+
+    def _update_infection(self, time: float, node, old_infected_neighbours):
+        # next-reaction method: the remaining time is rescaled by the ratio of the old and the new rate
+        old_rate = self._infection_rate(node, old_infected_neighbours)
+        new_rate = self._infection_rate(node, self.infected_neighbours[node])
+        if new_rate <= 0:
+            self.scheduled[node] = math.inf
+        elif old_rate > 0 and self.scheduled[node] < math.inf:
+            self._push(time + old_rate / new_rate * (self.scheduled[node] - time), node)
+        else:
+            self._push(time + self.rng.expovariate(new_rate), node)
+
+    def _set_neighbours_infected(self, time: float, node, change: int):
+        for neighbour in self.state.l1.neighbors(node).tolist():
+            self.infected_neighbours[neighbour] += change
+            if self.state.status[neighbour] == SUSCEPTIBLE:
+                self._update_infection(time, neighbour, self.infected_neighbours[neighbour] - change)
+
+    def _infected_exit_probability(self, node):
+        gamma, kappa, mu = self.rates.gamma[node], self.rates.kappa[node], self.rates.mu[node]
+        return gamma + (1 - gamma) * kappa + (1 - gamma) * (1 - kappa) * mu
+
+    def _quarantined_exit_probability(self, node):
+        mu, kappa = self.rates.mu[node], self.rates.kappa[node]
+        return mu + (1 - mu) * kappa
+
+    def _schedule_infected(self, time: float, node):
+        state = self.state
+        increment = 0.5 if state.comorbid_B[node] else 1
+        exit_probability = self._infected_exit_probability(node)
+        if exit_probability <= 0:
+            return
+        # ticks until the infected time reaches the limit and then until the transitions pass
+        first_tick = max(1, math.ceil((self.max_infected_time - state.infected_time[node]) / increment))
+        ticks = first_tick - 1 + _geometric(exit_probability, self.rng)
+        self.exit_infected_time[node] = state.infected_time[node] + ticks * increment
+        self._push(time + self.rng.gammavariate(ticks, 1), node)
+
+    def _schedule_quarantined(self, time: float, node):
+        exit_probability = self._quarantined_exit_probability(node)
+        if exit_probability > 0:
+            self._push(time + self.rng.expovariate(exit_probability), node)
@@ -1,13 +1,23 @@
 import math
 import random
+import time
 import networkx as nx
 import numpy as np
 import copy
 
 import scripts.epidemic_layer as l1
-from scripts.age_statistics import death_rate_ratio
-from scripts.network import create_bilayer_network
+from scripts.agent_state import AgentState, INFECTED, from_graphs, to_graphs, state_metrics
+from scripts.metric_sinks import create_sinks, collect_results, record_interval, is_recorded, remaining_records, \
+    fast_forward
+from scripts.network import create_bilayer_topology
 from scripts.parameters import *
+from scripts.profiling import RunProfile, profile_phase
+from scripts.random_streams import RandomStreams, get_streams
+from scripts.shared_topology import SharedTopology
+from scripts.singlelayer import event, gillespie
+from scripts.singlelayer.transition_rates import get_transition_rates
+from scripts.topology_cache import TopologyCache
+from scripts.transition_rates import TransitionRates
 
 
 def init_run_simulation(n_agents: int,
@@ -19,10 +29,23 @@ def init_run_simulation(n_agents: int,
                         comorbid_disease_B_fraction: float = 0.1,
                         network_m: int = 3,
                         network_p: int = 0.8,
+                        record_every=1,
+                        sinks: dict = None,
+                        backend: str = 'python',
+                        return_graphs=True,
+                        topology_cache: TopologyCache = None,
+                        shared_topology: SharedTopology = None,
+                        network_seed: int = None,
+                        streams: RandomStreams = None,
+                        early_stop=True,
+                        profile: RunProfile = None,
                         verbose=False):
     """
     Perform COVID-19 simulation on single layer network
 
+    Agents are initialized directly in `AgentState` (see `initialize_state`), the layer is built as graph only
+    for the returned result.
+
     :param n_agents: number of agents in each layer
     :param steps: number of simulation steps
     :param l1_params: parameters for l1_layer
@@ -32,28 +55,96 @@ def init_run_simulation(n_agents: int,
     :param comorbid_disease_B_fraction: fraction of agents having comorbidities A
     :param network_m: The number of random edges to add for each new node
     :param network_p: Probability of adding the triangle after adding a random edge
+    :param record_every: number of steps between recorded metrics (see `run`)
+    :param sinks: reducers of recorded metrics (see `run`)
+    :param backend: simulation backend (see `run`)
+    :param return_graphs: convert final state into layer, otherwise None is returned instead of the layer
+    :param topology_cache: take network topology from the cache instead of generating a new one
+    :param shared_topology: use the topology (and static attributes of agents if they are shared) attached from
+                            another process instead of generating a new one (see `SharedTopology`)
+    :param network_seed: seed of the network topology (default seed of `streams`)
+    :param streams: random number streams of the realisation used by the network, initialization and all steps
+                    (see `RandomStreams`), global random modules when not given
+    :param early_stop: stop the simulation when no infected agents are left (see `run`)
+    :param profile: RunProfile which collects times of the network creation, initialization and the run (see `run`)
     :param verbose: print simulation status
     :return: output_metrics: format: {'infected_ratio': [0.4, 0.55, 0.7, ...], ...}
     """
-    l1_layer, _ = create_bilayer_network(n_agents, 0, m=network_m, p=network_p)
-    l1_layer_init = l1.initialize_epidemic(l1_layer, comorbid_disease_A_fraction, comorbid_disease_B_fraction)
-    l1_layer_init = initialize_bilayer_network(l1_layer_init, infected_fraction)
-    return run(l1_layer_init,
-               steps,
-               l1_params,
-               metrics,
-               verbose)
+    state = initialize_state(n_agents, infected_fraction, comorbid_disease_A_fraction, comorbid_disease_B_fraction,
+                             network_m, network_p, topology_cache, network_seed, streams, profile, shared_topology)
+    run_backend = _get_backend(backend)
+    with profile_phase(profile, 'run'):
+        result = run_backend(state, steps, l1_params, metrics, record_every, sinks, early_stop, streams, profile,
+                             verbose)
+    if result is None:
+        return
+    output_metrics, state = result
+    if not return_graphs:
+        return output_metrics, None
+    l1_layer, _ = to_graphs(state)
+    return output_metrics, l1_layer
+
+
+def initialize_state(n_agents: int,
+                     infected_fraction: float = 0.1,
+                     comorbid_disease_A_fraction: float = 0.1,
+                     comorbid_disease_B_fraction: float = 0.1,
+                     network_m: int = 3,
+                     network_p: int = 0.8,
+                     topology_cache: TopologyCache = None,
+                     network_seed: int = None,
+                     streams: RandomStreams = None,
+                     profile: RunProfile = None,
+                     shared_topology: SharedTopology = None):
+    """
+    Create the physical layer and initialize all agents (see `init_run_simulation`)
+
+    :return: AgentState
+    """
+    streams = get_streams(streams)
+    static_attributes = shared_topology.attributes if shared_topology is not None else None
+    with profile_phase(profile, 'network'):
+        if shared_topology is not None:
+            l1_adjacency, _ = shared_topology.adjacency()
+        elif topology_cache is not None:
+            # without a seed the topology is drawn from the pool of the cache
+            l1_adjacency, _ = topology_cache.get(n_agents, 0, m=network_m, p=network_p, seed=network_seed,
+                                                 random_state=streams.numpy)
+        else:
+            seed = network_seed if network_seed is not None else streams.network_seed
+            l1_adjacency, _ = create_bilayer_topology(n_agents, 0, m=network_m, p=network_p, seed=seed)
+    with profile_phase(profile, 'initialize'):
+        state = AgentState(l1_adjacency)
+        l1.initialize_epidemic_state(state, comorbid_disease_A_fraction, comorbid_disease_B_fraction, streams.numpy,
+                                     static_attributes)
+        return initialize_infected(state, infected_fraction, streams.numpy)
+
+
+def initialize_infected(state: AgentState, infected_fraction, random_state=np.random):
+    """
+    Set `floor(N * infected_fraction)` randomly chosen agents (with repetitions) as infected (in place)
+
+    :param state: AgentState
+    :param infected_fraction:
+    :param random_state: `np.random` or `np.random.Generator`
+    :return: state
+    """
+    infected_size = math.floor(state.n_agents * infected_fraction)
+    state.status[random_state.choice(state.n_agents, size=infected_size)] = INFECTED
+    state.recount()
+    return state
 
 
-def initialize_bilayer_network(l1_layer, infected_fraction):
+def initialize_bilayer_network(l1_layer, infected_fraction, inplace=False):
     """
     Initialize infected fraction of agents
 
     :param l1_layer:
     :param infected_fraction:
+    :param inplace: modify given layer instead of a copy
     :return: l1_layer
     """
-    l1_layer_copy = copy.deepcopy(l1_layer)
+    l1_layer_copy = l1_layer if inplace else copy.deepcopy(l1_layer)
     N = nx.number_of_nodes(l1_layer)
     infected_size = math.floor(N * infected_fraction)
     infected_nodes = np.random.choice(N, size=infected_size)
@@ -66,36 +157,122 @@ def run(l1_layer: nx.Graph,
         steps: int,
         l1_params: PhysicalLayerParameters,
         metrics: dict,
+        record_every=1,
+        sinks: dict = None,
+        backend: str = 'python',
+        early_stop=True,
+        streams: RandomStreams = None,
+        profile: RunProfile = None,
         verbose=False):
     """
     Run `steps` of COVID-19 simulation on the physical (`l1_layer`) layer.
 
+    The layer is converted into `AgentState` before the simulation and back into graph afterwards (see `run_state`).
+
     :param l1_layer: physical layer
-    :param l2_layer: virtual layer
     :param steps: number of simulation steps
     :param l1_params: parameters for l1_layer
-    :param l2_voter_params: parameters for voter model in l2_layer
-    :param l2_social_media_params: parameters for social media in l2_layer
     :param metrics: format e.g.:
                 {'aware_ratio': ('l1_layer': aware_ratio), 'infected_ratio': ('l2_layer', infected_ratio), ... }
+    :param record_every: number of steps between recorded metrics or `MC_SWEEP` to record once per Monte-Carlo
+                         sweep, the last step is always recorded
+    :param sinks: reducers of recorded metrics from `scripts.metric_sinks`, e.g.:
+                {'dead_ratio': LastSink, 'infected_ratio': MaxSink}, metrics without sink keep all values
+    :param backend: 'python' - random sequential updates of single agents (see `run_state`),
+                    'event' - the same dynamics without steps of agents which cannot change (see `run_event`),
+                              faster when most agents are recovered, dead or have no infected neighbours,
+                    'gillespie' - continuous-time version of the model (see `run_gillespie`)
+    :param early_stop: when there are no infected and quarantined agents statuses cannot change anymore, so
+                       the simulation stops and the last values of metrics are recorded for the remaining steps
+    :param streams: random number streams of the realisation (see `RandomStreams`), global random modules when
+                    not given
+    :param profile: `RunProfile` filled with the time of the whole run and the phases and events measured by
+                    the backend (see `RunProfile`), the simulation is not instrumented when not given
     :param verbose: print simulation status
     :return: output_metrics: format: {'infected_ratio': [0.4, 0.55, 0.7, ...], ...}
     """
-    output_metrics = {m: [] for m in metrics.keys()}
+    state = from_graphs(l1_layer)
+    run_backend = _get_backend(backend)
+    with profile_phase(profile, 'run'):
+        result = run_backend(state, steps, l1_params, metrics, record_every, sinks, early_stop, streams, profile,
+                             verbose)
+    if result is None:
+        return
+    output_metrics, state = result
+    l1_layer, _ = to_graphs(state)
+    return output_metrics, l1_layer
+
+
+def _get_backend(backend: str):
+    if backend == 'python':
+        return run_state
+    elif backend == 'event':
+        return event.run_event
+    elif backend == 'gillespie':
+        return gillespie.run_gillespie
+    raise ValueError(f'Unsupported backend: {backend}')
+
+
+def run_state(state: AgentState,
+              steps: int,
+              l1_params: PhysicalLayerParameters,
+              metrics: dict,
+              record_every=1,
+              sinks: dict = None,
+              early_stop=True,
+              streams: RandomStreams = None,
+              profile: RunProfile = None,
+              verbose=False):
+    """
+    Run `steps` of COVID-19 simulation on the array-backed state of the physical layer. `state` is modified in place.
+
+    :param state: AgentState of the physical layer
+    :param steps: number of simulation steps
+    :param l1_params: parameters for l1_layer
+    :param metrics: the same format as in `run`, metric functions are called with `state`
+                    (see `state_metrics`)
+    :param record_every: number of steps between recorded metrics (see `run`)
+    :param sinks: reducers of recorded metrics (see `run`)
+    :param early_stop: stop after the epidemic ended (see `run`)
+    :param streams: random number streams (see `run`)
+    :param profile: RunProfile of steps, metrics and events (see `run`)
+    :param verbose: print simulation status
+    :return: output_metrics and state
+    """
+    rng = get_streams(streams).python
+    interval = record_interval(record_every, state.n_agents)
+    metrics = state_metrics(metrics)
+    output_sinks = create_sinks(metrics, sinks)
+    rates = get_transition_rates(state, l1_params)
     for step in range(steps):
-        _single_step(l1_layer, l1_params)
+        if profile is not None:
+            _profiled_single_step(state, rates, l1_params, profile, rng)
+        else:
+            _single_step(state, rates, l1_params, rng)
 
         if verbose:
             _print_simulation_status(step, steps)
 
-        for metrics_name, (layer, metrics_function) in metrics.items():
-            if layer == 'l1_layer':
-                output_metrics[metrics_name].append(metrics_function(l1_layer))
-            else:
-                print('Unsupported layer name')
-                return
+        if is_recorded(step, steps, interval):
+            start = time.perf_counter() if profile is not None else None
+            for metrics_name, (layer, metrics_function) in metrics.items():
+                if layer == 'l1_layer':
+                    output_sinks[metrics_name].append(metrics_function(state))
+                else:
+                    print('Unsupported layer name')
+                    return
+            if profile is not None:
+                profile.add_time('metrics', time.perf_counter() - start)
 
-    return output_metrics, l1_layer
+        if early_stop and state.counters.epidemic_ended():
+            if verbose:
+                print('Epidemic ended at step: {} / {}'.format(step, steps))
+            values = {metrics_name: metrics_function(state)
+                      for metrics_name, (_, metrics_function) in metrics.items()}
+            fast_forward(output_sinks, values, remaining_records(step, steps, interval))
+            break
+
+    return collect_results(output_sinks), state
 
 
 def _print_simulation_status(step: int, steps: int, num=10):
@@ -103,101 +280,56 @@ def _print_simulation_status(step: int, steps: int, num=10):
         print('Step: {} / {}'.format(step, steps))
 
 
-def _single_step(l1_layer: nx.Graph,
-                 l1_params: PhysicalLayerParameters):
-    N = l1_layer.number_of_nodes()
-    random_node = random.randint(0, N - 1)
-    _epidemic_layer_step(random_node, l1_layer, l1_params)
+def _single_step(state: AgentState,
+                 rates: TransitionRates,
+                 l1_params: PhysicalLayerParameters,
+                 rng=random):
+    random_node = rng.randint(0, state.n_agents - 1)
+    _epidemic_layer_step(random_node, state, rates, l1_params, rng)
+
+
+def _profiled_single_step(state: AgentState,
+                          rates: TransitionRates,
+                          l1_params: PhysicalLayerParameters,
+                          profile: RunProfile,
+                          rng=random):
+    random_node = rng.randint(0, state.n_agents - 1)
+    status = state.status[random_node]
+    degree = state.l1.degree(random_node) if status == INFECTED else 0
+    start = time.perf_counter()
+    _epidemic_layer_step(random_node, state, rates, l1_params, rng)
+    profile.add_time('epidemic_layer', time.perf_counter() - start)
+    profile.count_agent_transition(status, state.status[random_node], degree)
 
 
-def _epidemic_layer_step(random_node, l1_layer: nx.Graph, l1_params: PhysicalLayerParameters):
-    l1_node_status = l1.get_status(l1_layer, random_node)
-    age = l1.get_age(l1_layer, random_node)
-    is_disease_A = l1.get_comorbid_disease_A(l1_layer, random_node)
-    is_disease_B = l1.get_comorbid_disease_B(l1_layer, random_node)
+def _epidemic_layer_step(random_node, state: AgentState, rates: TransitionRates, l1_params: PhysicalLayerParameters,
+                         rng=random):
+    l1_node_status = l1.get_status(state, random_node)
+    is_disease_A = l1.get_comorbid_disease_A(state, random_node)
+    is_disease_B = l1.get_comorbid_disease_B(state, random_node)
 
     if l1_node_status == 'S':
-        # Check whether any neighbour is infected
-        for neighbour in l1_layer.neighbors(random_node):
-            if l1.get_status(l1_layer, neighbour) == 'I':
-                if random.random() < _get_combined_beta_probability(l1_params.p_beta):
-                    l1.set_infected(l1_layer, random_node)
-                    break
+        # Every infected neighbour is a separate chance of infection
+        neighbours = state.l1.neighbors(random_node)
+        infected_neighbours = np.count_nonzero(state.status[neighbours] == INFECTED)
+        for _ in range(infected_neighbours):
+            if rng.random() < rates.beta(state.opinion[random_node]):
+                l1.set_infected(state, random_node)
+                break
     elif l1_node_status == 'I':
-        l1.increment_infected_time_comorbid(l1_layer, random_node, is_disease_A, is_disease_B)
-        if l1.get_infected_time(l1_layer, random_node) >= l1_params.max_infected_time:
-            if random.random() < _get_combined_gamma_probability(l1_params.p_gamma):  # I -> Q
-                l1.set_quarantined(l1_layer, random_node)
-                # remove all links if agent goes into quarantined state
-                links = list(l1_layer.edges(random_node))
-                l1_layer.remove_edges_from(links)
-            elif random.random() < _get_combined_kappa_probability(l1_params.p_kappa, age, is_disease_A,
-                                                                   is_disease_B):  # I -> R
-                l1.set_dead(l1_layer, random_node)
-            elif random.random() < _get_combined_mu_probability(l1_params.p_mu, age, is_disease_A,
-                                                                is_disease_B):  # I -> D
-                l1.set_recovered(l1_layer, random_node)
+        l1.increment_infected_time_comorbid(state, random_node, is_disease_A, is_disease_B)
+        if l1.get_infected_time(state, random_node) >= l1_params.max_infected_time:
+            if rng.random() < rates.gamma[random_node]:  # I -> Q
+                l1.set_quarantined(state, random_node)
+                # switch off all links if agent goes into quarantined state
+                state.l1.isolate(random_node)
+            elif rng.random() < rates.kappa[random_node]:  # I -> R
+                l1.set_dead(state, random_node)
+            elif rng.random() < rates.mu[random_node]:  # I -> D
+                l1.set_recovered(state, random_node)
 
     elif l1_node_status == 'Q':
-        if random.random() < _get_combined_mu_probability(l1_params.p_mu, age, is_disease_A, is_disease_B):
-            l1.set_recovered(l1_layer, random_node)
-        elif random.random() < _get_combined_kappa_probability(l1_params.p_kappa, age, is_disease_A, is_disease_B):
-            l1.set_dead(l1_layer, random_node)
-
-
-def _get_combined_beta_probability(p_beta: float):
-    """
-    S -> I
-    :param p_beta:
-    :param opinion: positive opinion reduce the probability of infection
-    :return: combined infected probability
-    """
-    return p_beta
-
-
-def _get_combined_gamma_probability(p_gamma: float):
-    """
-    I -> Q
-    :param p_gamma:
-    :return:
-    """
-    return p_gamma
-
-
-def _get_combined_mu_probability(p_mu: float, age: int, is_disease_A: bool, is_disease_B: bool):
-    """
-    I -> R, Q -> R
-
-    :param p_mu:
-    :param age:
-    :param opinion:
-    :param is_disease_A:
-    :param is_disease_B:
-    """
-    # TODO: for now the commorbidities are included only in \kappa probability
-    # death_rate = death_rate_ratio(age)
-    # comoribidities_rate = _comorbid_rate(is_disease_A, is_disease_B)
-    return p_mu
-
-
-def _get_combined_kappa_probability(p_kappa, age, is_disease_A: bool, is_disease_B: bool):
-    """
-    I -> D, Q -> D
-
-    :param p_kappa:
-    """
-    comoribidities_rate = _comorbid_rate(is_disease_A, is_disease_B)
-    #death_rate = death_rate_ratio(age)
-    # NOTE: death rate produces very low probability for middle-age people
-    return p_kappa * comoribidities_rate # * death_rate
-
-
-def _comorbid_rate(is_disease_A: bool, is_disease_B: bool):
-    comoribidities_rate = 1.0
-    if is_disease_A and is_disease_B:
-        comoribidities_rate *= 3
-    elif is_disease_A:
-        comoribidities_rate *= 1.5
-    elif is_disease_B:
-        comoribidities_rate *= 2
-    return comoribidities_rate
+        if rng.random() < rates.mu[random_node]:
+            l1.set_recovered(state, random_node)
+        elif rng.random() < rates.kappa[random_node]:
+            l1.set_dead(state, random_node)
@@ -0,0 +1,66 @@
+import numpy as np
+
+from scripts.agent_state import AgentState
+from scripts.parameters import PhysicalLayerParameters
+from scripts.transition_rates import TransitionRates, OPINIONS, comorbid_rate
+
+
+def get_transition_rates(state: AgentState, l1_params: PhysicalLayerParameters) -> TransitionRates:
+    """
+    Probabilities of l1 transitions of all agents in the single layer model
+
+    :param state: AgentState with initialized agents
+    :param l1_params: parameters for l1_layer
+    :return: TransitionRates
+    """
+    ones = np.ones(state.n_agents)
+    return TransitionRates(
+        _get_combined_beta_probability(l1_params.p_beta) * np.ones(len(OPINIONS)),
+        _get_combined_gamma_probability(l1_params.p_gamma) * ones,
+        _get_combined_mu_probability(l1_params.p_mu, state.age, state.comorbid_A, state.comorbid_B) * ones,
+        _get_combined_kappa_probability(l1_params.p_kappa, state.age, state.comorbid_A, state.comorbid_B) * ones)
+
+
+def _get_combined_beta_probability(p_beta: float):
+    """
+    S -> I
+    :param p_beta:
+    :return: combined infected probability
+    """
+    return p_beta
+
+
+def _get_combined_gamma_probability(p_gamma: float):
+    """
+    I -> Q
+    :param p_gamma:
+    :return:
+    """
+    return p_gamma
+
+
+def _get_combined_mu_probability(p_mu: float, age, is_disease_A, is_disease_B):
+    """
+    I -> R, Q -> R
+
+    :param p_mu:
+    :param age:
+    :param is_disease_A:
+    :param is_disease_B:
+    """
+    # TODO: for now the commorbidities are included only in \kappa probability
+    # death_rate = death_rate_ratio(age)
+    # comoribidities_rate = comorbid_rate(is_disease_A, is_disease_B)
+    return p_mu
+
+
+def _get_combined_kappa_probability(p_kappa, age, is_disease_A, is_disease_B):
+    """
+    I -> D, Q -> D
+
+    :param p_kappa:
+    """
+    comoribidities_rate = comorbid_rate(is_disease_A, is_disease_B)
+    # death_rate = death_rate_ratio(age)
+    # NOTE: death rate produces very low probability for middle-age people
+    return p_kappa * comoribidities_rate  # * death_rate
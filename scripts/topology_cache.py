@@ -0,0 +1,115 @@
+import collections
+import os
+
+import numpy as np
+
+from scripts.agent_state import CSRAdjacency
+from scripts.network import create_bilayer_topology
+
+
+def topology_key(agents: int, additional_virtual_links: int, m=3, p=None, seed: int = None) -> str:
+    """
+    Name of the topology generated by `create_bilayer_topology` with given parameters, used as the cache key and
+    the file name on disk
+
+    :return: e.g. 'powerlaw_cluster_N1000_m3_p0.8_links500_seed7'
+    """
+    generator = 'barabasi_albert' if p is None else 'powerlaw_cluster'
+    p_name = '' if p is None else f'_p{p}'
+    return f'{generator}_N{agents}_m{m}{p_name}_links{int(additional_virtual_links)}_seed{seed}'
+
+
+class TopologyCache:
+    """In-memory LRU cache of network topologies (CSR arrays of both layers) backed by compressed `.npz` files
+
+    Topologies are identified by the generator parameters and the seed (see `topology_key`). When a seed is not given,
+    one of `pool_size` seeds is drawn, so only `pool_size` distinct networks are generated for every set of parameters
+    and they are reused across the whole parameter grid. Without `pool_size` every call generates a new network
+    (no caching).
+
+    Returned adjacencies share the cached (read-only) topology arrays, but every call gets its own `active_agents`
+    mask.
+    """
+
+    def __init__(self, pool_size: int = None, directory: str = None, max_size: int = None):
+        """
+        :param pool_size: number of distinct networks for the same generator parameters
+        :param directory: directory with `.npz` files, topologies are kept only in memory when not given
+        :param max_size: maximum number of topologies in memory (default `pool_size` or 8)
+        """
+        self.pool_size = pool_size
+        self.directory = directory
+        self.max_size = max_size if max_size is not None else (pool_size or 8)
+        self._topologies = collections.OrderedDict()
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    def get(self, agents: int, additional_virtual_links: int, m=3, p=None, seed: int = None, random_state=np.random):
+        """
+        The same as `create_bilayer_topology`, but the topology is taken from the cache if it exists
+
+        :param random_state: `np.random` or `np.random.Generator` used to draw a seed from the pool
+        :return: tuple (l1 CSRAdjacency, l2 CSRAdjacency)
+        """
+        if seed is None:
+            if self.pool_size is None:
+                return create_bilayer_topology(agents, additional_virtual_links, m=m, p=p)
+            seed = int(random_state.choice(self.pool_size))
+
+        key = topology_key(agents, additional_virtual_links, m, p, seed)
+        if key in self._topologies:
+            self._topologies.move_to_end(key)
+        else:
+            topology = self._load(key)
+            if topology is None:
+                topology = self._generate(key, agents, additional_virtual_links, m, p, seed)
+            for array in topology:
+                # every simulation with this topology shares the arrays
+                array.flags.writeable = False
+            self._topologies[key] = topology
+            if len(self._topologies) > self.max_size:
+                self._topologies.popitem(last=False)
+        l1_indptr, l1_indices, l2_indptr, l2_indices = self._topologies[key]
+        return CSRAdjacency(l1_indptr, l1_indices), CSRAdjacency(l2_indptr, l2_indices)
+
+    def clear(self):
+        """Remove topologies from memory (files on disk are kept)"""
+        self._topologies.clear()
+
+    def _path(self, key: str):
+        return os.path.join(self.directory, key + '.npz')
+
+    def _load(self, key: str):
+        if self.directory is None or not os.path.exists(self._path(key)):
+            return None
+        with np.load(self._path(key)) as data:
+            return data['l1_indptr'], data['l1_indices'], data['l2_indptr'], data['l2_indices']
+
+    def _generate(self, key: str, agents: int, additional_virtual_links: int, m, p, seed: int):
+        l1, l2 = create_bilayer_topology(agents, additional_virtual_links, m=m, p=p, seed=seed)
+        topology = l1.indptr, l1.indices, l2.indptr, l2.indices
+        if self.directory is not None:
+            # other processes can read the same file, so it is written under a temporary name first
+            tmp_path = f'{self._path(key)}.{os.getpid()}.tmp'
+            with open(tmp_path, 'wb') as f:
+                np.savez_compressed(f, l1_indptr=l1.indptr, l1_indices=l1.indices,
+                                    l2_indptr=l2.indptr, l2_indices=l2.indices)
+            os.replace(tmp_path, self._path(key))
+        return topology
+
+
+_process_caches = {}
+
+
+def get_topology_cache(pool_size: int = None, directory: str = None) -> TopologyCache:
+    """
+    Topology cache shared by all simulations with the same settings in the current process
+
+    :param pool_size: see `TopologyCache`
+    :param directory: see `TopologyCache`
+    :return: TopologyCache
+    """
+    key = (pool_size, directory)
+    if key not in _process_caches:
+        _process_caches[key] = TopologyCache(pool_size, directory)
+    return _process_caches[key]
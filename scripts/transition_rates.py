@@ -0,0 +1,42 @@
+import numpy as np
+
+# Opinions -1, 0 (no virtual layer) and +1 are stored at `opinion + OPINION_OFFSET`
+OPINION_OFFSET = 1
+OPINIONS = np.array([-1, 0, 1])
+
+
+class TransitionRates:
+    """Probabilities of l1 transitions of every agent, computed once per run
+
+    beta: S -> I probability for a single infected neighbour indexed by `opinion + OPINION_OFFSET` (opinions change
+    during the simulation, so it is kept per opinion, see `beta`)
+
+    gamma: I -> Q, mu: I -> R and Q -> R, kappa: I -> D and Q -> D probabilities of every agent
+
+    All simulation backends read transitions only from these arrays.
+    """
+
+    def __init__(self, beta: np.ndarray, gamma: np.ndarray, mu: np.ndarray, kappa: np.ndarray):
+        self.beta_by_opinion = np.asarray(beta, dtype=np.float64)
+        self.gamma = np.asarray(gamma, dtype=np.float64)
+        self.mu = np.asarray(mu, dtype=np.float64)
+        self.kappa = np.asarray(kappa, dtype=np.float64)
+
+    def beta(self, opinion):
+        """
+        :param opinion: opinion of the agent or array of opinions
+        :return: S -> I probability
+        """
+        return self.beta_by_opinion[opinion + OPINION_OFFSET]
+
+
+def comorbid_rate(is_disease_A, is_disease_B):
+    """
+    Multiplier of death probability of agents with comorbid diseases
+
+    :param is_disease_A: bool or array of bools
+    :param is_disease_B: bool or array of bools
+    """
+    is_disease_A = np.asarray(is_disease_A, dtype=bool)
+    is_disease_B = np.asarray(is_disease_B, dtype=bool)
+    return np.select([is_disease_A & is_disease_B, is_disease_A, is_disease_B], [3.0, 1.5, 2.0], 1.0)
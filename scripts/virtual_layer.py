@@ -1,10 +1,13 @@
 import copy
 
 import networkx as nx
+import numpy as np
 import random
 
+from scripts.agent_state import AgentState, Layer
 
-def initialize_virtual(g: nx.Graph, negative_opinion_fraction: float = 0.5):
+
+def initialize_virtual(g: nx.Graph, negative_opinion_fraction: float = 0.5, inplace=False):
     """
     Initialize `l2` layer with `g.number_of_nodes() * aware_fraction` aware agents and the rest unaware.
 
@@ -12,9 +15,10 @@ def initialize_virtual(g: nx.Graph, negative_opinion_fraction: float = 0.5):
 
     :param g: nx.Graph l2 layer
     :param negative_opinion_fraction: a fraction of negative opinions (default 50/50)
+    :param inplace: initialize agents of `g` instead of a copy
     :return g_copy: nx.Graph l2 layer with initialized agents
     """
-    g_copy = copy.deepcopy(g)
+    g_copy = g if inplace else copy.deepcopy(g)
     for node in g_copy.nodes:
         if random.random() < negative_opinion_fraction:
             set_negative_opinion(g_copy, node)
@@ -23,23 +27,44 @@ def initialize_virtual(g: nx.Graph, negative_opinion_fraction: float = 0.5):
     return g_copy
 
 
-def _set_opinion(g: nx.Graph, node, opinion: int):
-    g.nodes[node]['l2_opinion'] = opinion
+def initialize_virtual_state(state: AgentState, negative_opinion_fraction: float = 0.5, random_state=np.random):
+    """
+    The same as `initialize_virtual` but for all agents of `state` at once (in place)
+
+    :param state: AgentState
+    :param negative_opinion_fraction: a fraction of negative opinions (default 50/50)
+    :param random_state: `np.random` or `np.random.Generator`
+    :return: state with initialized agents
+    """
+    negative = random_state.random(state.n_agents) < negative_opinion_fraction
+    state.opinion[:] = np.where(negative, -1, 1)
+    state.recount()
+    return state
+
+
+def _set_opinion(g: Layer, node, opinion: int):
+    if isinstance(g, AgentState):
+        g.counters.change_opinion(g.opinion[node], opinion)
+        g.opinion[node] = opinion
+    else:
+        g.nodes[node]['l2_opinion'] = opinion
 
 
-def set_positive_opinion(g: nx.Graph, node):
+def set_positive_opinion(g: Layer, node):
     _set_opinion(g, node, 1)
 
 
-def set_negative_opinion(g: nx.Graph, node):
+def set_negative_opinion(g: Layer, node):
     _set_opinion(g, node, -1)
 
 
-def get_opinion(g: nx.Graph, node):
+def get_opinion(g: Layer, node):
+    if isinstance(g, AgentState):
+        return g.opinion[node]
     return g.nodes[node]['l2_opinion']
 
 
-def flip_opinion(g: nx.Graph, node):
+def flip_opinion(g: Layer, node):
     opinion = get_opinion(g, node)
     if opinion == 1:
         set_negative_opinion(g, node)
@@ -1,7 +1,12 @@
 import networkx as nx
 import numpy as np
 
+from scripts.agent_state import AgentState, Layer, state_aware
 
-def mean_opinion(g: nx.Graph):
+
+@state_aware
+def mean_opinion(g: Layer):
+    if isinstance(g, AgentState):
+        return g.counters.mean_opinion()
     opinions = nx.get_node_attributes(g, 'l2_opinion').values()
     return np.mean(list(opinions))
@@ -1,22 +1,247 @@
+"""
+Benchmarks of both models
+
+Times network creation, initialization of agents, metric evaluation, runs of every backend on initialized state
+(`run`) and whole simulations (`init_run_simulation`) for every network size and number of steps. Results are
+saved as JSON, so they can be compared between commits and backends:
+
+    python test/measure_time_simulation.py --output benchmark.json
+    python test/measure_time_simulation.py --sizes 100 1000 --steps 10000 --models singlelayer --output quick.json
+    python test/measure_time_simulation.py --compare benchmark.json quick.json
+    python test/measure_time_simulation.py --plot benchmark.json
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
 import numpy as np
-import matplotlib.pyplot as plt
 
-if __name__ == '__main__':
-    N = [100, 1000, 10000]
-    t1 = np.array([977.13, 7633.74, 73122.74])  # N_STEPS = 10000
-    t2 = np.array([1865.90, 15072.08, 144255.00])  # N_STEPS = 20000
-    t1 /= 12  # number of realizations / parameters
-    t2 /= 12
-    t1 /= 60  # in minutes
-    t2 /= 60
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import scripts.epidemic_layer as l1
+from scripts.agent_state import AgentState, CSRAdjacency
+from scripts.epidemic_metrics import *
+from scripts.multilayer import jit
+from scripts.multilayer import simulation as multilayer
+from scripts.network import create_bilayer_topology
+from scripts.parameters import *
+from scripts.random_streams import RandomStreams
+from scripts.singlelayer import simulation as singlelayer
+from scripts.virtual_metrics import mean_opinion
+
+SIZES = (100, 1000, 10000, 100000)
+STEPS = (10000, 20000)
+BACKENDS = {'multilayer': ('python', 'synchronous', 'numba'),
+            'singlelayer': ('python', 'event', 'gillespie')}
+
+L1_PARAMS = PhysicalLayerParameters(0.1, 0.2, 0.9, 0.05, 10)
+L2_VOTER_PARAMS = QVoterParameters(0.5, 4)
+L2_SOCIAL_MEDIA_PARAMS = SocialMediaParameters(0.1, 100)
+METRICS = {'infected_ratio': ('l1_layer', infected_ratio),
+           'dead_ratio': ('l1_layer', dead_ratio),
+           'quarantined_ratio': ('l1_layer', quarantined_ratio),
+           'recovered_ratio': ('l1_layer', recovered_ratio),
+           'susceptible_ratio': ('l1_layer', susceptible_ratio),
+           'mean_opinion': ('l2_layer', mean_opinion)}
+SINGLELAYER_METRICS = {name: metric for name, metric in METRICS.items() if metric[0] == 'l1_layer'}
+METRIC_CALLS = 1000
+
+
+def run_benchmarks(models=tuple(BACKENDS), sizes=SIZES, steps=STEPS, links_per_agent=1, repeat=3, seed=0):
+    """
+    Time all benchmarks
+
+    :param models: 'multilayer' and/or 'singlelayer'
+    :param sizes: numbers of agents
+    :param steps: numbers of simulation steps
+    :param links_per_agent: additional virtual links per agent in the multilayer model
+    :param repeat: number of measurements of every benchmark
+    :param seed: seed of random number streams, every measurement uses the same realisation
+    :return: list of results, e.g. {'model': 'multilayer', 'benchmark': 'run', 'backend': 'python', 'n_agents': 1000,
+             'steps': 10000, 'number': 1, 'times': [...], 'min': ..., 'median': ...}, times in seconds of `number`
+             calls
+    """
+    if 'numba' in BACKENDS['multilayer'] and 'multilayer' in models and jit.is_available():
+        _compile_jit()
+
+    results = []
+    for model in models:
+        metrics = METRICS if model == 'multilayer' else SINGLELAYER_METRICS
+        for n_agents in sizes:
+            links = int(links_per_agent * n_agents) if model == 'multilayer' else 0
+            results.append(_measure(model, 'network', None, n_agents, None, repeat,
+                                    lambda: create_bilayer_topology(n_agents, links, seed=seed)))
+            l1_adjacency, l2_adjacency = create_bilayer_topology(n_agents, links, seed=seed)
+
+            def new_state():
+                l2 = CSRAdjacency(l2_adjacency.indptr, l2_adjacency.indices) if model == 'multilayer' else None
+                state = AgentState(CSRAdjacency(l1_adjacency.indptr, l1_adjacency.indices), l2)
+                return _initialize(model, state, seed)
+
+            results.append(_measure(model, 'initialize', None, n_agents, None, repeat, new_state))
+            state = new_state()
+            results.append(_measure(model, 'metrics', None, n_agents, None, repeat,
+                                    lambda: [[metric(state) for _, metric in metrics.values()]
+                                             for _ in range(METRIC_CALLS)], number=METRIC_CALLS))
+
+            for backend in BACKENDS[model]:
+                if backend == 'numba' and not jit.is_available():
+                    continue
+                for n_steps in steps:
+                    results.append(_measure(model, 'run', backend, n_agents, n_steps, repeat,
+                                            lambda state: _run(model, state, n_steps, metrics, backend, seed),
+                                            setup=new_state))
+                    results.append(_measure(model, 'init_run_simulation', backend, n_agents, n_steps, repeat,
+                                            lambda: _init_run(model, n_agents, links, n_steps, metrics, backend,
+                                                              seed)))
+    return results
+
+
+def save_results(results: list, path: str):
+    """
+    Save results with the description of the environment
+
+    :param results: output of `run_benchmarks`
+    :param path: path of `.json` file
+    """
+    with open(path, 'w') as f:
+        json.dump({'environment': _environment(), 'results': results}, f, indent=2)
+
+
+def load_results(path: str) -> list:
+    with open(path) as f:
+        return json.load(f)['results']
+
+
+def compare(baseline: list, results: list, threshold=1.1):
+    """
+    Print the ratio of median times of the same benchmarks
 
+    :param baseline: results (see `load_results`)
+    :param results: results to compare with `baseline`
+    :param threshold: ratio above which the benchmark is marked as slower
+    """
+    baseline = {_key(result): result for result in baseline}
+    print('{:<12} {:<20} {:<12} {:>8} {:>8} {:>12} {:>12} {:>8}'.format(
+        'model', 'benchmark', 'backend', 'N', 'steps', 'baseline [s]', 'median [s]', 'ratio'))
+    for result in results:
+        if _key(result) not in baseline:
+            continue
+        old = baseline[_key(result)]['median']
+        ratio = result['median'] / old if old > 0 else float('nan')
+        print('{:<12} {:<20} {:<12} {:>8} {:>8} {:>12.4g} {:>12.4g} {:>8.2f}{}'.format(
+            result['model'], result['benchmark'], str(result['backend']), result['n_agents'], str(result['steps']),
+            old, result['median'], ratio, ' slower' if ratio > threshold else ''))
+
+
+def plot(results: list, benchmark='init_run_simulation'):
+    """
+    Median time of `benchmark` as a function of network size for every model, backend and number of steps
+    """
+    import matplotlib.pyplot as plt
+
+    lines = sorted({(r['model'], r['backend'], r['steps']) for r in results if r['benchmark'] == benchmark},
+                   key=str)
+    for model, backend, steps in lines:
+        selected = sorted((r['n_agents'], r['median']) for r in results if r['benchmark'] == benchmark
+                          and (r['model'], r['backend'], r['steps']) == (model, backend, steps))
+        sizes, times = zip(*selected)
+        plt.plot(sizes, times, 'o-', label=f'{model} {backend} N_STEPS={steps}', linewidth=2)
     plt.grid(alpha=0.1)
-    plt.plot(N, t1, 'o-', label='N_STEPS=10000', linewidth=3, color='red')
-    plt.plot(N, t2, 'o-', label='N_STEPS=20000', linewidth=3, color='blue')
-    plt.ylabel('Time [min]')
+    plt.ylabel('Time [s]')
     plt.xlabel('Network size')
     plt.xscale('log')
     plt.yscale('log')
     plt.legend()
     # plt.savefig('measure_time_simulation_results.pdf', bbox_inches='tight')
     plt.show()
+
+
+def _measure(model, benchmark, backend, n_agents, steps, repeat, fun, setup=None, number=1):
+    # `setup` is called before every measurement, its time is not included and its output is passed to `fun`
+    times = []
+    for _ in range(repeat):
+        args = (setup(),) if setup is not None else ()
+        start = time.perf_counter()
+        fun(*args)
+        times.append(time.perf_counter() - start)
+    result = {'model': model, 'benchmark': benchmark, 'backend': backend, 'n_agents': n_agents, 'steps': steps,
+              'number': number, 'times': times, 'min': min(times), 'median': float(np.median(times))}
+    print('{model:<12} {benchmark:<20} {backend!s:<12} N={n_agents:<8} steps={steps!s:<8} '
+          'median={median:.4g} s'.format(**result), flush=True)
+    return result
+
+
+def _initialize(model, state, seed):
+    streams = RandomStreams(seed)
+    if model == 'multilayer':
+        return multilayer.initialize_agents(state, random_state=streams.numpy)
+    l1.initialize_epidemic_state(state, 0.1, 0.1, streams.numpy)
+    return singlelayer.initialize_infected(state, 0.1, streams.numpy)
+
+
+def _run(model, state, steps, metrics, backend, seed):
+    if model == 'multilayer':
+        return multilayer._get_backend(backend)(state, steps, L1_PARAMS, L2_VOTER_PARAMS, L2_SOCIAL_MEDIA_PARAMS,
+                                                metrics, streams=RandomStreams(seed))
+    return singlelayer._get_backend(backend)(state, steps, L1_PARAMS, metrics, streams=RandomStreams(seed))
+
+
+def _init_run(model, n_agents, links, steps, metrics, backend, seed):
+    if model == 'multilayer':
+        return multilayer.init_run_simulation(n_agents, links, steps, L1_PARAMS, L2_VOTER_PARAMS,
+                                              L2_SOCIAL_MEDIA_PARAMS, metrics, backend=backend,
+                                              return_graphs=False, streams=RandomStreams(seed))
+    return singlelayer.init_run_simulation(n_agents, steps, L1_PARAMS, metrics, backend=backend,
+                                           return_graphs=False, streams=RandomStreams(seed))
+
+
+def _compile_jit():
+    state = multilayer.initialize_state(100, 100, streams=RandomStreams(0))
+    jit.run_jit(state, 10, L1_PARAMS, L2_VOTER_PARAMS, L2_SOCIAL_MEDIA_PARAMS, METRICS)
+
+
+def _key(result):
+    return result['model'], result['benchmark'], result['backend'], result['n_agents'], result['steps']
+
+
+def _environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = None
+    return {'date': datetime.datetime.now().isoformat(timespec='seconds'),
+            'commit': commit or None,
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'numba': jit.numba.__version__ if jit.is_available() else None,
+            'platform': platform.platform(),
+            'processor': platform.processor(),
+            'cpus': os.cpu_count()}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmarks of the simulation')
+    parser.add_argument('--models', nargs='+', default=list(BACKENDS), choices=list(BACKENDS))
+    parser.add_argument('--sizes', nargs='+', type=int, default=list(SIZES))
+    parser.add_argument('--steps', nargs='+', type=int, default=list(STEPS))
+    parser.add_argument('--links-per-agent', type=float, default=1)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', default='benchmark.json', help='JSON file with results')
+    parser.add_argument('--compare', nargs=2, metavar=('BASELINE', 'RESULTS'), help='compare two JSON files')
+    parser.add_argument('--plot', metavar='RESULTS', help='plot times of init_run_simulation from JSON file')
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(load_results(args.compare[0]), load_results(args.compare[1]))
+    elif args.plot:
+        plot(load_results(args.plot))
+    else:
+        save_results(run_benchmarks(args.models, args.sizes, args.steps, args.links_per_agent, args.repeat),
+                     args.output)
@@ -0,0 +1,41 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import scripts.age_statistics as age_statistics
+from scripts.agent_state import GENDER_CODES
+
+
+class _FixedDraws:
+    """Random state which returns given values of `random`, one value for every call"""
+
+    def __init__(self, *values):
+        self.values = list(values)
+
+    def random(self, size):
+        return np.full(size, self.values.pop(0))
+
+
+# cumulative sums of the distributions end above and below 1 in floating point arithmetic
+@pytest.mark.parametrize('probabilities', [(0.2, 0.4, 0.3, 0.1), (0.1, 0.25, 0.3, 0.35)])
+def test_ages_at_bounds_of_distribution(monkeypatch, probabilities):
+    ages = np.array([10, 20, 30, 40])
+    monkeypatch.setattr(age_statistics, 'load_age_distribution', lambda: (ages, np.array([probabilities] * 2)))
+    for gender in ('F', 'M'):
+        gender_draw = 0.75 if GENDER_CODES[gender] == 1 else 0.25
+        for u, expected in ((0.0, ages[0]), (1.0 - np.finfo(float).eps, ages[-1])):
+            drawn_ages, genders = age_statistics.generate_ages_and_genders(3, _FixedDraws(gender_draw, u))
+            assert (genders == GENDER_CODES[gender]).all()
+            assert (drawn_ages == expected).all()
+
+
+def test_age_distribution():
+    ages, probabilities = age_statistics.load_age_distribution()
+    drawn_ages, genders = age_statistics.generate_ages_and_genders(200000, np.random.default_rng(0))
+    for code in np.unique(genders):
+        frequencies = np.bincount(np.searchsorted(ages, drawn_ages[genders == code]), minlength=len(ages))
+        assert np.abs(frequencies / frequencies.sum() - probabilities[code]).max() < 0.005
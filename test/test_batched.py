@@ -0,0 +1,37 @@
+import os
+import sys
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from scripts.epidemic_metrics import dead_ratio, infected_ratio
+from scripts.metric_sinks import LastSink, MaxSink
+from scripts.multilayer.batched import init_run_batched
+from scripts.multilayer.simulation import init_run_simulation
+from scripts.parameters import *
+from scripts.random_streams import RandomStreams
+from scripts.virtual_metrics import mean_opinion
+
+L1_PARAMS = PhysicalLayerParameters(0.3, 0.2, 0.9, 0.05, 10)
+L2_VOTER_PARAMS = QVoterParameters(0.3, 4)
+L2_SOCIAL_MEDIA_PARAMS = SocialMediaParameters(0.1, 100)
+METRICS = {'dead_ratio': ('l1_layer', dead_ratio),
+           'infected_ratio': ('l1_layer', infected_ratio),
+           'mean_opinion': ('l2_layer', mean_opinion)}
+SINKS = {'dead_ratio': LastSink, 'infected_ratio': MaxSink, 'mean_opinion': LastSink}
+
+
+def test_batched_replicas_match_synchronous_runs():
+    n_replicas, n_agents, steps = 60, 200, 6000
+    batched, _, seeds = init_run_batched(n_replicas, n_agents, n_agents, steps, L1_PARAMS, L2_VOTER_PARAMS,
+                                         L2_SOCIAL_MEDIA_PARAMS, METRICS, sinks=SINKS, shared_topology=False, seed=0)
+    independent = [init_run_simulation(n_agents, n_agents, steps, L1_PARAMS, L2_VOTER_PARAMS, L2_SOCIAL_MEDIA_PARAMS,
+                                       METRICS, sinks=SINKS, backend='synchronous', return_graphs=False,
+                                       streams=RandomStreams(seed + 1))[0]
+                   for seed in range(n_replicas)]
+    for name in METRICS:
+        values = np.array([result[name] for result in independent])
+        # difference of means within 4 standard errors
+        error = np.sqrt((batched[name].var() + values.var()) / n_replicas)
+        assert abs(batched[name].mean() - values.mean()) < 4 * error + 1e-9, name
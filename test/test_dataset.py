@@ -0,0 +1,25 @@
+import os
+import sys
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from scripts.dataset import realisations_to_frame, save_dataset, load_dataset
+from scripts.result_store import ResultStore
+
+
+def test_load_dataset_skips_result_stores(tmp_path):
+    # `run_parallel` writes `ResultStore` files next to the Parquet files of the sweeps
+    for experiment, q in (('ml3', 3), ('ml4', 4)):
+        realisations = np.array([(q, 0.1, 0, 1, 0.2), (q, 0.2, 0, 2, 0.3)],
+                                dtype=[('q', int), ('p', float), ('run', int), ('seed', int), ('dead_ratio', float)])
+        save_dataset(realisations_to_frame(realisations, {'n_agents': 100}, experiment),
+                     str(tmp_path / f'{experiment}.parquet'))
+        ResultStore(str(tmp_path / f'{experiment}_results.jsonl'), experiment).append((q, 0.1), 0, 1, {})
+    os.makedirs(tmp_path / 'old')
+    save_dataset(realisations_to_frame(realisations[:1], {}, 'old'), str(tmp_path / 'old' / 'old.parquet'))
+
+    df = load_dataset(str(tmp_path))
+    assert sorted(df['experiment']) == ['ml3', 'ml3', 'ml4', 'ml4', 'old']
+    assert len(load_dataset(str(tmp_path), filters=[('q', '==', 3)])) == 2
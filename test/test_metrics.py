@@ -0,0 +1,78 @@
+import os
+import sys
+
+import networkx as nx
+import numpy as np
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from scripts.epidemic_metrics import infected_ratio, dead_ratio
+from scripts.multilayer import simulation as multilayer
+from scripts.multilayer.batched import init_run_batched
+from scripts.parameters import *
+from scripts.random_streams import RandomStreams
+from scripts.singlelayer import simulation as singlelayer
+from scripts.virtual_metrics import mean_opinion
+
+L1_PARAMS = PhysicalLayerParameters(0.3, 0.3, 0.9, 0.05, 10)
+L2_VOTER_PARAMS = QVoterParameters(0.3, 4)
+L2_SOCIAL_MEDIA_PARAMS = SocialMediaParameters(0.1, 100)
+
+
+def graph_infected_ratio(g: nx.Graph):
+    # written against layers of the simulation on graphs
+    return sum(1 for _, status in g.nodes(data='l1_status') if status == 'I') / g.number_of_nodes()
+
+
+def graph_dead_ratio(g: nx.Graph):
+    return np.mean([status == 'D' for _, status in g.nodes(data='l1_status')])
+
+
+def graph_mean_opinion(g: nx.Graph):
+    return np.mean([opinion for _, opinion in g.nodes(data='l2_opinion')])
+
+
+SINGLELAYER_METRICS = {'infected_ratio': ('l1_layer', infected_ratio),
+                       'graph_infected_ratio': ('l1_layer', graph_infected_ratio),
+                       'dead_ratio': ('l1_layer', dead_ratio),
+                       'graph_dead_ratio': ('l1_layer', graph_dead_ratio),
+                       'links': ('l1_layer', nx.number_of_edges)}
+MULTILAYER_METRICS = dict(SINGLELAYER_METRICS,
+                          mean_opinion=('l2_layer', mean_opinion),
+                          graph_mean_opinion=('l2_layer', graph_mean_opinion),
+                          virtual_links=('l2_layer', nx.number_of_edges))
+
+
+def _assert_graph_metrics(out: dict):
+    for name in ('infected_ratio', 'dead_ratio', 'mean_opinion'):
+        if name in out:
+            np.testing.assert_allclose(out['graph_' + name], out[name])
+    assert len(set(np.ravel(out['links']).tolist())) > 1  # links are removed by quarantine
+
+
+@pytest.mark.parametrize('backend', ['python', 'synchronous'])
+def test_graph_metrics_multilayer(backend):
+    out, l1_layer, l2_layer = multilayer.init_run_simulation(200, 200, 4000, L1_PARAMS, L2_VOTER_PARAMS,
+                                                             L2_SOCIAL_MEDIA_PARAMS, MULTILAYER_METRICS,
+                                                             backend=backend, record_every=100,
+                                                             streams=RandomStreams(1))
+    _assert_graph_metrics(out)
+    assert out['links'][-1] == l1_layer.number_of_edges()
+    assert out['virtual_links'][-1] == l2_layer.number_of_edges()
+
+
+def test_graph_metrics_batched():
+    out, replicas, _ = init_run_batched(3, 200, 200, 4000, L1_PARAMS, L2_VOTER_PARAMS, L2_SOCIAL_MEDIA_PARAMS,
+                                        MULTILAYER_METRICS, record_every=100, shared_topology=False, seed=1)
+    _assert_graph_metrics(out)
+    for replica, links in zip(replicas, out['links']):
+        assert links[-1] == replica.l1.n_active_links()
+
+
+@pytest.mark.parametrize('backend', ['python', 'event', 'gillespie'])
+def test_graph_metrics_singlelayer(backend):
+    out, l1_layer = singlelayer.init_run_simulation(200, 4000, L1_PARAMS, SINGLELAYER_METRICS, backend=backend,
+                                                    record_every=100, streams=RandomStreams(1))
+    _assert_graph_metrics(out)
+    assert out['links'][-1] == l1_layer.number_of_edges()
@@ -0,0 +1,17 @@
+import os
+import sys
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from scripts.random_streams import realisation_seed
+
+
+def test_realisation_seed_depends_on_values_of_point():
+    grid = [(3, p) for p in np.linspace(0.1, 0.5, 5)]
+    seeds = {point: realisation_seed(0, point, 1) for point in grid}
+    extended = grid[::-1] + [(4, 0.1)]
+    assert all(realisation_seed(0, point, 1) == seeds[point] for point in grid)
+    assert realisation_seed(0, (3, 0.1), 1) == seeds[grid[0]]
+    assert len({realisation_seed(0, point, run) for point in extended for run in range(3)}) == 3 * len(extended)